@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Compare skip/limit paging with the keyset paging of models/crud.find_page on a large logs collection.
+
+Usage (from services/tutorial-executor/backend, with a local mongod):
+    python benchmarks/bench_crud_pagination.py -u mongodb://localhost:27017/ -n 1000000 -s 20
+
+Seeds `-n` log documents into the `bench` database (skipped when the collection already holds them), creates
+the indexes of models/crud.INDEXES, then walks pages at increasing depths with both methods and reports the
+latency of one page at each depth.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import crud
+
+LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR"]
+
+
+async def seed(collection, count, chunk=10000):
+    existing = await collection.estimated_document_count()
+    if existing >= count:
+        return
+    await collection.drop()
+    start = datetime.utcnow() - timedelta(seconds=count)
+    for offset in range(0, count, chunk):
+        await collection.insert_many([
+            {"timestamp": start + timedelta(seconds=i), "level": random.choice(LEVELS),
+             "message": f"step {i}: ranked 50 candidates", "source": "seeact",
+             "context": {"payload": "x" * 512}}
+            for i in range(offset, min(offset + chunk, count))
+        ], ordered=False)
+        print(f"\rseeded {min(offset + chunk, count)}/{count}", end="", flush=True)
+    print()
+
+
+async def skip_page(collection, skip, size):
+    cursor = collection.find({}, {field: 1 for field in crud.LIST_FIELDS["logs"]}) \
+        .sort([("timestamp", -1), ("_id", -1)]).skip(skip).limit(size)
+    return await cursor.to_list(length=size)
+
+
+async def timed(coro, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await coro()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations) * 1000
+
+
+async def run(args):
+    client = AsyncIOMotorClient(args.mongo_uri)
+    crud.db = client[args.db]
+    collection = crud.db.logs
+    await seed(collection, args.count)
+    await crud.ensure_indexes()
+
+    depths = [d for d in (0, 1000, 10000, 100000, 500000, args.count - args.size) if d <= args.count - args.size]
+    print(f"{'depth':>10}{'skip(ms)':>12}{'keyset(ms)':>12}")
+    for depth in depths:
+        # 取得该深度处的游标：keyset 翻页只需要上一页最后一条记录
+        after = None
+        if depth:
+            anchor = (await skip_page(collection, depth - 1, 1))[0]
+            after = crud.encode_cursor(anchor["timestamp"], anchor["_id"])
+        skip_ms = await timed(lambda: skip_page(collection, depth, args.size), args.repeat)
+        keyset_ms = await timed(lambda: crud.find_page("logs", None, "timestamp", after, args.size), args.repeat)
+        print(f"{depth:>10}{skip_ms:>12.2f}{keyset_ms:>12.2f}")
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-u", "--mongo_uri", type=str, default="mongodb://localhost:27017/")
+    parser.add_argument("-d", "--db", type=str, default="bench")
+    parser.add_argument("-n", "--count", help="Documents in the logs collection.", type=int, default=1000000)
+    parser.add_argument("-s", "--size", help="Page size.", type=int, default=20)
+    parser.add_argument("-r", "--repeat", help="Repetitions per measurement.", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
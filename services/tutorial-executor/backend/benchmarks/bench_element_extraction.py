@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Compare get_interactive_elements_with_playwright with get_interactive_elements_bulk on saved pages.
+
+Usage (from services/tutorial-executor/backend):
+    python benchmarks/bench_element_extraction.py -p saved_pages/ -r 5
+
+Every *.html / *.mhtml file under the given path is loaded into a headless Chromium page, both extraction
+paths are run `--repeat` times and the mean latency, element count and record agreement are reported.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from playwright.async_api import async_playwright
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from demo_utils.browser_helper import get_interactive_elements_with_playwright, get_interactive_elements_bulk
+
+
+def record_key(record):
+    center_point, description, tag_head, box_model, _, real_tag_name = record
+    return (round(center_point[0]), round(center_point[1])), description, tag_head, real_tag_name
+
+
+async def time_extraction(extract, page, repeat):
+    durations = []
+    records = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        records = await extract(page)
+        durations.append(time.perf_counter() - start)
+    return statistics.mean(durations), records
+
+
+async def run(page_paths, repeat, viewport):
+    async with async_playwright() as playwright:
+        browser = await playwright.chromium.launch(headless=True)
+        page = await browser.new_page(viewport=viewport)
+        print(f"{'page':<40}{'elements':>10}{'legacy(s)':>12}{'bulk(s)':>10}{'speedup':>10}{'agreement':>12}")
+        for page_path in page_paths:
+            await page.goto(page_path.resolve().as_uri(), wait_until="load")
+            legacy_time, legacy_records = await time_extraction(get_interactive_elements_with_playwright, page, repeat)
+            bulk_time, bulk_records = await time_extraction(get_interactive_elements_bulk, page, repeat)
+
+            legacy_keys = {record_key(record) for record in legacy_records}
+            bulk_keys = {record_key(record) for record in bulk_records}
+            agreement = len(legacy_keys & bulk_keys) / max(len(legacy_keys | bulk_keys), 1)
+            print(f"{page_path.name[:39]:<40}{len(legacy_records):>10}{legacy_time:>12.3f}{bulk_time:>10.3f}"
+                  f"{legacy_time / max(bulk_time, 1e-9):>10.1f}{agreement:>12.2%}")
+        await browser.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p", "--pages", help="A saved page or a directory of saved pages.", type=str, required=True)
+    parser.add_argument("-r", "--repeat", help="Runs per extraction path and page.", type=int, default=3)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    args = parser.parse_args()
+
+    pages_path = Path(args.pages)
+    if pages_path.is_dir():
+        page_paths = sorted(p for p in pages_path.rglob("*") if p.suffix in (".html", ".htm", ".mhtml"))
+    else:
+        page_paths = [pages_path]
+    asyncio.run(run(page_paths, args.repeat, {"width": args.width, "height": args.height}))
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Measure grounding accuracy against screenshot payload size for different image budgets.
+
+Usage (from services/tutorial-executor/backend):
+    python benchmarks/bench_image_budget.py -d ../online_results -c config/demo_mode.toml \
+        -b 1105:300000 765:150000 425:80000 -n 30
+
+Uses the step screenshots and prompts stored by SeeAct (`image_inputs/*_crop.jpg` with the matching
+`*_prompt.json`, written when `save_screenshots` is on). Every screenshot is first answered with the raw
+screenshot as reference, then once per budget ("max_tokens:max_bytes"); accuracy is the share of answers whose
+element and action match the reference.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import toml
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from demo_utils.format_prompt import postprocess_action_lmm
+from demo_utils.inference_engine import OpenaiEngine
+from utils.image_utils import ImagePreparer
+
+
+def load_samples(result_dir, limit):
+    samples = []
+    for image_path in sorted(Path(result_dir).rglob("image_inputs/*_crop.jpg")):
+        prompt_path = image_path.with_name(image_path.name.replace("_crop.jpg", "_prompt.json"))
+        if prompt_path.exists():
+            samples.append((image_path.read_bytes(), json.loads(prompt_path.read_text(encoding="utf-8"))))
+        if limit and len(samples) >= limit:
+            break
+    return samples
+
+
+async def answer(engine, preparer, screenshot, prompt):
+    prepared = preparer.prepare(screenshot)
+    start = time.perf_counter()
+    output0 = await engine.agenerate(prompt=prompt, image_base64=prepared.images, turn_number=0)
+    output = await engine.agenerate(prompt=prompt, image_base64=prepared.images, turn_number=1, ouput__0=output0)
+    element, action, _ = postprocess_action_lmm(output)
+    return (element.strip(), action.strip()), prepared, time.perf_counter() - start
+
+
+async def run(args):
+    with open(args.config, "r") as f:
+        config = toml.load(f)
+    engine = OpenaiEngine(**config["openai"])
+    samples = load_samples(args.result_dir, args.limit)
+    print(f"{len(samples)} stored step screenshots")
+
+    budgets = [("raw", ImagePreparer())]
+    for budget in args.budgets:
+        max_tokens, max_bytes = (int(value) for value in budget.split(":"))
+        budgets.append((budget, ImagePreparer(max_tokens=max_tokens, max_bytes=max_bytes,
+                                              grayscale=args.grayscale, tile_height=args.tile_height)))
+
+    results = {name: [] for name, _ in budgets}
+    for screenshot, prompt in samples:
+        reference = None
+        for name, preparer in budgets:
+            try:
+                prediction, prepared, llm_time = await answer(engine, preparer, screenshot, prompt)
+            except Exception as e:
+                print(f"{name}: query failed because {e}")
+                continue
+            if name == "raw":
+                reference = prediction
+            results[name].append((prediction == reference, prepared, llm_time))
+
+    print(f"{'budget':<16}{'KB':>10}{'tokens':>9}{'prep(ms)':>10}{'llm(s)':>9}{'accuracy':>10}")
+    for name, rows in results.items():
+        if not rows:
+            continue
+        print(f"{name:<16}"
+              f"{statistics.mean(r[1].prepared_bytes for r in rows) / 1024:>10.1f}"
+              f"{statistics.mean(r[1].tokens for r in rows):>9.0f}"
+              f"{statistics.mean(r[1].elapsed for r in rows) * 1000:>10.1f}"
+              f"{statistics.mean(r[2] for r in rows):>9.2f}"
+              f"{sum(r[0] for r in rows) / len(rows):>10.2%}")
+    await engine.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--result_dir", help="SeeAct save_file_dir holding stored step screenshots.",
+                        type=str, required=True)
+    parser.add_argument("-c", "--config", help="Config file providing the [openai] settings.", type=str,
+                        default="config/demo_mode.toml")
+    parser.add_argument("-b", "--budgets", help="Budgets as max_tokens:max_bytes (0 disables a limit).", nargs="+",
+                        default=["1105:300000", "765:150000", "425:80000"])
+    parser.add_argument("-n", "--limit", help="Maximum number of screenshots.", type=int, default=0)
+    parser.add_argument("--grayscale", action="store_true")
+    parser.add_argument("--tile_height", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
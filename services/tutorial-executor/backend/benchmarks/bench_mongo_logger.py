@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Compare the per-log overhead of the batched MongoDBLogHandler with a handler that does one insert_one per
+record (the previous implementation).
+
+Usage (from services/tutorial-executor/backend, with a local mongod):
+    python benchmarks/bench_mongo_logger.py -u mongodb://localhost:27017/ -n 5000
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+
+from pymongo import MongoClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.mongo_logger import MongoDBLogHandler
+
+
+class InsertOneHandler(logging.Handler):
+    def __init__(self, collection):
+        super().__init__()
+        self.collection = collection
+
+    def emit(self, record):
+        self.collection.insert_one({"log": self.format(record)})
+
+
+def measure(handler, count):
+    logger = logging.getLogger(f"bench.{type(handler).__name__}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    durations = []
+    for i in range(count):
+        start = time.perf_counter()
+        logger.info("step %d: ranked %d candidates for query %s", i, 50, "bench")
+        durations.append(time.perf_counter() - start)
+    drain_start = time.perf_counter()
+    handler.close()
+    drain = time.perf_counter() - drain_start
+    logger.removeHandler(handler)
+    durations.sort()
+    return {
+        "mean_us": statistics.mean(durations) * 1e6,
+        "p99_us": durations[int(len(durations) * 0.99) - 1] * 1e6,
+        "total_s": sum(durations) + drain,
+    }
+
+
+def main(args):
+    client = MongoClient(args.mongo_uri)
+    collection = client[args.db]["bench_logs"]
+    collection.drop()
+
+    results = {
+        "insert_one": measure(InsertOneHandler(collection), args.count),
+        "batched": measure(MongoDBLogHandler(args.db, "bench_logs", mongo_uri=args.mongo_uri), args.count),
+    }
+    print(f"{'handler':<12}{'mean(us)':>12}{'p99(us)':>12}{'total(s)':>12}")
+    for name, result in results.items():
+        print(f"{name:<12}{result['mean_us']:>12.1f}{result['p99_us']:>12.1f}{result['total_s']:>12.2f}")
+    print(f"documents written: {collection.count_documents({})} (expected {2 * args.count})")
+    collection.drop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-u", "--mongo_uri", type=str, default="mongodb://localhost:27017/")
+    parser.add_argument("-d", "--db", type=str, default="bench")
+    parser.add_argument("-n", "--count", help="Log records per handler.", type=int, default=5000)
+    main(parser.parse_args())
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Compare the fp32 CrossEncoder.predict path with RankingEngine on recorded ranking payloads.
+
+Usage (from services/tutorial-executor/backend):
+    python benchmarks/bench_ranker.py -m ../model/deberta-v3-base -i ranking_payloads.jsonl -k 50
+
+Every line of the input file is one recorded `format_ranking_input` payload, i.e. a JSON list of
+[query, element] pairs (a single JSON file holding a list of payloads works as well). For each payload the
+mean latency of both paths and the top-k agreement (overlap of the top-k element sets) are reported.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import torch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from demo_utils.ranking_model import CrossEncoder, RankingEngine, find_topk
+
+
+def load_payloads(path):
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)
+
+
+def time_predict(predict, payload, repeat):
+    durations = []
+    scores = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        scores = predict(payload)
+        durations.append(time.perf_counter() - start)
+    return statistics.mean(durations), scores
+
+
+def main(args):
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    model = CrossEncoder(args.model, device=torch.device("cpu"), num_labels=1, max_length=512)
+    engine = RankingEngine(model, quantization=args.quantization, max_batch_tokens=args.max_batch_tokens)
+
+    def fp32_predict(payload):
+        return model.predict(payload, convert_to_numpy=True, show_progress_bar=False, batch_size=100)
+
+    payloads = load_payloads(args.input)
+    print(f"{'payload':>8}{'pairs':>8}{'fp32(s)':>10}{'engine(s)':>11}{'speedup':>9}{'top-k agree':>13}")
+    agreements, fp32_total, engine_total = [], 0.0, 0.0
+    for i, payload in enumerate(payloads):
+        fp32_time, fp32_scores = time_predict(fp32_predict, payload, args.repeat)
+        engine_time, engine_scores = time_predict(engine.predict, payload, args.repeat)
+        k = min(args.top_k, len(payload))
+        fp32_topk = set(find_topk(fp32_scores, k=k)[1].tolist())
+        engine_topk = set(find_topk(engine_scores, k=k)[1].tolist())
+        agreement = len(fp32_topk & engine_topk) / k
+        agreements.append(agreement)
+        fp32_total += fp32_time
+        engine_total += engine_time
+        print(f"{i:>8}{len(payload):>8}{fp32_time:>10.3f}{engine_time:>11.3f}"
+              f"{fp32_time / max(engine_time, 1e-9):>9.1f}{agreement:>13.2%}")
+    if payloads:
+        print(f"total: fp32 {fp32_total:.3f}s, engine {engine_total:.3f}s, "
+              f"speedup {fp32_total / max(engine_total, 1e-9):.1f}x, "
+              f"mean top-{args.top_k} agreement {statistics.mean(agreements):.2%}, min {min(agreements):.2%}")
+    engine.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-m", "--model", help="Path of the ranking model.", type=str, required=True)
+    parser.add_argument("-i", "--input", help="Recorded format_ranking_input payloads (.json or .jsonl).",
+                        type=str, required=True)
+    parser.add_argument("-k", "--top_k", type=int, default=50)
+    parser.add_argument("-r", "--repeat", help="Runs per path and payload.", type=int, default=3)
+    parser.add_argument("-q", "--quantization", type=str, default="int8", choices=["int8", "none"])
+    parser.add_argument("--max_batch_tokens", type=int, default=16384)
+    parser.add_argument("--threads", type=int, default=0)
+    main(parser.parse_args())
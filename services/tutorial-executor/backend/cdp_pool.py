@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from playwright.async_api import async_playwright, Browser, Playwright
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# 空闲连接超过该秒数后被回收
+CDP_POOL_IDLE_TIMEOUT = float(os.getenv("CDP_POOL_IDLE_TIMEOUT", "300"))
+# 健康检查与空闲回收的间隔秒数
+CDP_POOL_CHECK_INTERVAL = float(os.getenv("CDP_POOL_CHECK_INTERVAL", "30"))
+CDP_CONNECT_TIMEOUT_MS = float(os.getenv("CDP_CONNECT_TIMEOUT_MS", "10000"))
+# 本机演示任务（/start-seeact）使用的调试 Chrome 地址，默认为 Docker Desktop 中宿主机的地址
+CHROME_DEBUG_HOST = os.getenv("CHROME_DEBUG_HOST", "192.168.65.254")
+
+
+def cdp_endpoint(client_ip: str, port: int = 9222) -> str:
+    """CDP endpoint of the debug Chrome started on the user's machine."""
+    return f"ws://{client_ip}:{port}"
+
+
+def default_cdp_endpoint(port: int = 9222) -> str:
+    """CDP endpoint used when a task has no client IP (demo endpoint, queue messages without one)."""
+    return f"http://{CHROME_DEBUG_HOST}:{port}"
+
+
+@dataclass
+class PooledBrowser:
+    browser: Browser
+    endpoint: str
+    in_use: int = 0
+    last_used: float = field(default_factory=time.time)
+    reuses: int = 0
+
+    @property
+    def healthy(self) -> bool:
+        return self.browser.is_connected()
+
+
+class CDPConnectionPool:
+    """
+    Long-lived Playwright driver plus one CDP connection per client endpoint.
+
+    Connections are reused across tutorials, dropped as soon as Chrome disconnects, and closed once
+    they have been idle (no active lease) for longer than `idle_timeout` seconds.
+    """
+
+    def __init__(self, idle_timeout: float = CDP_POOL_IDLE_TIMEOUT, check_interval: float = CDP_POOL_CHECK_INTERVAL,
+                 connect_timeout: float = CDP_CONNECT_TIMEOUT_MS):
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.connect_timeout = connect_timeout
+        self._playwright: Optional[Playwright] = None
+        self._entries: Dict[str, PooledBrowser] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._start_lock = asyncio.Lock()
+        self._evict_task: Optional[asyncio.Task] = None
+        self.connects = 0
+        self.failures = 0
+
+    async def start(self):
+        async with self._start_lock:
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+                self._evict_task = asyncio.create_task(self._evict_loop())
+                logger.info("Playwright 驱动已启动")
+
+    async def stop(self):
+        if self._evict_task:
+            self._evict_task.cancel()
+            await asyncio.gather(self._evict_task, return_exceptions=True)
+            self._evict_task = None
+        for endpoint in list(self._entries):
+            await self._close(endpoint)
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+            logger.info("Playwright 驱动已停止")
+
+    async def acquire(self, endpoint: str, retries: int = 1, retry_delay: float = 1.0) -> Browser:
+        """Return a connected browser for `endpoint`, reusing the pooled connection when it is healthy."""
+        await self.start()
+        lock = self._locks.setdefault(endpoint, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(endpoint)
+            if entry and entry.healthy:
+                entry.reuses += 1
+            else:
+                if entry:
+                    await self._close(endpoint)
+                entry = await self._connect(endpoint, retries, retry_delay)
+            entry.in_use += 1
+            entry.last_used = time.time()
+            return entry.browser
+
+    def release(self, endpoint: str):
+        entry = self._entries.get(endpoint)
+        if entry:
+            entry.in_use = max(0, entry.in_use - 1)
+            entry.last_used = time.time()
+
+    @asynccontextmanager
+    async def lease(self, endpoint: str, retries: int = 1, retry_delay: float = 1.0):
+        browser = await self.acquire(endpoint, retries, retry_delay)
+        try:
+            yield browser
+        finally:
+            self.release(endpoint)
+
+    async def _connect(self, endpoint: str, retries: int, retry_delay: float) -> PooledBrowser:
+        last_error = None
+        for attempt in range(max(1, retries)):
+            try:
+                start_time = time.time()
+                browser = await self._playwright.chromium.connect_over_cdp(endpoint, timeout=self.connect_timeout)
+                self.connects += 1
+                logger.info(f"已连接到 {endpoint}，用时 {time.time() - start_time:.2f} 秒")
+                browser.on("disconnected", lambda _: self._entries.pop(endpoint, None))
+                entry = PooledBrowser(browser=browser, endpoint=endpoint)
+                self._entries[endpoint] = entry
+                return entry
+            except Exception as e:
+                last_error = e
+                self.failures += 1
+                logger.warning(f"连接 {endpoint} 失败 (第 {attempt + 1} 次): {e}")
+                if attempt + 1 < retries:
+                    await asyncio.sleep(retry_delay)
+        raise last_error
+
+    async def _close(self, endpoint: str):
+        entry = self._entries.pop(endpoint, None)
+        if entry and entry.healthy:
+            try:
+                # 对 CDP 连接而言 close 只断开连接，不会关闭用户的 Chrome
+                await entry.browser.close()
+            except Exception as e:
+                logger.warning(f"关闭 {endpoint} 的连接失败: {e}")
+
+    async def _evict_loop(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            now = time.time()
+            for endpoint, entry in list(self._entries.items()):
+                if not entry.healthy:
+                    logger.info(f"{endpoint} 的连接已失效，移出连接池")
+                    self._entries.pop(endpoint, None)
+                elif entry.in_use == 0 and now - entry.last_used > self.idle_timeout:
+                    logger.info(f"{endpoint} 的连接空闲超过 {self.idle_timeout} 秒，回收")
+                    async with self._locks.setdefault(endpoint, asyncio.Lock()):
+                        if entry.in_use == 0:
+                            await self._close(endpoint)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "driver_running": self._playwright is not None,
+            "connects": self.connects,
+            "failures": self.failures,
+            "connections": {
+                endpoint: {"in_use": entry.in_use, "reuses": entry.reuses, "healthy": entry.healthy,
+                           "idle": round(now - entry.last_used, 1)}
+                for endpoint, entry in self._entries.items()
+            },
+        }
+
+
+# 创建全局实例
+cdp_pool = CDPConnectionPool()
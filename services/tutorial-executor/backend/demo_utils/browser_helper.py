@@ -28,6 +28,8 @@ import logging
 from aioconsole import ainput, aprint
 import time
 
+logger = logging.getLogger(__name__)
+
 list_us_cities = [
     ["New York", 40.77, -73.98],
     ["Log Angeles", 34.05, -118.24],
@@ -141,7 +143,7 @@ ignore_args = [
 async def normal_launch_async(playwright: Playwright, trace_dir=None):
     # 不再新启动浏览器，而是连接到现有的Chrome实例
     try:
-        browser = await playwright.chromium.connect_over_cdp("http://192.168.65.254:9222")
+        browser = await playwright.chromium.connect_over_cdp(f"http://{os.getenv('CHROME_DEBUG_HOST', '192.168.65.254')}:9222")
         # logger_.info(f"成功连接到现有的Chrome实例: {browser}")
     except Exception as e:
         # logger_.error(f"通过CDP连接到Chrome失败: {e}")
@@ -354,29 +356,49 @@ def get_first_line(s):
     else:
         return first_line
 
+salient_attributes = [
+    "alt",
+    "aria-describedby",
+    "aria-label",
+    "aria-role",
+    "input-checked",
+    # "input-value",
+    "label",
+    "name",
+    "option_selected",
+    "placeholder",
+    "readonly",
+    "text-value",
+    "title",
+    "value",
+]
+
+none_input_type = ["submit", "reset", "checkbox", "radio", "button", "file"]
+
+tag_name_list = ['a', 'button',
+                 'input',
+                 'select', 'textarea', 'adc-tab']
+
+interactive_elements_selectors = [
+    'a', 'button',
+    'input',
+    'select', 'textarea', 'adc-tab', '[role="button"]', '[role="radio"]', '[role="option"]', '[role="combobox"]',
+    '[role="textbox"]',
+    '[role="listbox"]', '[role="menu"]',
+    '[type="button"]', '[type="radio"]', '[type="combobox"]', '[type="textbox"]', '[type="listbox"]',
+    '[type="menu"]',
+    '[tabindex]:not([tabindex="-1"])', '[contenteditable]:not([contenteditable="false"])',
+    '[onclick]', '[onfocus]', '[onkeydown]', '[onkeypress]', '[onkeyup]', "[checkbox]",
+    '[aria-disabled="false"],[data-link]'
+]
+
+
 async def get_element_description(element, tag_name, role_value, type_value):
     '''
          Asynchronously generates a descriptive text for a web element based on its tag type.
          Handles various HTML elements like 'select', 'input', and 'textarea', extracting attributes and content relevant to accessibility and interaction.
     '''
 
-    salient_attributes = [
-        "alt",
-        "aria-describedby",
-        "aria-label",
-        "aria-role",
-        "input-checked",
-        # "input-value",
-        "label",
-        "name",
-        "option_selected",
-        "placeholder",
-        "readonly",
-        "text-value",
-        "title",
-        "value",
-    ]
-
     parent_value = "parent_node: "
     parent_locator = element.locator('xpath=..')
     num_parents = await parent_locator.count()
@@ -415,8 +437,6 @@ async def get_element_description(element, tag_name, role_value, type_value):
 
     input_value = ""
 
-    none_input_type = ["submit", "reset", "checkbox", "radio", "button", "file"]
-
     if tag_name == "input" or tag_name == "textarea":
         if role_value not in none_input_type and type_value not in none_input_type:
             text1 = "input value="
@@ -466,10 +486,6 @@ async def get_element_description(element, tag_name, role_value, type_value):
 
 
 async def get_element_data(element, tag_name):
-    tag_name_list = ['a', 'button',
-                     'input',
-                     'select', 'textarea', 'adc-tab']
-
     # await aprint(element,tag_name)
     if await element.is_hidden(timeout=0) or await element.is_disabled(timeout=0):
         return None
@@ -510,19 +526,6 @@ async def get_element_data(element, tag_name):
 
 
 async def get_interactive_elements_with_playwright(page):
-    interactive_elements_selectors = [
-        'a', 'button',
-        'input',
-        'select', 'textarea', 'adc-tab', '[role="button"]', '[role="radio"]', '[role="option"]', '[role="combobox"]',
-        '[role="textbox"]',
-        '[role="listbox"]', '[role="menu"]',
-        '[type="button"]', '[type="radio"]', '[type="combobox"]', '[type="textbox"]', '[type="listbox"]',
-        '[type="menu"]',
-        '[tabindex]:not([tabindex="-1"])', '[contenteditable]:not([contenteditable="false"])',
-        '[onclick]', '[onfocus]', '[onkeydown]', '[onkeypress]', '[onkeyup]', "[checkbox]",
-        '[aria-disabled="false"],[data-link]'
-    ]
-
     tasks = []
 
     seen_elements = set()
@@ -550,6 +553,311 @@ async def get_interactive_elements_with_playwright(page):
     return interactive_elements
 
 
+bulk_extraction_script = """
+({selectors, salientAttributes}) => {
+    // Fresh tag per extraction: elements are located by this attribute, not by their querySelectorAll index,
+    // which does not match Playwright's shadow-piercing locator(selector).nth(index)
+    const run = window.__seeactExtraction = (window.__seeactExtraction || 0) + 1;
+    const ids = new Map();
+    const elements = [];
+    const matches = [];
+    const pickAttributes = (node) => {
+        const attributes = {};
+        for (const attr of salientAttributes) {
+            const value = node.getAttribute(attr);
+            if (value) attributes[attr] = value;
+        }
+        return attributes;
+    };
+    const collect = (element) => {
+        if (ids.has(element)) return ids.get(element);
+        let id = -1;
+        const rect = element.getBoundingClientRect();
+        const visible = rect.width > 0 && rect.height > 0 && window.getComputedStyle(element).visibility !== 'hidden';
+        const disabled = element.matches(':disabled') || element.closest('[aria-disabled="true"]') !== null;
+        if (visible && !disabled) {
+            const tag = element.tagName.toLowerCase();
+            const parent = element.parentElement;
+            const textContent = element.textContent || '';
+            const child = element.firstElementChild;
+            const raw = {
+                real_tag_name: tag,
+                role: element.getAttribute('role'),
+                type: element.getAttribute('type'),
+                parent_text: parent ? (parent.innerText || '') : '',
+                text_content: textContent,
+                inner_text: (tag === 'select' || textContent.trim().length > 80) ? (element.innerText || '') : '',
+                input_value: (tag === 'input' || tag === 'textarea') ? (element.value || '') : '',
+                selected_text: null,
+                options: [],
+                attributes: pickAttributes(element),
+                child_attributes: child ? pickAttributes(child) : null,
+                box: {x: rect.x, y: rect.y, width: rect.width, height: rect.height},
+            };
+            if (tag === 'select' && element.selectedIndex >= 0) {
+                raw.selected_text = element.options[element.selectedIndex].textContent;
+                raw.options = Array.from(element.options).map(option => option.text);
+            }
+            id = elements.length;
+            raw.seeact_id = `${run}-${id}`;
+            element.setAttribute('data-seeact-id', raw.seeact_id);
+            elements.push(raw);
+        }
+        ids.set(element, id);
+        return id;
+    };
+    // document.querySelectorAll does not descend into shadow DOM; query the document and every open shadow root,
+    // like Playwright's CSS engine does
+    const roots = [document];
+    for (let i = 0; i < roots.length; i++) {
+        roots[i].querySelectorAll('*').forEach(node => {
+            if (node.shadowRoot) roots.push(node.shadowRoot);
+        });
+    }
+    selectors.forEach((selector, selectorIndex) => {
+        let index = 0;
+        roots.forEach(root => {
+            root.querySelectorAll(selector).forEach(element => {
+                const id = collect(element);
+                if (id >= 0) matches.push([selectorIndex, index, id]);
+                index++;
+            });
+        });
+    });
+    return {elements, matches};
+}
+"""
+
+
+def compose_element_description(raw, tag_name, role_value, type_value):
+    '''
+         Synchronous counterpart of get_element_description working on the raw fields collected by
+         bulk_extraction_script, so both extraction paths produce identical descriptions.
+    '''
+    parent_value = "parent_node: "
+    parent_text = (raw["parent_text"] or "").strip()
+    if parent_text:
+        parent_value += parent_text
+    parent_value = remove_extra_eol(get_first_line(parent_value)).strip()
+    if parent_value == "parent_node:":
+        parent_value = ""
+    else:
+        parent_value += " "
+
+    if tag_name == "select":
+        text2 = raw["selected_text"]
+        if text2:
+            text4 = " | ".join(raw["options"])
+            if not text4:
+                text4 = raw["text_content"] or raw["inner_text"]
+            return parent_value + "Selected Options: " + remove_extra_eol(text2.strip()) + " - Options: " + text4
+
+    input_value = ""
+    if tag_name == "input" or tag_name == "textarea":
+        if role_value not in none_input_type and type_value not in none_input_type:
+            if raw["input_value"]:
+                input_value = "input value=" + "\"" + raw["input_value"] + "\"" + " "
+
+    text = (raw["text_content"] or '').strip()
+    if text:
+        text = remove_extra_eol(text)
+        if len(text) > 80:
+            text_in = (raw["inner_text"] or '').strip()
+            if text_in:
+                return input_value + remove_extra_eol(text_in)
+        else:
+            return input_value + text
+
+    text1 = ""
+    for attr in salient_attributes:
+        attribute_value = raw["attributes"].get(attr)
+        if attribute_value:
+            text1 += f"{attr}=" + "\"" + attribute_value.strip() + "\"" + " "
+
+    text = (parent_value + text1).strip()
+    if text:
+        return input_value + remove_extra_eol(text.strip())
+
+    if raw["child_attributes"] is not None:
+        for attr in salient_attributes:
+            attribute_value = raw["child_attributes"].get(attr)
+            if attribute_value:
+                text1 += f"{attr}=" + "\"" + attribute_value.strip() + "\"" + " "
+
+        text = (parent_value + text1).strip()
+        if text:
+            return input_value + remove_extra_eol(text.strip())
+
+    return None
+
+
+async def get_interactive_elements_bulk(page):
+    '''
+         Single round-trip variant of get_interactive_elements_with_playwright.
+         One injected script collects tag, role, type, text, parent/child fallbacks, visibility, disabled state and
+         bounding box of every matching element, including elements inside open shadow roots; the records have the
+         same layout as get_element_data. The script tags each element with a `data-seeact-id` attribute and the selector is a locator on that attribute, so it
+         resolves to the same element even on pages with shadow roots.
+    '''
+    payload = await page.evaluate(bulk_extraction_script, {"selectors": interactive_elements_selectors,
+                                                           "salientAttributes": salient_attributes})
+    raw_elements = payload["elements"]
+
+    seen_elements = set()
+    interactive_elements = []
+    for selector_index, index, element_id in payload["matches"]:
+        selector = interactive_elements_selectors[selector_index]
+        raw = raw_elements[element_id]
+        tag_name = selector.replace(":not([tabindex=\"-1\"])", "")
+        tag_name = tag_name.replace(":not([contenteditable=\"false\"])", "")
+
+        real_tag_name = raw["real_tag_name"]
+        if tag_name in tag_name_list:
+            tag_head = tag_name
+            real_tag_name = tag_name
+        elif real_tag_name in tag_name_list:
+            # already detected
+            continue
+        else:
+            tag_head = real_tag_name
+
+        role_value = raw["role"]
+        type_value = raw["type"]
+        description = compose_element_description(raw, real_tag_name, role_value, type_value)
+        if not description:
+            continue
+
+        rect = raw["box"]
+        box_model = [rect['x'], rect['y'], rect['x'] + rect['width'], rect['y'] + rect['height']]
+        center_point = ((box_model[0] + box_model[2]) / 2, (box_model[1] + box_model[3]) / 2)
+        if center_point in seen_elements:
+            continue
+        seen_elements.add(center_point)
+
+        if role_value:
+            tag_head += " role=" + "\"" + role_value + "\""
+        if type_value:
+            tag_head += " type=" + "\"" + type_value + "\""
+
+        interactive_elements.append([center_point, description, tag_head, box_model,
+                                     page.locator(f'[data-seeact-id="{raw["seeact_id"]}"]').first, real_tag_name])
+    return interactive_elements
+
+
+page_settle_script = """
+(reset) => {
+    let state = window.__seeactSettle;
+    if (!state) {
+        state = window.__seeactSettle = {lastChange: performance.now()};
+        const touch = () => { state.lastChange = performance.now(); };
+        new MutationObserver(touch).observe(document, {subtree: true, childList: true, characterData: true});
+        try {
+            new PerformanceObserver(list => {
+                if (list.getEntries().some(entry => !entry.hadRecentInput)) touch();
+            }).observe({type: 'layout-shift'});
+        } catch (e) {}
+    }
+    if (reset) state.lastChange = performance.now();
+    return {quietMs: performance.now() - state.lastChange, readyState: document.readyState};
+}
+"""
+
+
+class PageSettleDetector:
+    '''
+         Decides when a page is stable after an action: no DOM mutations or layout shifts for `quiet_ms` (observed
+         by an injected MutationObserver / PerformanceObserver) and no in-flight requests for `network_idle_ms`
+         (tracked from CDP Network events). Requests open for longer than `long_request_ms` (long polling,
+         streaming) are ignored. Quiet periods are only counted from the start of each wait, so activity
+         triggered by the action that preceded it is not missed. One detector is kept per page, see
+         wait_for_page_settle.
+    '''
+
+    ignored_resource_types = ("WebSocket", "EventSource", "Ping")
+
+    def __init__(self, page):
+        self.page = page
+        self.inflight = {}
+        self.last_network_activity = time.monotonic()
+        self.cdp_session = None
+        self._attached = False
+
+    async def attach(self):
+        if self._attached:
+            return
+        self._attached = True
+        try:
+            self.cdp_session = await self.page.context.new_cdp_session(self.page)
+            self.cdp_session.on("Network.requestWillBeSent", self._on_request)
+            self.cdp_session.on("Network.loadingFinished", self._on_request_done)
+            self.cdp_session.on("Network.loadingFailed", self._on_request_done)
+            await self.cdp_session.send("Network.enable")
+            self.page.once("close", self._on_page_close)
+        except Exception as e:
+            # 非 Chromium 或 CDP 不可用时只依据 DOM 判断
+            logger.info(f"Network tracking unavailable for settle detection: {e}")
+            self.cdp_session = None
+
+    async def _on_page_close(self, page):
+        cdp_session, self.cdp_session = self.cdp_session, None
+        if cdp_session is not None:
+            try:
+                await cdp_session.detach()
+            except Exception:
+                pass  # 页面关闭时会话可能已失效
+
+    def _on_request(self, event):
+        if event.get("type") in self.ignored_resource_types:
+            return
+        self.inflight[event["requestId"]] = time.monotonic()
+        self.last_network_activity = time.monotonic()
+
+    def _on_request_done(self, event):
+        if self.inflight.pop(event["requestId"], None) is not None:
+            self.last_network_activity = time.monotonic()
+
+    def network_idle(self, network_idle_ms, long_request_ms):
+        now = time.monotonic()
+        if any(now - started < long_request_ms / 1000 for started in self.inflight.values()):
+            return False
+        return now - self.last_network_activity >= network_idle_ms / 1000
+
+    async def wait(self, quiet_ms=300, network_idle_ms=250, timeout_ms=5000, long_request_ms=3000,
+                   poll_interval_ms=50):
+        '''
+             Return True as soon as the page is stable, or False once `timeout_ms` is reached.
+        '''
+        deadline = time.monotonic() + timeout_ms / 1000
+        await self.attach()
+        # 从本次等待开始重新计算静默时间：动作刚执行完时，它触发的导航或请求可能还没开始
+        self.last_network_activity = max(self.last_network_activity, time.monotonic())
+        reset = True
+        while True:
+            try:
+                # 导航过程中执行上下文会被销毁，视为尚未稳定
+                dom = await self.page.evaluate(page_settle_script, reset)
+                reset = False
+                dom_settled = dom["readyState"] != "loading" and dom["quietMs"] >= quiet_ms
+            except Exception:
+                dom_settled = False
+            if dom_settled and self.network_idle(network_idle_ms, long_request_ms):
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(poll_interval_ms / 1000)
+
+
+async def wait_for_page_settle(page, quiet_ms=300, timeout_ms=5000, **kwargs):
+    '''
+         Wait until `page` is stable (see PageSettleDetector), at most `timeout_ms`. Returns whether it settled.
+    '''
+    detector = getattr(page, "_seeact_settle_detector", None)
+    if detector is None:
+        # 挂在页面对象上，随页面一起回收
+        detector = page._seeact_settle_detector = PageSettleDetector(page)
+    return await detector.wait(quiet_ms=quiet_ms, timeout_ms=timeout_ms, **kwargs)
+
+
 async def select_option(selector, value):
     best_option = [-1, "", -1]
     for i in range(await selector.locator("option").count()):
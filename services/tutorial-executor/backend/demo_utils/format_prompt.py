@@ -160,6 +160,11 @@ def format_ranking_input(elements, task, previous_actions):
     return model_input
 
 
+def ranking_cache_keys(elements, ranking_input):
+    """(query, element text, tag) of each pair built by format_ranking_input, used as ranking cache keys."""
+    return [(pair[0], element[1], element[-1]) for element, pair in zip(elements, ranking_input)]
+
+
 def format_choices(elements, candidate_ids, objective, taken_actions):
     prompt_template = llm_prompt
 
@@ -14,12 +14,15 @@
 # limitations under the License.
 
 # demo_utils/interface_engine.py
+import asyncio
 import logging
 import os
 import time
 
 import backoff
+import httpx
 import openai
+from openai import AsyncOpenAI
 from openai import OpenAIError
 
 from openai import (
@@ -63,6 +66,8 @@ class OpenaiEngine(Engine):
             rate_limit=-1,
             model=None,
             temperature=0,
+            max_connections=20,
+            request_timeout=60.0,
             **kwargs,
     ) -> None:
         """Init an OpenAI GPT/Codex engine
@@ -72,6 +77,8 @@ class OpenaiEngine(Engine):
             stop (list, optional): Tokens indicate stop of sequence. Defaults to ["\n"].
             rate_limit (int, optional): Max number of requests per minute. Defaults to -1.
             model (_type_, optional): Model family. Defaults to None.
+            max_connections (int, optional): Size of the keep-alive pool used by agenerate. Defaults to 20.
+            request_timeout (float, optional): Read timeout in seconds for agenerate. Defaults to 60.
         """
         # 在初始化时就移除 proxies 参数
         if "proxies" in kwargs:
@@ -97,6 +104,9 @@ class OpenaiEngine(Engine):
         self.next_avil_time = [0] * len(self.api_keys)
         self.current_key_idx = 0
         self.base_url = base_url
+        self.max_connections = max_connections
+        self.request_timeout = request_timeout
+        self._async_client = None
         logger.info(f"kwargs in OpenaiEngine init: {kwargs}")
         Engine.__init__(self, **kwargs)
 
@@ -104,80 +114,139 @@ class OpenaiEngine(Engine):
         with open(self, image_path, "rb") as image_file:
             return base64.b64encode(image_file.read()).decode('utf-8')
 
+    def build_messages(self, prompt: list, image_path=None, ouput__0=None, turn_number=0, image_base64=None):
+        """
+        Build the turn-0 (action generation) or turn-1 (grounding) chat messages. The screenshot is taken from
+        `image_base64` when given (a list of base64 images for a tiled screenshot), otherwise read from `image_path`.
+        """
+        prompt0 = prompt[0]
+        prompt1 = prompt[1]
+        prompt2 = prompt[2]
+        if image_base64 is None:
+            image_base64 = encode_image(image_path)
+        base64_images = image_base64 if isinstance(image_base64, list) else [image_base64]
+        messages = [
+            {"role": "system", "content": [{"type": "text", "text": prompt0}]},
+            {"role": "user",
+             "content": [{"type": "text", "text": prompt1}] + [
+                 {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}",
+                                                     "detail": "high"}}
+                 for base64_image in base64_images]},
+        ]
+        if turn_number == 1:
+            messages += [
+                {"role": "assistant", "content": [{"type": "text", "text": f"\n\n{ouput__0}"}]},
+                {"role": "user", "content": [{"type": "text", "text": prompt2}]}, ]
+        return messages
+
+    def _next_key(self):
+        """
+        Rotate to the next API key and return (key index, seconds to wait before it may be used). Callers must use
+        the returned index: concurrent sessions share the engine and rotate current_key_idx meanwhile.
+        """
+        key_idx = self.current_key_idx = (self.current_key_idx + 1) % len(self.api_keys)
+        logger.info(f"Using API key index: {key_idx}")
+        start_time = time.time()
+        wait_time = 0
+        if (
+                self.request_interval > 0
+                and start_time < self.next_avil_time[key_idx]
+        ):
+            wait_time = self.next_avil_time[key_idx] - start_time
+        if self.request_interval > 0:
+            self.next_avil_time[key_idx] = (
+                    max(start_time, self.next_avil_time[key_idx])
+                    + self.request_interval
+            )
+        return key_idx, wait_time
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """Lazily created AsyncOpenAI client on a pooled keep-alive HTTP connection."""
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(
+                api_key=self.api_keys[0],
+                base_url=self.base_url,
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=self.max_connections,
+                                        max_keepalive_connections=self.max_connections),
+                    timeout=httpx.Timeout(self.request_timeout, connect=10.0),
+                ),
+            )
+        return self._async_client
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+
     @backoff.on_exception(
         backoff.expo,
         (APIError, RateLimitError, APIConnectionError, OpenAIError, BadRequestError),
     )
     def generate(self, prompt: list = None, max_new_tokens=4096, temperature=None, model=None, image_path=None,
-                 ouput__0=None, turn_number=0, **kwargs):
+                 ouput__0=None, turn_number=0, image_base64=None, **kwargs):
         logger.info("进入generate方法")
         # 确保移除 proxies 参数，因为新版本的 OpenAI client 不支持这个参数
         if "proxies" in kwargs:
             logger.info("移除 proxies 参数")
             del kwargs["proxies"]
-        
-        logger.info("hello")
+
         logger.info(f"Filtered kwargs: {kwargs}")
-        self.current_key_idx = (self.current_key_idx + 1) % len(self.api_keys)
-        logger.info(f"Using API key index: {self.current_key_idx}")
-        start_time = time.time()
-        if (
-                self.request_interval > 0
-                and start_time < self.next_avil_time[self.current_key_idx]
-        ):
-            time.sleep(self.next_avil_time[self.current_key_idx] - start_time)
-        openai.api_key = self.api_keys[self.current_key_idx]
+        key_idx, wait_time = self._next_key()
+        if wait_time > 0:
+            time.sleep(wait_time)
+        openai.api_key = self.api_keys[key_idx]
         openai.base_url = self.base_url
-        prompt0 = prompt[0]
-        prompt1 = prompt[1]
-        prompt2 = prompt[2]
+        if turn_number not in (0, 1):
+            return None
 
-        if turn_number == 0:
-            base64_image = encode_image(image_path)
-            # Assume one turn dialogue
-            prompt1_input = [
-                {"role": "system", "content": [{"type": "text", "text": prompt0}]},
-                {"role": "user",
-                 "content": [{"type": "text", "text": prompt1}, {"type": "image_url", "image_url": {"url":
-                                                                                                        f"data:image/jpeg;base64,{base64_image}",
-                                                                                                    "detail": "high"},
-                                                                 }]},
-            ]
-            start_api_call = time.time()
-            response1 = openai.chat.completions.create(
-                model=model if model else self.model,
-                messages=prompt1_input,
-                max_tokens=max_new_tokens if max_new_tokens else 4096,
-                temperature=temperature if temperature else self.temperature,
-                **kwargs,
-            )
-            api_call_time = time.time() - start_api_call
-            logger.info(f"大模型 API 调用用时: {api_call_time:.2f} 秒")
-            # print(response1.choices)
-            answer1 = [choice.message.content for choice in response1.choices][0]
-
-            return answer1
-        elif turn_number == 1:
-            base64_image = encode_image(image_path)
-            prompt2_input = [
-                {"role": "system", "content": [{"type": "text", "text": prompt0}]},
-                {"role": "user",
-                 "content": [{"type": "text", "text": prompt1}, {"type": "image_url", "image_url": {"url":
-                                                                                                        f"data:image/jpeg;base64,{base64_image}",
-                                                                                                    "detail": "high"}, }]},
-                {"role": "assistant", "content": [{"type": "text", "text": f"\n\n{ouput__0}"}]},
-                {"role": "user", "content": [{"type": "text", "text": prompt2}]}, ]
-            start_api_call = time.time()
-            response2 = openai.chat.completions.create(
-                model=model if model else self.model,
-                messages=prompt2_input,
-                max_tokens=max_new_tokens if max_new_tokens else 4096,
-                temperature=temperature if temperature else self.temperature,
-                **kwargs,
-            )
-            logger.info(f"API response time: {time.time() - start_api_call} seconds")
-            return [choice.message.content for choice in response2.choices][0]
-    logger.info("Retrying API call due to exception...")
+        messages = self.build_messages(prompt, image_path=image_path, ouput__0=ouput__0, turn_number=turn_number,
+                                       image_base64=image_base64)
+        start_api_call = time.time()
+        response = openai.chat.completions.create(
+            model=model if model else self.model,
+            messages=messages,
+            max_tokens=max_new_tokens if max_new_tokens else 4096,
+            temperature=temperature if temperature else self.temperature,
+            **kwargs,
+        )
+        logger.info(f"大模型 API 调用用时: {time.time() - start_api_call:.2f} 秒")
+        return [choice.message.content for choice in response.choices][0]
+
+    @backoff.on_exception(
+        backoff.expo,
+        (APIError, RateLimitError, APIConnectionError, OpenAIError, BadRequestError),
+    )
+    async def agenerate(self, prompt: list = None, max_new_tokens=4096, temperature=None, model=None,
+                        image_path=None, ouput__0=None, turn_number=0, image_base64=None, **kwargs):
+        """Non-blocking counterpart of generate, safe to await from the FastAPI event loop."""
+        if "proxies" in kwargs:
+            del kwargs["proxies"]
+
+        key_idx, wait_time = self._next_key()
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+        if turn_number not in (0, 1):
+            return None
+
+        if image_base64 is not None:
+            messages = self.build_messages(prompt, ouput__0=ouput__0, turn_number=turn_number,
+                                           image_base64=image_base64)
+        else:
+            # 图片读取与 base64 编码放到线程池，避免阻塞事件循环
+            messages = await asyncio.to_thread(self.build_messages, prompt, image_path, ouput__0, turn_number)
+        client = self.async_client.with_options(api_key=self.api_keys[key_idx])
+        start_api_call = time.time()
+        response = await client.chat.completions.create(
+            model=model if model else self.model,
+            messages=messages,
+            max_tokens=max_new_tokens if max_new_tokens else 4096,
+            temperature=temperature if temperature else self.temperature,
+            **kwargs,
+        )
+        logger.info(f"大模型 API 调用用时: {time.time() - start_api_call:.2f} 秒")
+        return [choice.message.content for choice in response.choices][0]
 
 
 class OpenaiEngine_MindAct(Engine):
@@ -14,8 +14,12 @@
 # limitations under the License.
 
 # demo_utils/ranking_model.py
+import asyncio
 import logging
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Callable, Dict, Type
 
 import torch
@@ -227,3 +231,173 @@ class CrossEncoder(CrossEncoder):
                 self._eval_during_training(
                     evaluator, output_path, save_best_model, epoch, -1, callback
                 )
+
+
+class RankingCache:
+    """
+    LRU cache of ranker scores keyed on (model, query hash, element text hash, tag).
+
+    Between consecutive steps most elements are unchanged and the query only changes through the last three
+    previous actions, so most pairs can skip the model. The element id inside the ranking input is not part of
+    the key, as it only reflects the element's position in the page.
+    """
+
+    def __init__(self, max_size: int = 20000):
+        self.max_size = max_size
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(namespace, query: str, element_text: str, tag: str):
+        return namespace, hash(query), hash(element_text), tag
+
+    def get(self, key):
+        with self._lock:
+            score = self._scores.get(key)
+            if score is None:
+                self.misses += 1
+                return None
+            self._scores.move_to_end(key)
+            self.hits += 1
+            return score
+
+    def put(self, key, score):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._scores[key] = score
+            self._scores.move_to_end(key)
+            while len(self._scores) > self.max_size:
+                self._scores.popitem(last=False)
+
+    def metrics(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._scores),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+        }
+
+
+# 进程内共享的排序缓存，不同模型通过 namespace 区分
+ranking_cache = RankingCache(int(os.getenv("RANKING_CACHE_SIZE", "20000")))
+
+
+class RankingEngine:
+    """
+    CPU inference wrapper around CrossEncoder for per-step element ranking.
+
+    - quantization="int8" applies dynamic int8 quantization to the Linear layers of a CPU copy of the model
+      (the wrapped fp32 model is left untouched).
+    - Pairs are sorted by token length and grouped so each batch holds at most `max_batch_tokens` padded
+      tokens; short element strings are only padded to the longest pair of their own bucket instead of 512.
+    - `apredict` / `arank` run inference on a dedicated thread pool so ranking does not block the event loop.
+    - When `arank` gets cache keys (see format_prompt.ranking_cache_keys), cached scores are reused and only
+      new pairs are scored by the model.
+    """
+
+    def __init__(self, cross_encoder: CrossEncoder, quantization: str = "int8", max_batch_tokens: int = 16384,
+                 max_batch_size: int = 100, num_threads: int = 0, max_workers: int = 1, use_cache: bool = True):
+        self.cross_encoder = cross_encoder
+        self.tokenizer = cross_encoder.tokenizer
+        self.max_length = cross_encoder.max_length or 512
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.activation_fct = getattr(cross_encoder, "default_activation_function", None) or nn.Identity()
+        self.num_labels = cross_encoder.config.num_labels
+        if num_threads > 0:
+            torch.set_num_threads(num_threads)
+
+        model = cross_encoder.model
+        self.device = next(model.parameters()).device
+        if quantization == "int8":
+            if self.device.type != "cpu":
+                logger.warning("int8 dynamic quantization only runs on CPU, falling back to the fp32 model")
+            else:
+                model = torch.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=False)
+        elif quantization not in (None, "", "none"):
+            raise ValueError(f"Unsupported ranker quantization: {quantization}")
+        self.model = model.eval()
+        self.cache = ranking_cache if use_cache else None
+        self.cache_namespace = (getattr(cross_encoder.config, "_name_or_path", ""), quantization)
+        self.max_workers = max_workers
+        self._executor = None
+
+    def _buckets(self, pairs):
+        lengths = [len(ids) for ids in self.tokenizer([p[0] for p in pairs], [p[1] for p in pairs],
+                                                      truncation="longest_first", max_length=self.max_length,
+                                                      add_special_tokens=True)["input_ids"]]
+        order = sorted(range(len(pairs)), key=lambda i: lengths[i])
+        batch = []
+        for i in order:
+            # 按长度升序排列，当前样本即为批内最长样本
+            if batch and (len(batch) >= self.max_batch_size or (len(batch) + 1) * lengths[i] > self.max_batch_tokens):
+                yield batch
+                batch = []
+            batch.append(i)
+        if batch:
+            yield batch
+
+    def predict(self, pairs) -> np.ndarray:
+        """Score [query, element] pairs; returns scores in input order, matching CrossEncoder.predict."""
+        scores = np.zeros(len(pairs), dtype=np.float32) if self.num_labels == 1 \
+            else np.zeros((len(pairs), self.num_labels), dtype=np.float32)
+        if not pairs:
+            return scores
+        with torch.inference_mode():
+            for batch in self._buckets(pairs):
+                features = self.tokenizer([pairs[i][0] for i in batch], [pairs[i][1] for i in batch],
+                                          padding=True, truncation="longest_first", max_length=self.max_length,
+                                          return_tensors="pt").to(self.device)
+                logits = self.activation_fct(self.model(**features, return_dict=True).logits)
+                logits = logits.float().cpu().numpy()
+                scores[batch] = logits[:, 0] if self.num_labels == 1 else logits
+        return scores
+
+    def predict_cached(self, pairs, cache_keys) -> np.ndarray:
+        """Like predict, but reuses cached scores; `cache_keys` holds one (query, element text, tag) per pair."""
+        keys = [RankingCache.key(self.cache_namespace, *cache_key) for cache_key in cache_keys]
+        scores = np.zeros(len(pairs), dtype=np.float32)
+        missing = []
+        for i, key in enumerate(keys):
+            score = self.cache.get(key)
+            if score is None:
+                missing.append(i)
+            else:
+                scores[i] = score
+        if missing:
+            fresh_scores = self.predict([pairs[i] for i in missing])
+            scores[missing] = fresh_scores
+            for i, score in zip(missing, fresh_scores):
+                self.cache.put(keys[i], float(score))
+        logger.info(f"Ranking cache: {len(pairs) - len(missing)}/{len(pairs)} hits")
+        return scores
+
+    def rank(self, pairs, k, cache_keys=None):
+        if cache_keys is not None and self.cache is not None and self.num_labels == 1 and self.cache.max_size > 0:
+            scores = self.predict_cached(pairs, cache_keys)
+        else:
+            scores = self.predict(pairs)
+        return find_topk(scores, k=min(k, len(pairs)))
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        # Created on first use and again after close(), so one engine can serve several sessions
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ranker")
+        return self._executor
+
+    async def apredict(self, pairs) -> np.ndarray:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.predict, pairs)
+
+    async def arank(self, pairs, k, cache_keys=None):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.rank, pairs, k, cache_keys)
+
+    def close(self):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
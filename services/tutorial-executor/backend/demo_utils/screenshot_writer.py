@@ -0,0 +1,59 @@
+# demo_utils/screenshot_writer.py
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def _write_file(path, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+class ScreenshotWriter:
+    """
+    Persist screenshots for the run trace without blocking the SeeAct loop.
+
+    Screenshots are handed over as bytes and written by a background task on a worker thread. At most
+    `max_pending` screenshots wait in memory; beyond that new ones are dropped and counted in `dropped`.
+    """
+
+    def __init__(self, enabled: bool = True, max_pending: int = 64):
+        self.enabled = enabled
+        self.written = 0
+        self.dropped = 0
+        self._queue = asyncio.Queue(maxsize=max_pending)
+        self._worker = None
+
+    def submit(self, path, data: bytes):
+        if not self.enabled or data is None:
+            return
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+        try:
+            self._queue.put_nowait((path, data))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Screenshot writer queue is full, dropped {path}")
+
+    async def _run(self):
+        while True:
+            path, data = await self._queue.get()
+            try:
+                await asyncio.to_thread(_write_file, path, data)
+                self.written += 1
+            except Exception as e:
+                logger.warning(f"Failed to save screenshot {path}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def close(self):
+        """Flush pending screenshots and stop the background task."""
+        if self._worker is None:
+            return
+        await self._queue.join()
+        self._worker.cancel()
+        await asyncio.gather(self._worker, return_exceptions=True)
+        self._worker = None
@@ -1,26 +1,35 @@
 import asyncio
+import json
 import os
 import logging
-from fastapi import FastAPI, BackgroundTasks, Request, status, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Request, status, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 import sys
 from seeact import main as seeact_main
 import uvicorn
 from rabbitmq.consumer import RabbitMQConsumer
 from pydantic import BaseModel
-from dataclasses import dataclass
+from datetime import datetime
 import toml
 from websocket_manager import websocket_manager
+from session_manager import session_registry, SeeActSession
+from task_state import task_state
+from utils.redis_client import close_async_redis_pool
+from cdp_pool import cdp_pool, cdp_endpoint, default_cdp_endpoint
+from demo_utils.ranking_model import ranking_cache
+from models.action_record import action_recorder
+from models.crud import ensure_indexes as ensure_crud_indexes
+from workers.retention import retention_service
 import platform
 import subprocess
 import psutil
 from typing import Optional
-from playwright.async_api import async_playwright
 import requests
 import miniupnpc
 import socket
 from contextlib import asynccontextmanager
+from prometheus_fastapi_instrumentator import Instrumentator
 
 # 初始化 FastAPI 应用
 app = FastAPI()
@@ -29,7 +38,9 @@ app = FastAPI()
 sys.path.append(os.path.join(os.path.dirname(__file__), "path_to_seeact_directory"))
 
 BASE_URL = "/tutorial-executor"
-background_tasks = BackgroundTasks()
+# 未设置 RABBITMQ_URL 时不启动队列消费
+RABBITMQ_URL = os.getenv("RABBITMQ_URL")
+rabbitmq_consumer: Optional[RabbitMQConsumer] = None
 
 # CORS Middleware
 origins = [
@@ -46,6 +57,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Prometheus 指标：HTTP 请求指标以及 tracing.py 中的 SeeAct 单步各阶段耗时
+Instrumentator().instrument(app).expose(app, endpoint="/metrics", include_in_schema=False)
+
 # 日志配置
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -57,17 +71,27 @@ logger.addHandler(handler)
 # WebSocket 端点
 @app.websocket("/tutorial-executor/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await websocket_manager.connect(websocket)
+    connection = await websocket_manager.connect(websocket, websocket.query_params.get("clientId"))
+    if websocket.query_params.get("sessionId"):
+        websocket_manager.bind_session(websocket.query_params["sessionId"], connection.client_id)
     try:
         while True:
             data = await websocket.receive_json()
-            logger.info(f"收到消息来自 {websocket.client}: {data}")
-            if data["type"] == "execute_action":
-                await perform_action(data["data"])
-            elif data["type"] == "skip_action":
-                await skip_current_step()
-            elif data["type"] == "auto_execute":
-                enable_auto_execute()
+            logger.info(f"收到消息来自 {connection.client_id}: {data}")
+            # 对 SeeAct 请求的响应交给等待中的 future
+            if websocket_manager.resolve(data):
+                continue
+            session = resolve_session(data, connection.client_id)
+            if session is None:
+                logger.warning(f"未找到消息对应的会话: {data}")
+                continue
+            websocket_manager.bind_session(session.session_id, connection.client_id)
+            if data.get("type") == "execute_action":
+                await perform_action(session, data["data"])
+            elif data.get("type") == "skip_action":
+                await skip_current_step(session)
+            elif data.get("type") == "auto_execute":
+                enable_auto_execute(session)
     except WebSocketDisconnect:
         websocket_manager.disconnect(websocket)
     except Exception as e:
@@ -80,6 +104,8 @@ class ExecuteRequest(BaseModel):
     query: str
     url: str
     clientIP: str
+    sessionId: Optional[str] = None
+    userID: Optional[int] = None  # user-manager 中的用户 ID，写入操作记录
 
 class ChromeLauncher:
     @staticmethod
@@ -313,34 +339,38 @@ class PortForwardManager:
             logger.error(f"移除端口转发时发生错误: {e}")
 
 @app.post("/tutorial-executor/execute")
-async def execute(request: ExecuteRequest, background_tasks: BackgroundTasks):
+async def execute(request: ExecuteRequest):
     """接收前端请求，启动 SeeAct 操作"""
     logger.info("收到前端启动请求")
     logger.info(f"请求参数: query={request.query}, url={request.url}, ip={request.clientIP}")
     
     try:
         # 构建连接URL
-        ws_url = f"ws://{request.clientIP}:9222"
+        ws_url = cdp_endpoint(request.clientIP)
         logger.info(f"尝试连接到用户Chrome: {ws_url}")
         
-        # 尝试连接到用户浏览器
-        async with async_playwright() as p:
-            try:
-                browser = await p.chromium.connect_over_cdp(ws_url)
-                context = browser.contexts[0]
-                pages = context.pages
-                page = pages[0] if pages else await context.new_page()
-                
-                # 启动 SeeAct
-                background_tasks.add_task(run_seeact, request.query, request.url, request.clientIP)
-                return {"status": "success", "message": "SeeAct 已启动"}
-                
-            except Exception as e:
-                logger.error(f"连接到用户浏览器失败: {str(e)}")
-                raise HTTPException(
-                    status_code=500,
-                    detail="无法连接到用户浏览器，请确保Chrome调试模式已启动且端口可访问"
-                )
+        # 从连接池获取到用户浏览器的连接，预热后供 SeeAct 复用
+        try:
+            async with cdp_pool.lease(ws_url):
+                pass
+        except Exception as e:
+            logger.error(f"连接到用户浏览器失败: {str(e)}")
+            raise HTTPException(
+                status_code=500,
+                detail="无法连接到用户浏览器，请确保Chrome调试模式已启动且端口可访问"
+            )
+
+        # 启动 SeeAct，超过并发上限时排队
+        try:
+            session = session_registry.create(request.query, request.url, request.clientIP, request.sessionId,
+                                             user_id=request.userID)
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        session_registry.submit(session, run_seeact)
+        return {"status": "success", "message": "SeeAct 已启动", "sessionId": session.session_id,
+                "sessionStatus": session.status, "queued": session_registry.queued_count}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"执行过程中发生错误: {str(e)}")
         raise HTTPException(
@@ -355,32 +385,112 @@ async def start_seeact_endpoint():
     with open(config_path, 'r') as toml_config_file:
         config = toml.load(toml_config_file)
     
-    base_dir = os.path.dirname(__file__)
     task = config["basic"]["default_task"]
     url = config["basic"]["default_website"]
     
-    # 等待 Chrome 扩展建立连接
-    retry_count = 0
-    while retry_count < 5:
-        try:
-            async with async_playwright() as p:
-                # 尝试连接到用户浏览器
-                browser = await p.chromium.connect_over_cdp("ws://localhost:9222")
-                await browser.close()
-                break
-        except Exception:
-            await asyncio.sleep(1)
-            retry_count += 1
+    # 等待 Chrome 扩展建立连接，连接建立后留在连接池中
+    try:
+        async with cdp_pool.lease(default_cdp_endpoint(), retries=5):
+            pass
+    except Exception as e:
+        logger.warning(f"连接到本地浏览器失败: {e}")
     
     # 启动 seeact
-    asyncio.create_task(seeact_main(config, base_dir, task, url))
+    session = session_registry.create(task, url)
+    session_registry.submit(session, run_seeact)
     
     return {
         "status": "success",
         "redirect_url": url,
-        "task": task
+        "task": task,
+        "sessionId": session.session_id
     }
 
+@app.get("/tutorial-executor/sessions")
+async def list_sessions():
+    """查看所有会话及其指标"""
+    return session_registry.metrics()
+
+@app.get("/tutorial-executor/browser-pool")
+async def browser_pool_stats():
+    """查看 CDP 连接池状态"""
+    return cdp_pool.stats()
+
+@app.get("/tutorial-executor/ranking-cache")
+async def ranking_cache_stats():
+    """查看元素排序缓存命中率"""
+    return ranking_cache.metrics()
+
+@app.get("/tutorial-executor/connections")
+async def connection_stats():
+    """查看扩展 WebSocket 连接及其发送队列"""
+    return websocket_manager.stats()
+
+@app.get("/tutorial-executor/action-records")
+async def action_record_stats():
+    """查看操作记录缓冲与写入状态"""
+    return action_recorder.metrics()
+
+@app.get("/tutorial-executor/actions/{task_id}")
+async def get_task_actions(task_id: str):
+    """按步骤顺序返回任务的操作记录，用于回放和生成教程"""
+    return await action_recorder.get_task_actions(task_id)
+
+@app.get("/tutorial-executor/users/{user_id}/actions")
+async def get_user_actions(user_id: int, before: Optional[datetime] = None, limit: int = 100):
+    """按时间倒序返回用户的操作记录，before 传上一页最后一条的 timestamp"""
+    return await action_recorder.get_user_actions(user_id, before, min(limit, 1000))
+
+@app.get("/tutorial-executor/retention")
+async def retention_stats():
+    """查看最近一次保留策略清理的结果"""
+    return retention_service.last_sweep
+
+@app.get("/tutorial-executor/task-state/{session_id}")
+async def get_task_state(session_id: str):
+    """从 Redis 读取任务的实时状态"""
+    if not task_state.enabled:
+        raise HTTPException(status_code=503, detail="未配置 REDIS_URL")
+    state = await task_state.get(session_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="任务状态不存在")
+    return state
+
+@app.get("/tutorial-executor/task-state/{session_id}/events")
+async def stream_task_state(session_id: str):
+    """以 Server-Sent Events 推送任务进度，session_id 为 all 时推送所有任务"""
+    if not task_state.enabled:
+        raise HTTPException(status_code=503, detail="未配置 REDIS_URL")
+    if task_state.subscribers_full:
+        raise HTTPException(status_code=503, detail="订阅客户端已达上限", headers={"Retry-After": "5"})
+
+    async def events():
+        async for event in task_state.subscribe(None if session_id == "all" else session_id):
+            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.get("/tutorial-executor/queue")
+async def queue_stats():
+    """查看 RabbitMQ 队列消费状态"""
+    if rabbitmq_consumer is None:
+        return {"enabled": False}
+    return {"enabled": True, "prefetch": rabbitmq_consumer.prefetch,
+            "in_flight": rabbitmq_consumer.in_flight, **rabbitmq_consumer.stats}
+
+@app.get("/tutorial-executor/sessions/{session_id}")
+async def get_session(session_id: str):
+    session = session_registry.get(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session.summary()
+
+@app.delete("/tutorial-executor/sessions/{session_id}")
+async def cancel_session(session_id: str):
+    if not session_registry.cancel(session_id):
+        raise HTTPException(status_code=404, detail="Session not found or already finished")
+    return {"status": "success", "sessionId": session_id}
+
 @app.get("/tutorial-executor")
 async def check_alive():
     return {"message": "I'm alive"}
@@ -401,50 +511,49 @@ async def validation_exception_handler(request: Request, exc: Exception):
 
 # 执行相关函数
 
-@dataclass
-class ExecutionConfig:
-    auto_execute: bool = False
+def resolve_session(data, client_id: str) -> Optional[SeeActSession]:
+    """根据消息中的 sessionId 或客户端 ID 找到对应的会话"""
+    session_id = data.get("sessionId")
+    if session_id:
+        return session_registry.get(session_id)
+    return session_registry.find_by_client(client_id)
 
-config_execution = ExecutionConfig()
-taken_actions = []
-task_queue = []
+def enable_auto_execute(session: SeeActSession):
+    session.auto_execute = True
+    logger.info(f"会话 {session.session_id} 已启用自动执行模式")
 
-def enable_auto_execute():
-    config_execution.auto_execute = True
-    logger.info("已启用自动执行模式")
-
-async def perform_action(data):
-    if config_execution.auto_execute:
+async def perform_action(session: SeeActSession, data):
+    if session.auto_execute:
         logger.info("自动执行模式下执行操作")
-        await execute_specific_action(data)
+        await execute_specific_action(session, data)
     else:
         logger.info("等待用户指示以执行操作")
         # 可以在此添加等待用户指示的逻辑
 
-async def skip_current_step():
+async def skip_current_step(session: SeeActSession):
     action = "当前操作已被跳过"
-    taken_actions.append(action)
+    session.taken_actions.append(action)
     logger.info(action)
-    if task_queue:
-        task_queue.pop(0)
+    if session.task_queue:
+        session.task_queue.pop(0)
     # 可以在此添加继续下一个任务的逻辑
 
-async def execute_specific_action(data):
+async def execute_specific_action(session: SeeActSession, data):
     try:
         component_id = data.get("componentId")
         action = data.get("action")
         # 在这里实现具体的操作逻辑，例如通过 Playwright 操作页面元素
         logger.info(f"执行操作: {action} 在组件: {component_id}")
         # 示例：与 Playwright 会话交互
-        # await session_control.active_page.click(f'[data-id="{component_id}"]')
+        # await session.control.active_page.click(f'[data-id="{component_id}"]')
     except Exception as e:
         logger.error(f"执行操作时出错: {e}")
 
-async def run_seeact(query: str, url: str, clientIP: str):
+async def run_seeact(session: SeeActSession):
     """
     在后台异步运行 seeact.py 的 main 函数
     """
-    logger.info("开始运行 SeeAct 主任务。")
+    logger.info(f"开始运行 SeeAct 主任务，会话: {session.session_id}")
     
     # 配置文件路径
     config_path = os.path.join(os.path.dirname(__file__), "config", "demo_mode.toml")
@@ -458,28 +567,74 @@ async def run_seeact(query: str, url: str, clientIP: str):
             logger.info(f"已加载配置文件 - {config_path}")
     except FileNotFoundError:
         logger.error(f"错误：文件 '{config_path}' 未找到。")
-        return
+        raise
     except toml.TomlDecodeError:
         logger.error(f"错误：文件 '{config_path}' 不是有效的 TOML 文件。")
-        return
+        raise
+
+    if session.client_ip:
+        websocket_manager.bind_session(session.session_id, session.client_ip)
 
     # 调用 seeact 的 main 函数
     try:
         base_dir = os.path.dirname(os.path.abspath(__file__))
         logger.info(f"基目录: {base_dir}")
-        await seeact_main(config, base_dir, query, url, clientIP)
+        # 有客户端 IP 时连接用户的浏览器，否则连接 CHROME_DEBUG_HOST 上的调试 Chrome
+        endpoint = cdp_endpoint(session.client_ip) if session.client_ip else default_cdp_endpoint()
+        async with cdp_pool.lease(endpoint, retries=3) as browser:
+            await seeact_main(config, base_dir, session.query, session.url, session.client_ip,
+                              session=session, browser=browser)
     except Exception as e:
         logger.error(f"SeeAct 主任务执行时出错: {str(e)}")
         logger.exception("详细错误信息:")
+        raise
+    finally:
+        websocket_manager.unbind_session(session.session_id)
+
+def load_default_task():
+    """读取 demo 配置中的默认任务，作为队列消息缺少 query / url 时的回退"""
+    config_path = os.path.join(os.path.dirname(__file__), "config", "demo_mode.toml")
+    with open(config_path, 'r') as toml_config_file:
+        config = toml.load(toml_config_file)
+    return {"query": config["basic"]["default_task"], "url": config["basic"]["default_website"]}
+
+async def create_indexes():
+    """创建操作记录和 CRUD 集合的索引"""
+    try:
+        await action_recorder.ensure_indexes()
+    except Exception as e:
+        logger.error(f"创建操作记录索引失败: {e}")
+    await ensure_crud_indexes()
 
 @app.on_event("startup")
 async def startup_event():
-    """服务启动时初始化 WebSocket 管理器"""
-    global websocket_manager
+    """服务启动时初始化 WebSocket 管理器并启动 Playwright 驱动"""
+    global websocket_manager, rabbitmq_consumer
+    await cdp_pool.start()
+    # MongoDB 不可用时不阻塞启动
+    asyncio.create_task(create_indexes())
+    # 定时清理过期的记录和截图
+    retention_service.start()
+    if RABBITMQ_URL:
+        rabbitmq_consumer = RabbitMQConsumer(RABBITMQ_URL, session_registry, run_seeact,
+                                             default_task=load_default_task())
+        try:
+            await rabbitmq_consumer.start()
+        except Exception as e:
+            logger.error(f"连接 RabbitMQ 失败，队列任务不会被消费: {e}")
+            rabbitmq_consumer = None
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """服务关闭时清理连接"""
+    # 先停止消费并等待进行中的队列任务，再取消剩余会话
+    if rabbitmq_consumer is not None:
+        await rabbitmq_consumer.stop()
+    await session_registry.shutdown()
+    await action_recorder.close()
+    await retention_service.stop()
+    await close_async_redis_pool()
+    await cdp_pool.stop()
     for connection in websocket_manager.active_connections:
         await connection.close()
 
@@ -1,41 +1,177 @@
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, List, Optional
 from pydantic import BaseModel
+from config.settings import settings
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# 单个会话缓冲达到该条数时写入
+ACTION_RECORD_BATCH_SIZE = int(os.getenv("ACTION_RECORD_BATCH_SIZE", "20"))
+# 定时写入所有会话缓冲的间隔（秒）
+ACTION_RECORD_FLUSH_INTERVAL = float(os.getenv("ACTION_RECORD_FLUSH_INTERVAL", "5"))
+# 所有会话缓冲的记录总数上限，超出时丢弃新记录并计数
+ACTION_RECORD_MAX_PENDING = int(os.getenv("ACTION_RECORD_MAX_PENDING", "10000"))
+# 会话结束时等待本会话写入的最长秒数，超时后写入在后台继续
+ACTION_RECORD_FLUSH_TIMEOUT = float(os.getenv("ACTION_RECORD_FLUSH_TIMEOUT", "2"))
+
+# 回放和生成教程只需要的字段
+REPLAY_PROJECTION = {"_id": 0, "step_number": 1, "selected_option": 1, "action_type": 1, "action_value": 1,
+                     "description": 1, "url": 1, "timestamp": 1}
+
 
 class ActionRecord(BaseModel):
     timestamp: datetime
-    userID: int # 假设有用户id作为user表主键
+    userID: Optional[int] = None  # 假设有用户id作为user表主键
     selected_option: str
     action_type: str
     action_value: Optional[str]
     task_id: str  # 用于关联特定任务
     step_number: int  # 步骤序号
     execution_time: float  # API 调用耗时
+    description: Optional[str] = None  # 执行结果描述，即 taken_actions 中的文本
+    url: Optional[str] = None  # 执行操作时的页面地址
+
 
 class MongoDBHandler:
-    def __init__(self, mongodb_url: str):
+    """
+    Buffered sink for SeeAct action records.
+
+    `save_action` only appends the record to its session's buffer. A session's buffer is written with an
+    unordered `insert_many` once it holds `batch_size` records, when `flush(task_id)` is called at the end of
+    the session, and by a background task every `flush_interval` seconds. Writes run as background tasks so a
+    step never waits for MongoDB.
+    """
+
+    def __init__(self, mongodb_url: str, batch_size: int = ACTION_RECORD_BATCH_SIZE,
+                 flush_interval: float = ACTION_RECORD_FLUSH_INTERVAL, max_pending: int = ACTION_RECORD_MAX_PENDING):
         from motor.motor_asyncio import AsyncIOMotorClient
         self.client = AsyncIOMotorClient(mongodb_url)
         self.db = self.client.tutorial_executor
         self.collection = self.db.action_records
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._buffers: Dict[str, List[Dict[str, Any]]] = {}
+        self._writes = set()
+        self._flusher: Optional[asyncio.Task] = None
+        self._indexes_ready = False
+        self.stats = {"saved": 0, "written": 0, "dropped": 0, "failed": 0}
+
+    async def ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        await self.collection.create_index([("task_id", 1), ("step_number", 1)])
+        await self.collection.create_index([("userID", 1), ("timestamp", -1)])
+        self._indexes_ready = True
+
+    def start(self):
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    @property
+    def pending(self) -> int:
+        return sum(len(buffer) for buffer in self._buffers.values())
 
-    async def save_action(self, 
-                         userID: int,
-                         selected_option: str, 
-                         action: str, 
-                         value: str, 
+    async def save_action(self,
+                         userID: Optional[int],
+                         selected_option: str,
+                         action: str,
+                         value: str,
                          task_id: str,
                          step_number: int,
-                         execution_time: float):
+                         execution_time: float,
+                         description: Optional[str] = None,
+                         url: Optional[str] = None):
+        if self.pending >= self.max_pending:
+            self.stats["dropped"] += 1
+            return
         record = ActionRecord(
-            timestamp=datetime.datetime.now(),
+            timestamp=datetime.now(),
             userID=userID,
             selected_option=selected_option,
             action_type=action,
             action_value=value,
             task_id=task_id,
             step_number=step_number,
-            execution_time=execution_time
+            execution_time=execution_time,
+            description=description,
+            url=url
         )
-        
-        await self.collection.insert_one(record.dict()) 
\ No newline at end of file
+        self.start()
+        buffer = self._buffers.setdefault(task_id, [])
+        buffer.append(record.dict())
+        self.stats["saved"] += 1
+        if len(buffer) >= self.batch_size:
+            self._write(task_id)
+
+    def _write(self, task_id: str) -> Optional[asyncio.Task]:
+        records = self._buffers.pop(task_id, None)
+        if not records:
+            return None
+        task = asyncio.create_task(self._insert(records))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+        return task
+
+    async def _insert(self, records: List[Dict[str, Any]]):
+        try:
+            await self.ensure_indexes()
+            await self.collection.insert_many(records, ordered=False)
+            self.stats["written"] += len(records)
+        except Exception as e:
+            self.stats["failed"] += len(records)
+            logger.error(f"写入 {len(records)} 条操作记录失败: {e}")
+
+    async def flush(self, task_id: Optional[str] = None, timeout: Optional[float] = ACTION_RECORD_FLUSH_TIMEOUT):
+        """
+        Write the buffer of one session and wait at most `timeout` seconds for that write; without `task_id`,
+        write all buffers and wait for every pending write. A write that times out keeps running in the background.
+        """
+        if task_id is not None:
+            task = self._write(task_id)
+            writes = {task} if task is not None else set()
+        else:
+            for key in list(self._buffers):
+                self._write(key)
+            writes = set(self._writes)
+        if writes:
+            await asyncio.wait(writes, timeout=timeout)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            for task_id in list(self._buffers):
+                self._write(task_id)
+
+    async def close(self, timeout: float = 10):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush(timeout=timeout)
+
+    async def get_task_actions(self, task_id: str) -> List[Dict[str, Any]]:
+        """All steps of a task in execution order, for replay and guidebook generation."""
+        cursor = self.collection.find({"task_id": task_id}, REPLAY_PROJECTION).sort("step_number", 1)
+        return await cursor.to_list(length=None)
+
+    async def get_user_actions(self, userID: int, before: Optional[datetime] = None,
+                               limit: int = 100) -> List[Dict[str, Any]]:
+        """A user's most recent actions, newest first; pass the last timestamp as `before` for the next page."""
+        query: Dict[str, Any] = {"userID": userID}
+        if before is not None:
+            query["timestamp"] = {"$lt": before}
+        cursor = self.collection.find(query, {"_id": 0}).sort("timestamp", -1).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {**self.stats, "pending": self.pending, "sessions_buffered": len(self._buffers),
+                "writes_in_flight": len(self._writes)}
+
+
+# 创建全局实例
+action_recorder = MongoDBHandler(str(settings.MONGODB_URL))
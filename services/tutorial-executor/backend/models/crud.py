@@ -8,14 +8,125 @@ It uses Motor for asynchronous MongoDB interactions.
 
 from motor.motor_asyncio import AsyncIOMotorClient
 from bson.objectid import ObjectId
+from datetime import datetime
 from typing import List, Optional, Dict, Any
-from .schemas import LogEntry, Configuration, LargeModelResponse, Screenshot, User, PyObjectId
+from .schemas import LogEntry, Configuration, LargeModelResponse, Screenshot, User, PyObjectId, CursorPage
+import base64
+import json
+import logging
 import pymongo
+from pymongo.errors import PyMongoError
 
 # Initialize MongoDB client
 client = AsyncIOMotorClient("mongodb://localhost:27017/")
 db = client.mydatabase  # Replace 'mydatabase' with your actual database name
 
+MAX_PAGE_SIZE = 1000
+
+# Indexes for every field the list and lookup queries filter or sort on; list queries sort on
+# (sort field, _id) so the keyset condition is served by the same index.
+INDEXES = {
+    "logs": [
+        pymongo.IndexModel([("timestamp", pymongo.DESCENDING), ("_id", pymongo.DESCENDING)]),
+        pymongo.IndexModel([("level", pymongo.ASCENDING), ("timestamp", pymongo.DESCENDING),
+                            ("_id", pymongo.DESCENDING)]),
+        pymongo.IndexModel([("source", pymongo.ASCENDING), ("timestamp", pymongo.DESCENDING),
+                            ("_id", pymongo.DESCENDING)]),
+    ],
+    "configurations": [
+        pymongo.IndexModel([("key", pymongo.ASCENDING)], unique=True),
+    ],
+    "large_model_responses": [
+        pymongo.IndexModel([("generated_at", pymongo.DESCENDING), ("_id", pymongo.DESCENDING)]),
+        pymongo.IndexModel([("model_version", pymongo.ASCENDING), ("generated_at", pymongo.DESCENDING),
+                            ("_id", pymongo.DESCENDING)]),
+    ],
+    "screenshots": [
+        pymongo.IndexModel([("captured_at", pymongo.DESCENDING), ("_id", pymongo.DESCENDING)]),
+        pymongo.IndexModel([("tags", pymongo.ASCENDING), ("captured_at", pymongo.DESCENDING),
+                            ("_id", pymongo.DESCENDING)]),
+    ],
+    "users": [
+        pymongo.IndexModel([("username", pymongo.ASCENDING)], unique=True),
+        pymongo.IndexModel([("email", pymongo.ASCENDING)]),
+    ],
+}
+
+# Fields returned by list queries unless the caller asks for others; large payloads (log context, model
+# responses, metadata, password hashes) are only returned by the single-document getters.
+LIST_FIELDS = {
+    "logs": ["timestamp", "level", "message", "source"],
+    "configurations": ["key", "value", "description", "updated_at"],
+    "large_model_responses": ["query", "generated_at", "model_version"],
+    "screenshots": ["image_url", "captured_at", "tags"],
+    "users": ["username", "email", "full_name", "disabled"],
+}
+
+
+async def ensure_indexes():
+    """
+    Create the indexes used by the queries in this module. Call once at startup; existing indexes are kept.
+    """
+    for collection, indexes in INDEXES.items():
+        try:
+            await db[collection].create_indexes(indexes)
+        except PyMongoError as e:
+            logging.error(f"Failed to create indexes on {collection}: {e}")
+
+
+def encode_cursor(sort_value: Any, object_id: ObjectId) -> str:
+    value = sort_value.isoformat() if isinstance(sort_value, datetime) else sort_value
+    payload = {"v": value, "id": str(object_id), "dt": isinstance(sort_value, datetime)}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        value = datetime.fromisoformat(payload["v"]) if payload.get("dt") else payload["v"]
+        return value, ObjectId(payload["id"])
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+async def find_page(collection: str, query: Optional[Dict[str, Any]] = None, sort_field: str = "_id",
+                    after: Optional[str] = None, limit: int = 10,
+                    fields: Optional[List[str]] = None) -> CursorPage:
+    """
+    Return one page of `collection`, newest first, ordered by (`sort_field`, `_id`).
+
+    Instead of skip/limit, the page continues after the cursor of the previous page's last document, so
+    every page is an index range scan no matter how deep it is. Only `fields` (default: LIST_FIELDS of the
+    collection) are returned; `id` is always included as a string.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    conditions = [query] if query else []
+    if after:
+        value, object_id = decode_cursor(after)
+        if sort_field == "_id":
+            conditions.append({"_id": {"$lt": object_id}})
+        else:
+            conditions.append({"$or": [{sort_field: {"$lt": value}},
+                                       {sort_field: value, "_id": {"$lt": object_id}}]})
+    filter_query = {"$and": conditions} if len(conditions) > 1 else (conditions[0] if conditions else {})
+
+    projection = {field: 1 for field in (fields or LIST_FIELDS.get(collection, []))}
+    projection[sort_field] = 1
+    sort = [("_id", pymongo.DESCENDING)] if sort_field == "_id" \
+        else [(sort_field, pymongo.DESCENDING), ("_id", pymongo.DESCENDING)]
+
+    # 多取一条判断是否还有下一页
+    cursor = db[collection].find(filter_query, projection or None).sort(sort).limit(limit + 1)
+    documents = await cursor.to_list(length=limit + 1)
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        last = documents[-1]
+        next_cursor = encode_cursor(last.get(sort_field) if sort_field != "_id" else None, last["_id"])
+    for document in documents:
+        document["id"] = str(document.pop("_id"))
+    return CursorPage(items=documents, next_cursor=next_cursor, size=len(documents))
+
 
 # Log Entry CRUD Operations
 async def create_log_entry(log_entry: LogEntry):
@@ -28,13 +139,17 @@ async def create_log_entry(log_entry: LogEntry):
     return log_entry
 
 
-async def get_logs(skip: int = 0, limit: int = 10) -> List[LogEntry]:
+async def get_logs(limit: int = 10, after: Optional[str] = None, level: Optional[str] = None,
+                   source: Optional[str] = None, fields: Optional[List[str]] = None) -> CursorPage:
     """
-    Retrieve a list of log entries from the database.
+    Retrieve a page of log entries, newest first. Pass the previous page's `next_cursor` as `after`.
     """
-    logs_cursor = db.logs.find().skip(skip).limit(limit)
-    logs = await logs_cursor.to_list(length=limit)
-    return [LogEntry(**log) for log in logs]
+    query = {}
+    if level:
+        query["level"] = level
+    if source:
+        query["source"] = source
+    return await find_page("logs", query, "timestamp", after, limit, fields)
 
 
 async def get_log_by_id(log_id: str) -> Optional[LogEntry]:
@@ -85,13 +200,12 @@ async def create_configuration(configuration: Configuration):
     return configuration
 
 
-async def get_configurations(skip: int = 0, limit: int = 10) -> List[Configuration]:
+async def get_configurations(limit: int = 10, after: Optional[str] = None,
+                             fields: Optional[List[str]] = None) -> CursorPage:
     """
-    Retrieve a list of configurations from the database.
+    Retrieve a page of configurations, newest first. Pass the previous page's `next_cursor` as `after`.
     """
-    configs_cursor = db.configurations.find().skip(skip).limit(limit)
-    configs = await configs_cursor.to_list(length=limit)
-    return [Configuration(**config) for config in configs]
+    return await find_page("configurations", None, "_id", after, limit, fields)
 
 
 async def get_configuration_by_key(key: str) -> Optional[Configuration]:
@@ -136,13 +250,14 @@ async def create_large_model_response(response: LargeModelResponse):
     return response
 
 
-async def get_large_model_responses(skip: int = 0, limit: int = 10) -> List[LargeModelResponse]:
+async def get_large_model_responses(limit: int = 10, after: Optional[str] = None,
+                                    model_version: Optional[str] = None,
+                                    fields: Optional[List[str]] = None) -> CursorPage:
     """
-    Retrieve a list of large model responses from the database.
+    Retrieve a page of large model responses, newest first. Pass the previous page's `next_cursor` as `after`.
     """
-    responses_cursor = db.large_model_responses.find().skip(skip).limit(limit)
-    responses = await responses_cursor.to_list(length=limit)
-    return [LargeModelResponse(**response) for response in responses]
+    query = {"model_version": model_version} if model_version else None
+    return await find_page("large_model_responses", query, "generated_at", after, limit, fields)
 
 
 async def get_large_model_response_by_id(response_id: str) -> Optional[LargeModelResponse]:
@@ -193,13 +308,13 @@ async def create_screenshot(screenshot: Screenshot):
     return screenshot
 
 
-async def get_screenshots(skip: int = 0, limit: int = 10) -> List[Screenshot]:
+async def get_screenshots(limit: int = 10, after: Optional[str] = None, tag: Optional[str] = None,
+                          fields: Optional[List[str]] = None) -> CursorPage:
     """
-    Retrieve a list of screenshots from the database.
+    Retrieve a page of screenshots, newest first. Pass the previous page's `next_cursor` as `after`.
     """
-    screenshots_cursor = db.screenshots.find().skip(skip).limit(limit)
-    screenshots = await screenshots_cursor.to_list(length=limit)
-    return [Screenshot(**screenshot) for screenshot in screenshots]
+    query = {"tags": tag} if tag else None
+    return await find_page("screenshots", query, "captured_at", after, limit, fields)
 
 
 async def get_screenshot_by_id(screenshot_id: str) -> Optional[Screenshot]:
@@ -250,13 +365,12 @@ async def create_user(user: User):
     return user
 
 
-async def get_users(skip: int = 0, limit: int = 10) -> List[User]:
+async def get_users(limit: int = 10, after: Optional[str] = None,
+                    fields: Optional[List[str]] = None) -> CursorPage:
     """
-    Retrieve a list of users from the database.
+    Retrieve a page of users, newest first. Pass the previous page's `next_cursor` as `after`.
     """
-    users_cursor = db.users.find().skip(skip).limit(limit)
-    users = await users_cursor.to_list(length=limit)
-    return [User(**user) for user in users]
+    return await find_page("users", None, "_id", after, limit, fields)
 
 
 async def get_user_by_username(username: str) -> Optional[User]:
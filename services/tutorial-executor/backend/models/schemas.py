@@ -97,6 +97,12 @@ class PaginatedResponse(BaseModel):
     class Config:
         arbitrary_types_allowed = True
 
+# Keyset (cursor) pagination: pass next_cursor back as `after` to get the following page
+class CursorPage(BaseModel):
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+    size: int
+
 # User schema for authentication and authorization
 class User(BaseModel):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
@@ -1,43 +1,189 @@
 import aio_pika
+import asyncio
 import logging
 import json
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
 
 logger = logging.getLogger(__name__)
 
+# 与 tutorial-generator 的 RabbitMQProducer 保持一致
+EXCHANGE_NAME = "tutorial_exchange"
+QUEUE_NAME = "tutorial_executor_queue"
+ROUTING_KEY = "tutorial.seeact"
+DEAD_LETTER_EXCHANGE = f"{EXCHANGE_NAME}.dlx"
+DEAD_LETTER_ROUTING_KEY = f"{ROUTING_KEY}.dead"
+RETRY_QUEUE_NAME = f"{QUEUE_NAME}.retry"
+FAILED_QUEUE_NAME = f"{QUEUE_NAME}.failed"
+QUEUE_ARGUMENTS = {
+    'x-message-ttl': 86400000,  # 消息 TTL：24小时
+    'x-dead-letter-exchange': DEAD_LETTER_EXCHANGE,
+    'x-dead-letter-routing-key': DEAD_LETTER_ROUTING_KEY,
+}
+
+# 单个消息最多重试次数，超过后转入 failed 队列
+RABBITMQ_MAX_RETRIES = int(os.getenv("RABBITMQ_MAX_RETRIES", "3"))
+# 重试前在 retry 队列中等待的毫秒数
+RABBITMQ_RETRY_DELAY_MS = int(os.getenv("RABBITMQ_RETRY_DELAY_MS", "10000"))
+# 关闭时等待进行中任务完成的秒数，超时的任务重新入队交给其他副本
+RABBITMQ_DRAIN_TIMEOUT = float(os.getenv("RABBITMQ_DRAIN_TIMEOUT", "60"))
+
+
 class RabbitMQConsumer:
-    def __init__(self, rabbitmq_url: str, background_tasks, run_seeact):
+    """
+    Worker runtime for `tutorial_executor_queue`.
+
+    - prefetch defaults to the session capacity of the registry, so a replica never holds more tasks than it
+      can run and the remaining messages stay available to other executor replicas;
+    - a message is acked only after its SeeAct session finished;
+    - failed sessions are rejected into the dead-letter exchange `tutorial_exchange.dlx`, wait in
+      `tutorial_executor_queue.retry` for the retry delay and return to the main queue; after `max_retries`
+      attempts they are parked in `tutorial_executor_queue.failed`;
+    - `stop` cancels the consumer, drains in-flight sessions and requeues whatever did not finish in time.
+    """
+
+    def __init__(self, rabbitmq_url: str, session_registry, run_seeact: Callable[[Any], Awaitable[Any]],
+                 default_task: Optional[Dict[str, str]] = None, prefetch: Optional[int] = None,
+                 max_retries: int = RABBITMQ_MAX_RETRIES, retry_delay_ms: int = RABBITMQ_RETRY_DELAY_MS,
+                 drain_timeout: float = RABBITMQ_DRAIN_TIMEOUT):
         self.rabbitmq_url = rabbitmq_url
-        self.background_tasks = background_tasks
+        self.session_registry = session_registry
         self.run_seeact = run_seeact
+        self.default_task = default_task or {}
+        self.prefetch = prefetch or session_registry.max_sessions
+        self.max_retries = max_retries
+        self.retry_delay_ms = retry_delay_ms
+        self.drain_timeout = drain_timeout
+        self._connection = None
+        self._channel = None
+        self._queue = None
+        self._consumer_tag = None
+        self._failed_exchange = None
+        self._inflight: Set[asyncio.Task] = set()
+        self.stats = {"received": 0, "completed": 0, "cancelled": 0, "retried": 0, "failed": 0, "requeued": 0}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._inflight)
 
     async def start(self):
         # 连接到 RabbitMQ
-        connection = await aio_pika.connect_robust(self.rabbitmq_url)
-        channel = await connection.channel()
-
-        # 声明队列
-        queue = await channel.declare_queue(
-            "tutorial_executor_queue",
-            durable=True
-        )
-
-        async def process_message(message: aio_pika.IncomingMessage):
-            async with message.process():
-                try:
-                    data = json.loads(message.body.decode())
-                    logger.info(f"Received message: {data}")
-                    
-                    # 检查消息类型
-                    if data.get('action') == 'start_seeact':
-                        logger.info("Starting SeeAct task...")
-                        self.background_tasks.add_task(self.run_seeact)
-                    else:
-                        logger.info(f"Ignored message with action: {data.get('action')}")
-                        
-                except Exception as e:
-                    logger.error(f"Error processing message: {e}")
+        self._connection = await aio_pika.connect_robust(self.rabbitmq_url)
+        self._channel = await self._connection.channel()
+        await self._channel.set_qos(prefetch_count=self.prefetch)
+
+        exchange = await self._channel.declare_exchange(EXCHANGE_NAME, aio_pika.ExchangeType.TOPIC, durable=True)
+        dead_letter_exchange = await self._channel.declare_exchange(
+            DEAD_LETTER_EXCHANGE, aio_pika.ExchangeType.TOPIC, durable=True)
+
+        # 声明队列（参数需与生产者一致）
+        self._queue = await self._channel.declare_queue(QUEUE_NAME, durable=True, arguments=QUEUE_ARGUMENTS)
+        await self._queue.bind(exchange, routing_key=ROUTING_KEY)
+
+        # 重试队列：死信消息在此等待 retry_delay_ms 后回到主队列
+        retry_queue = await self._channel.declare_queue(
+            RETRY_QUEUE_NAME, durable=True,
+            arguments={
+                'x-message-ttl': self.retry_delay_ms,
+                'x-dead-letter-exchange': EXCHANGE_NAME,
+                'x-dead-letter-routing-key': ROUTING_KEY,
+            })
+        await retry_queue.bind(dead_letter_exchange, routing_key=DEAD_LETTER_ROUTING_KEY)
+        await self._channel.declare_queue(FAILED_QUEUE_NAME, durable=True)
+        self._failed_exchange = self._channel.default_exchange
 
         # 开始消费消息
-        await queue.consume(process_message)
-        
-        return connection
\ No newline at end of file
+        self._consumer_tag = await self._queue.consume(self._on_message)
+        logger.info(f"开始消费 {QUEUE_NAME}，prefetch={self.prefetch}")
+        return self._connection
+
+    async def _on_message(self, message: aio_pika.abc.AbstractIncomingMessage):
+        task = asyncio.create_task(self._handle(message))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    @staticmethod
+    def attempts(message) -> int:
+        """Number of earlier deliveries that were dead-lettered, from the x-death header."""
+        deaths = (message.headers or {}).get("x-death") or []
+        return sum(int(death.get("count", 0)) for death in deaths if death.get("queue") == QUEUE_NAME)
+
+    async def _handle(self, message: aio_pika.abc.AbstractIncomingMessage):
+        self.stats["received"] += 1
+        try:
+            data = json.loads(message.body.decode())
+        except Exception as e:
+            logger.error(f"无法解析消息，丢弃: {e}")
+            await self._park(message, f"invalid message: {e}")
+            return
+
+        logger.info(f"Received message: {data}")
+        # 检查消息类型
+        if data.get('action') != 'start_seeact':
+            logger.info(f"Ignored message with action: {data.get('action')}")
+            await message.ack()
+            return
+
+        task_data = data.get('data') or {}
+        try:
+            session = self.session_registry.create(
+                task_data.get("query") or self.default_task.get("query"),
+                task_data.get("url") or self.default_task.get("url"),
+                task_data.get("clientIP"),
+                task_data.get("sessionId"),
+                user_id=task_data.get("userID"),
+            )
+        except ValueError as e:
+            logger.warning(f"重复的任务消息，丢弃: {e}")
+            await message.ack()
+            return
+
+        logger.info(f"Starting SeeAct task, session: {session.session_id}")
+        self.session_registry.submit(session, self.run_seeact)
+        try:
+            # asyncio.wait 不会因会话本身失败或被取消而抛出，只在消费者停止时抛出 CancelledError
+            await asyncio.wait({session.task})
+        except asyncio.CancelledError:
+            # 关闭时未完成的任务重新入队，由其他副本继续
+            session.task.cancel()
+            await message.nack(requeue=True)
+            self.stats["requeued"] += 1
+            raise
+
+        if session.status in ("completed", "cancelled"):
+            # 通过 API 取消的会话同样确认，不再重试
+            await message.ack()
+            self.stats[session.status] += 1
+        elif self.attempts(message) + 1 >= self.max_retries:
+            await self._park(message, session.error)
+        else:
+            logger.warning(f"会话 {session.session_id} 失败，稍后重试: {session.error}")
+            await message.reject(requeue=False)
+            self.stats["retried"] += 1
+
+    async def _park(self, message, reason):
+        """Move a message that cannot be processed to the failed queue and ack it."""
+        await self._failed_exchange.publish(
+            aio_pika.Message(body=message.body, headers={**(message.headers or {}), "x-failure-reason": str(reason)},
+                             content_type=message.content_type,
+                             delivery_mode=aio_pika.DeliveryMode.PERSISTENT),
+            routing_key=FAILED_QUEUE_NAME)
+        await message.ack()
+        self.stats["failed"] += 1
+        logger.error(f"消息处理失败，已转入 {FAILED_QUEUE_NAME}: {reason}")
+
+    async def stop(self):
+        """Stop consuming, wait for in-flight sessions, then requeue the unfinished ones and close."""
+        if self._queue is not None and self._consumer_tag is not None:
+            await self._queue.cancel(self._consumer_tag)
+            self._consumer_tag = None
+        if self._inflight:
+            logger.info(f"等待 {len(self._inflight)} 个进行中的任务完成")
+            _, pending = await asyncio.wait(set(self._inflight), timeout=self.drain_timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+        logger.info(f"RabbitMQ 消费者已停止: {self.stats}")
@@ -13,6 +13,7 @@ import logging
 from typing import Any, Dict, List, Optional
 import time
 import asyncio
+from workers.retention import retention_service
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -227,11 +228,8 @@ async def perform_cleanup(background_tasks: BackgroundTasks):
         UtilityResponse: The result of the performed cleanup.
     """
     logging.info("Starting cleanup task...")
-    # Simulate cleanup process
-    time.sleep(5)  # Replace with actual cleanup logic
-    logging.info("Cleanup task completed.")
-    background_tasks.add_task(logging.info, "Cleanup task finished in the background")
-    return {"result": "Cleanup task started", "message": "Cleanup initiated"}
+    background_tasks.add_task(retention_service.sweep)
+    return {"result": retention_service.last_sweep, "message": "Cleanup initiated"}
 
 # Example of a monitoring endpoint
 class MonitoringData(BaseModel):
@@ -10,9 +10,11 @@ from fastapi import APIRouter, Depends, HTTPException, Request, BackgroundTasks
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 from bson.objectid import ObjectId
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Optional
 import logging
 from models.database import DatabaseUtils  # Assuming this is your MongoDB utility class
+from models.crud import find_page
+from models.schemas import CursorPage
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -64,22 +66,24 @@ async def read_log(log_id: str):
         raise HTTPException(status_code=404, detail="Log not found")
     return log
 
-@router.get("/logs/", response_model=List[LogEntry])
+@router.get("/logs/", response_model=CursorPage)
 async def read_logs(
     level: Optional[str] = None,
     message: Optional[str] = None,
-    limit: int = 100
+    limit: int = 100,
+    after: Optional[str] = None
 ):
     """
-    Endpoint to read multiple log entries with optional filtering.
+    Endpoint to read log entries, newest first, with optional filtering.
 
     Args:
         level (Optional[str]): Filter logs by level.
         message (Optional[str]): Filter logs by message content.
         limit (int): Limit the number of returned logs. Defaults to 100.
+        after (Optional[str]): `next_cursor` of the previous page.
 
     Returns:
-        List[LogEntry]: A list of matching log entries.
+        CursorPage: The matching log entries and the cursor of the next page.
     """
     query = {}
     if level:
@@ -87,8 +91,10 @@ async def read_logs(
     if message:
         query["message"] = {"$regex": message, "$options": "i"}
 
-    logs = await db_utils.find_many("logs", query, limit)
-    return logs
+    try:
+        return await find_page("logs", query, "timestamp", after, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.put("/logs/{log_id}", response_model=LogEntry)
 async def update_log(log_id: str, updated_log: LogEntry):
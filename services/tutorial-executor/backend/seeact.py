@@ -20,13 +20,14 @@ The script is designed to automate complex web qinginteractions, enhancing acces
 
 import argparse
 import asyncio
+import contextlib
 import datetime
 import json
 import logging
 import os
 import warnings
 import time  # 确保导入了 time 模块
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 
 import toml
@@ -37,13 +38,18 @@ from playwright.async_api import async_playwright
 from data_utils.format_prompt_utils import get_index_from_option_name
 from data_utils.prompts import generate_prompt, format_options
 from demo_utils.browser_helper import (normal_launch_async, normal_new_context_async,
-                                       get_interactive_elements_with_playwright, select_option, saveconfig)
-from demo_utils.format_prompt import format_choices, format_ranking_input, postprocess_action_lmm
+                                       get_interactive_elements_with_playwright, get_interactive_elements_bulk,
+                                       select_option, saveconfig, wait_for_page_settle)
+from demo_utils.format_prompt import format_choices, format_ranking_input, postprocess_action_lmm, ranking_cache_keys
 from demo_utils.inference_engine import OpenaiEngine
-from demo_utils.ranking_model import CrossEncoder, find_topk
+from demo_utils.ranking_model import CrossEncoder, RankingEngine
+from demo_utils.screenshot_writer import ScreenshotWriter
 from demo_utils.website_dict import website_dict
-from models.action_record import MongoDBHandler
+from models.action_record import action_recorder
+from task_state import task_state
+from utils.image_utils import ImagePreparer
 from websocket_manager import websocket_manager
+from tracing import StepTrace
 import websockets
 
 # Remove Huggingface internal warnings
@@ -62,64 +68,183 @@ logger.addHandler(handler)
 
 @dataclass
 class SessionControl:
-    pages = []
-    cdp_sessions = []
-    active_page = None
-    active_cdp_session = None
-    context = None
-    browser = None
-
-
-session_control = SessionControl()
-
-async def page_on_close_handler(page):
-    # print("Closed: ", page)
-    if session_control.context:
-        # if True:
-        try:
-            await session_control.active_page.title()
-            # print("Current active page: ", session_control.active_page)
-        except:
-            await aprint("The active tab was closed. Will switch to the last page (or open a new default google page)")
-            # print("All pages:")
-            # print('-' * 10)
-            # print(session_control.context.pages)
-            # print('-' * 10)
-            if session_control.context.pages:
-                session_control.active_page = session_control.context.pages[-1]
-                await session_control.active_page.bring_to_front()
-                await aprint("Switched the active tab to: ", session_control.active_page.url)
-            else:
-                await session_control.context.new_page()
-                try:
-                    await session_control.active_page.goto("https://www.google.com/", wait_until="load")
-                except Exception as e:
-                    pass
-                await aprint("Switched the active tab to: ", session_control.active_page.url)
-
-
-async def page_on_navigatio_handler(frame):
-    session_control.active_page = frame.page
-    # print("Page navigated to:", frame.url)
-    # print("The active tab is set to: ", frame.page.url)
-
-
-async def page_on_crash_handler(page):
-    await aprint("Page crashed:", page.url)
-    await aprint("Try to reload")
-    page.reload()
-
+    """Browser handles of one SeeAct session; the page handlers keep `active_page` pointing at the current tab."""
+    pages: list = field(default_factory=list)
+    cdp_sessions: list = field(default_factory=list)
+    active_page: object = None
+    active_cdp_session: object = None
+    context: object = None
+    browser: object = None
+    pooled: bool = False  # browser is borrowed from cdp_pool and must stay connected
+
+    async def close_context(self):
+        """
+        Close the browser context of this run. A pooled browser shares its default context with later runs, so
+        only the tabs opened by this run are closed and the CDP connection stays up.
+        """
+        context, self.context = self.context, None
+        if context is None:
+            return
+        # The pooled default context outlives this run: detach our handlers so later runs don't trigger them
+        context.remove_listener("page", self.page_on_open_handler)
+        for page in self.pages:
+            page.remove_listener("framenavigated", self.page_on_navigatio_handler)
+            page.remove_listener("close", self.page_on_close_handler)
+            page.remove_listener("crash", self.page_on_crash_handler)
+        if not self.pooled:
+            await context.close()
+            self.pages.clear()
+            return
+        for page in self.pages:
+            if not page.is_closed():
+                await page.close()
+        self.pages.clear()
+
+    async def page_on_close_handler(self, page):
+        # print("Closed: ", page)
+        if self.context:
+            # if True:
+            try:
+                await self.active_page.title()
+                # print("Current active page: ", self.active_page)
+            except:
+                await aprint("The active tab was closed. Will switch to the last page (or open a new default google page)")
+                # print("All pages:")
+                # print('-' * 10)
+                # print(self.context.pages)
+                # print('-' * 10)
+                if self.context.pages:
+                    self.active_page = self.context.pages[-1]
+                    await self.active_page.bring_to_front()
+                    await aprint("Switched the active tab to: ", self.active_page.url)
+                else:
+                    await self.context.new_page()
+                    try:
+                        await self.active_page.goto("https://www.google.com/", wait_until="load")
+                    except Exception as e:
+                        pass
+                    await aprint("Switched the active tab to: ", self.active_page.url)
+
+    async def page_on_navigatio_handler(self, frame):
+        self.active_page = frame.page
+        # print("Page navigated to:", frame.url)
+        # print("The active tab is set to: ", frame.page.url)
+
+    async def page_on_crash_handler(self, page):
+        await aprint("Page crashed:", page.url)
+        await aprint("Try to reload")
+        page.reload()
+
+    async def page_on_open_handler(self, page):
+        # print("Opened: ",page)
+        page.on("framenavigated", self.page_on_navigatio_handler)
+        page.on("close", self.page_on_close_handler)
+        page.on("crash", self.page_on_crash_handler)
+        self.pages.append(page)
+        self.active_page = page
+
+
+def ground_answer(output, elements, choices, candidate_ids):
+    """
+    Map the grounding output of one multi-choice batch to an executable answer.
+    Returns (target_element, target_element_text, target_action, target_value, new_action), or None if the batch
+    did not yield a valid answer.
+    """
+    pred_element, pred_action, pred_value = postprocess_action_lmm(output)
+    if len(pred_element) in [1, 2]:
+        element_id = get_index_from_option_name(pred_element)
+    else:
+        element_id = -1
+
+    if (0 <= element_id < len(candidate_ids) and pred_action.strip() in ["CLICK", "SELECT", "TYPE",
+                                                                         "PRESS ENTER", "HOVER",
+                                                                         "TERMINATE"]):
+        target_element = elements[int(choices[element_id][0])]
+        target_element_text = choices[element_id][1]
+        new_action = "[" + target_element[2] + "]" + " "
+        new_action += target_element[1] + " -> " + pred_action
+        if pred_action.strip() in ["SELECT", "TYPE"]:
+            new_action += ": " + pred_value
+        return target_element, target_element_text, pred_action, pred_value, new_action
+    elif pred_action.strip() in ["PRESS ENTER", "TERMINATE"]:
+        return pred_action, pred_action, pred_action, pred_value, pred_action
+    return None
+
+
+async def capture_batch_screenshot(page, height_start, height_end, total_width, logger, dev_mode=False):
+    """Capture the cropped screenshot covering the elements of one multi-choice batch; returns JPEG bytes or None."""
+    total_height = await page.evaluate('''() => {
+                                        return Math.max(
+                                            document.documentElement.scrollHeight, 
+                                            document.body.scrollHeight,
+                                            document.documentElement.clientHeight
+                                        );
+                                    }''')
+    clip_start = min(total_height - 1144, max(0, height_start - 200))
+    clip_height = min(total_height - clip_start, max(height_end - height_start + 200, 1144))
+    clip = {"x": 0, "y": clip_start, "width": total_width, "height": clip_height}
+    logger.info(f"clip: {clip}")
+    if dev_mode:
+        logger.info(height_start)
+        logger.info(height_end)
+        logger.info(total_height)
+        logger.info(clip)
 
-async def page_on_open_handler(page):
-    # print("Opened: ",page)
-    page.on("framenavigated", page_on_navigatio_handler)
-    page.on("close", page_on_close_handler)
-    page.on("crash", page_on_crash_handler)
-    session_control.active_page = page
+    try:
+        return await page.screenshot(clip=clip, full_page=True, type='jpeg', quality=100, timeout=20000)
+    except Exception as e_clip:
+        logger.info(f"Failed to get cropped screenshot because {e_clip}")
+        return None
 
 
-async def main(config, base_dir, query_: str, url_: str) -> None:
+@dataclass
+class PageState:
+    """Interactive elements of a page and, when a ranker is used, the indices of the top-k candidates."""
+    elements: list
+    topk_indices: object = None
+
+
+async def extract_page_state(page, bulk_element_extraction, trace, ranking_model=None, task=None,
+                             taken_actions=None, top_k=0):
+    """
+    Extract the interactive elements of `page`; with a `ranking_model`, also rank them for `task`. Extraction and
+    ranking are recorded as the `element_extraction` and `ranking` spans of `trace`.
+    """
+    with trace.span("element_extraction"):
+        if bulk_element_extraction:
+            elements = await get_interactive_elements_bulk(page)
+        else:
+            elements = await get_interactive_elements_with_playwright(page)
+    state = PageState(elements=elements)
+    if ranking_model is not None and len(elements) > top_k:
+        with trace.span("ranking", elements=len(elements)):
+            ranking_input = format_ranking_input(elements, task, taken_actions)
+            _, state.topk_indices = await ranking_model.arank(
+                ranking_input, top_k, cache_keys=ranking_cache_keys(elements, ranking_input))
+    return state
+
+
+async def query_batch(generation_model, prompt, image_base64, semaphore, trace):
+    """Run the action generation and grounding turns of one batch, bounded by the fan-out semaphore."""
+    async with semaphore:
+        with trace.span("llm_call", turn=0):
+            output0 = await generation_model.agenerate(prompt=prompt, image_base64=image_base64, turn_number=0)
+        with trace.span("llm_call", turn=1):
+            output = await generation_model.agenerate(prompt=prompt, image_base64=image_base64, turn_number=1,
+                                                      ouput__0=output0)
+    return output0, output
+
+
+async def main(config, base_dir, query_: str, url_: str, client_ip: str = None, session=None, browser=None) -> None:
+    """
+    Run SeeAct for one query. `session` is the session_manager.SeeActSession owning this run; its browser
+    handles, action history and step metrics are kept on the session so concurrent runs never share state.
+    `browser` is a connected browser leased from cdp_pool; without it a new CDP connection is opened for this run.
+    """
     logger_.info(config)
+    session_control = SessionControl(browser=browser, pooled=browser is not None)
+    if session is not None:
+        session.control = session_control
     # basic settings
     is_demo = config["basic"]["is_demo"]
     ranker_path = None
@@ -148,6 +273,13 @@ async def main(config, base_dir, query_: str, url_: str) -> None:
     highlight = config["experiment"]["highlight"]
     monitor = config["experiment"]["monitor"]
     dev_mode = config["experiment"]["dev_mode"]
+    screenshot_writer = ScreenshotWriter(enabled=config["experiment"].get("save_screenshots", True))
+    image_preparer = ImagePreparer.from_config(config.get("image", {}))
+    bulk_element_extraction = config["experiment"].get("bulk_element_extraction", False)
+    page_settle_quiet_ms = config["experiment"].get("page_settle_quiet_ms", 300)
+    page_settle_timeout_ms = config["experiment"].get("page_settle_timeout_ms", 5000)
+    batch_query_mode = config["experiment"].get("batch_query_mode", "sequential")
+    batch_query_fanout = max(1, config["experiment"].get("batch_query_fanout", 4))
 
     try:
         storage_state = config["basic"]["storage_state"]
@@ -189,6 +321,11 @@ async def main(config, base_dir, query_: str, url_: str) -> None:
     if ranker_path:
         ranking_model = CrossEncoder(ranker_path, device=torch.device("cuda" if torch.cuda.is_available() else "cpu"),
                                      num_labels=1, max_length=512, )
+        ranking_model = RankingEngine(ranking_model,
+                                      quantization=config["experiment"].get("ranker_quantization", "int8"),
+                                      max_batch_tokens=config["experiment"].get("ranker_max_batch_tokens", 16384),
+                                      num_threads=config["experiment"].get("ranker_threads", 0),
+                                      use_cache=config["experiment"].get("ranker_cache", True))
 
     if not is_demo:
         with open(f'{task_file_path}', 'r', encoding='utf-8') as file:
@@ -250,9 +387,12 @@ async def main(config, base_dir, query_: str, url_: str) -> None:
         logger.info(f"website: {confirmed_website_url}")
         logger.info(f"task: {confirmed_task}")
         logger.info(f"id: {task_id}")
+        record_task_id = session.session_id if session is not None else task_id
         try:
-            async with async_playwright() as playwright:
-                session_control.browser = await normal_launch_async(playwright)
+            async with contextlib.AsyncExitStack() as browser_stack:
+                if not session_control.pooled:
+                    playwright = await browser_stack.enter_async_context(async_playwright())
+                    session_control.browser = await normal_launch_async(playwright)
                 if session_control.browser is None:
                     logger_.error("浏览器实例不可用，终止执行")
                     return
@@ -269,31 +409,29 @@ async def main(config, base_dir, query_: str, url_: str) -> None:
                 if session_control.context is None:
                     logger_.error("浏览器上下文不可用，终止执行")
                     return
-                session_control.context.on("page", page_on_open_handler)
+                session_control.context.on("page", session_control.page_on_open_handler)
                 await session_control.context.new_page()
                 try:
                     await session_control.active_page.goto(confirmed_website_url, wait_until="load")
                 except Exception as e:
                     logger.info("Failed to fully load the webpage before timeout")
                     logger.info(e)
-                try:
-                    # 等待页面加载完成
-                    await session_control.active_page.wait_for_load_state('load', timeout=5000)
-                    # 如果需要，还可以等待网络请求完成
-                    await session_control.active_page.wait_for_load_state('networkidle', timeout=2000)
-                except Exception as e:
-                    # 如果等待超时，继续执行
-                    pass
-                
-                taken_actions = []
+                # 等待页面稳定（DOM 无变化且无进行中的请求），超时后继续执行
+                await wait_for_page_settle(session_control.active_page, quiet_ms=page_settle_quiet_ms,
+                                           timeout_ms=page_settle_timeout_ms)
+
+                taken_actions = session.taken_actions if session is not None else []
                 complete_flag = False
                 monitor_signal = ""
                 time_step = 0
+                step_number = 0  # 已执行的步骤数，每步加 1（time_step 每轮加 2，只用于文件名与 max_op）
                 no_op_count = 0
                 valid_op_count = 0
 
                 while not complete_flag:
                     step_start_time = time.time()
+                    prepared_images = []
+                    trace = StepTrace(session.session_id if session is not None else task_id, time_step)
                     if dev_mode:
                         logger.info(f"Page at the start: {session_control.active_page}")
                     await session_control.active_page.bring_to_front()
@@ -301,7 +439,9 @@ async def main(config, base_dir, query_: str, url_: str) -> None:
                     logger.info("=" * terminal_width)
                     logger.info(f"Time step: {time_step}")
                     logger.info('-' * 10)
-                    elements = await get_interactive_elements_with_playwright(session_control.active_page)
+                    page_state = await extract_page_state(session_control.active_page, bulk_element_extraction,
+                                                          trace, ranking_model, confirmed_task, taken_actions, top_k)
+                    elements = page_state.elements
 
                     if tracing:
                         await session_control.context.tracing.start_chunk(title=f'{task_id}-Time Step-{time_step}',
@@ -362,19 +502,11 @@ async def main(config, base_dir, query_: str, url_: str) -> None:
                         logger.removeHandler(log_fh)
                         logger.removeHandler(console_handler)
 
-                        close_context = session_control.context
-                        session_control.context = None
-                        await close_context.close()
+                        await session_control.close_context()
                         complete_flag = True
                         continue
-                    if ranker_path and len(elements) > top_k:
-                        ranking_input = format_ranking_input(elements, confirmed_task, taken_actions)
-                        logger.info("Start to rank")
-                        pred_scores = ranking_model.predict(ranking_input, convert_to_numpy=True,
-                                                            show_progress_bar=False,
-                                                            batch_size=100, )
-                        topk_values, topk_indices = find_topk(pred_scores, k=min(top_k, len(elements)))
-                        all_candidate_ids = list(topk_indices)
+                    if page_state.topk_indices is not None:
+                        all_candidate_ids = list(page_state.topk_indices)
                         ranked_elements = [elements[i] for i in all_candidate_ids]
                     else:
 
@@ -429,131 +561,166 @@ async def main(config, base_dir, query_: str, url_: str) -> None:
                     new_action = ""
                     target_action = "CLICK"
                     target_value = ""
+                    target_element_text = ""
                     query_count = 0
                     got_one_answer = False
 
-                    for multichoice_i in range(0, num_choices, step_length):
-                        logger.info("-" * 10)
-                        logger.info(f"Start Multi-Choice QA - Batch {multichoice_i // step_length}")
-                        input_image_path = os.path.join(main_result_path, 'image_inputs',
-                                                        f'{time_step}_{multichoice_i // step_length}_crop.jpg')
-
-                        height_start = all_candidate_ids_with_location[multichoice_i][1]
-                        height_end = all_candidate_ids_with_location[min(multichoice_i + step_length, num_choices) - 1][
-                            1]
-
-                        total_height = await session_control.active_page.evaluate('''() => {
-                                                                        return Math.max(
-                                                                            document.documentElement.scrollHeight, 
-                                                                            document.body.scrollHeight,
-                                                                            document.documentElement.clientHeight
-                                                                        );
-                                                                    }''')
-                        clip_start = min(total_height - 1144, max(0, height_start - 200))
-                        clip_height = min(total_height - clip_start, max(height_end - height_start + 200, 1144))
-                        clip = {"x": 0, "y": clip_start, "width": total_width, "height": clip_height}
-                        logger.info(f"clip: {clip}")
-                        if dev_mode:
-                            logger.info(height_start)
-                            logger.info(height_end)
-                            logger.info(total_height)
-                            logger.info(clip)
+                    batch_starts = list(range(0, num_choices, step_length))
+                    if batch_query_mode == "parallel" and len(batch_starts) > 1:
+                        # Speculative-parallel mode: capture every batch screenshot up front, query all batches
+                        # concurrently, and take the earliest batch in page order that yields a valid answer.
+                        semaphore = asyncio.Semaphore(batch_query_fanout)
+                        batch_queries = []
+                        for multichoice_i in batch_starts:
+                            input_image_path = os.path.join(main_result_path, 'image_inputs',
+                                                            f'{time_step}_{multichoice_i // step_length}_crop.jpg')
+                            height_start = all_candidate_ids_with_location[multichoice_i][1]
+                            height_end = all_candidate_ids_with_location[
+                                min(multichoice_i + step_length, num_choices) - 1][1]
+                            with trace.span("screenshot"):
+                                screenshot = await capture_batch_screenshot(session_control.active_page, height_start,
+                                                                            height_end, total_width, logger, dev_mode)
+                                if screenshot is not None:
+                                    prepared = await asyncio.to_thread(image_preparer.prepare, screenshot)
+                            if screenshot is None:
+                                if dev_mode:
+                                    logger.info("No screenshot")
+                                continue
+                            screenshot_writer.submit(input_image_path, screenshot)
+                            prepared_images.append(prepared)
+                            image_base64 = prepared.images
+                            with trace.span("prompt_build"):
+                                candidate_ids = all_candidate_ids[multichoice_i:multichoice_i + step_length]
+                                choices = format_choices(elements, candidate_ids, confirmed_task, taken_actions)
+                                prompt = generate_prompt(task=confirmed_task, previous=taken_actions, choices=choices,
+                                                         experiment_split="SeeAct")
+                            screenshot_writer.submit(input_image_path.replace('_crop.jpg', '_prompt.json'),
+                                                     json.dumps(prompt, ensure_ascii=False).encode('utf-8'))
+                            batch_queries.append((multichoice_i, choices, candidate_ids, asyncio.create_task(
+                                query_batch(generation_model, prompt, image_base64, semaphore, trace))))
+                        logger.info(f"Query {len(batch_queries)} batches concurrently, fan-out: {batch_query_fanout}")
 
+                        generate_start_time = time.time()
                         try:
-                            await session_control.active_page.screenshot(path=input_image_path, clip=clip,
-                                                                         full_page=True,
-                                                                         type='jpeg', quality=100, timeout=20000)
-                        except Exception as e_clip:
-                            logger.info(f"Failed to get cropped screenshot because {e_clip}")
+                            for multichoice_i, choices, candidate_ids, batch_task in batch_queries:
+                                query_count += 1
+                                try:
+                                    output0, output = await batch_task
+                                except Exception as e_query:
+                                    logger.info(f"Batch {multichoice_i // step_length} failed because {e_query}")
+                                    continue
+                                logger.info("-" * 10)
+                                logger.info(f"Multi-Choice QA - Batch {multichoice_i // step_length}")
+                                logger.info("🤖Action Generation Output🤖")
+                                for line in output0.split('\n'):
+                                    logger.info(line)
+                                logger.info("-" * 10)
+                                choice_text = f"(Multichoice Question) - Batch {multichoice_i // step_length}" + "\n" + format_options(
+                                    choices)
+                                for line in choice_text.replace("\n\n", "").split('\n'):
+                                    logger.info(line)
+                                logger.info("-" * 10)
+                                logger.info("🤖Grounding Output🤖")
+                                for line in output.split('\n'):
+                                    logger.info(line)
+                                answer = ground_answer(output, elements, choices, candidate_ids)
+                                if answer:
+                                    target_element, target_element_text, target_action, target_value, new_action = answer
+                                    got_one_answer = True
+                                    break
+                        finally:
+                            # 取消仍在进行的后续批次查询
+                            pending_tasks = [batch_query[-1] for batch_query in batch_queries]
+                            for batch_task in pending_tasks:
+                                batch_task.cancel()
+                            await asyncio.gather(*pending_tasks, return_exceptions=True)
+                        logger.info(f"generate_time: {time.time() - generate_start_time}")
+                    else:
+                        for multichoice_i in range(0, num_choices, step_length):
+                            logger.info("-" * 10)
+                            logger.info(f"Start Multi-Choice QA - Batch {multichoice_i // step_length}")
+                            input_image_path = os.path.join(main_result_path, 'image_inputs',
+                                                            f'{time_step}_{multichoice_i // step_length}_crop.jpg')
+
+                            height_start = all_candidate_ids_with_location[multichoice_i][1]
+                            height_end = all_candidate_ids_with_location[min(multichoice_i + step_length, num_choices) - 1][
+                                1]
+                            with trace.span("screenshot"):
+                                screenshot = await capture_batch_screenshot(session_control.active_page, height_start,
+                                                                            height_end, total_width, logger, dev_mode)
+                                if screenshot is not None:
+                                    prepared = await asyncio.to_thread(image_preparer.prepare, screenshot)
 
-                        if dev_mode:
-                            logger.info(multichoice_i)
-                        if not os.path.exists(input_image_path):
                             if dev_mode:
-                                logger.info("No screenshot")
-                            continue
-                        candidate_ids = all_candidate_ids[multichoice_i:multichoice_i + step_length]
-                        choices = format_choices(elements, candidate_ids, confirmed_task, taken_actions)
-                        query_count += 1
-                        # Format prompts for LLM inference
-                        prompt = generate_prompt(task=confirmed_task, previous=taken_actions, choices=choices,
-                                                 experiment_split="SeeAct")
-                        # if dev_mode:
-                        #     for prompt_i in prompt:
-                        #         logger.info(prompt_i)
-                        # logger.info(f"prompt: {prompt}")
-                        # logger.info(f"input_image_path: {input_image_path}")
-                        logger.info("into generate")
-                        generate_start_time = time.time()
-                        output0 = generation_model.generate(prompt=prompt, image_path=input_image_path, turn_number=0)
-                        generate_end_time = time.time()
-                        logger.info(f"generate_start_time: {generate_start_time}")
-                        logger.info(f"generate_end_time: {generate_end_time}")
-                        logger.info(f"generate_time: {generate_end_time - generate_start_time}")
-                        # logger.info(f"out of generate, output0: {output0}")
-                        # print("output0: ", output0)
-                        terminal_width = 10
-                        logger.info("-" * terminal_width)
-                        logger.info("🤖Action Generation Output🤖")
-
-                        # logger.info(output0)
-
-                        for line in output0.split('\n'):
-                            logger.info(line)
-
-                        terminal_width = 10
-                        logger.info("-" * (terminal_width))
-
-                        choice_text = f"(Multichoice Question) - Batch {multichoice_i // step_length}" + "\n" + format_options(
-                            choices)
-                        choice_text = choice_text.replace("\n\n", "")
-
-                        for line in choice_text.split('\n'):
-                            logger.info(line)
-                        # logger.info(choice_text)
-
-                        output = generation_model.generate(prompt=prompt, image_path=input_image_path, turn_number=1,
-                                                           ouput__0=output0)
-
-                        terminal_width = 10
-                        logger.info("-" * terminal_width)
-                        logger.info("🤖Grounding Output🤖")
-
-                        for line in output.split('\n'):
-                            logger.info(line)
-                        # logger.info(output)
-                        pred_element, pred_action, pred_value = postprocess_action_lmm(output)
-                        if len(pred_element) in [1, 2]:
-                            element_id = get_index_from_option_name(pred_element)
-                        else:
-                            element_id = -1
-
-                        # Process the elements
-                        if (0 <= element_id < len(candidate_ids) and pred_action.strip() in ["CLICK", "SELECT", "TYPE",
-                                                                                             "PRESS ENTER", "HOVER",
-                                                                                             "TERMINATE"]):
-                            target_element = elements[int(choices[element_id][0])]
-                            target_element_text = choices[element_id][1]
-                            target_action = pred_action
-                            target_value = pred_value
-                            new_action += "[" + target_element[2] + "]" + " "
-                            new_action += target_element[1] + " -> " + target_action
-                            if target_action.strip() in ["SELECT", "TYPE"]:
-                                new_action += ": " + target_value
-                            got_one_answer = True
-                            break
-                        elif pred_action.strip() in ["PRESS ENTER", "TERMINATE"]:
-                            target_element = pred_action
-                            target_element_text = target_element
-                            target_action = pred_action
-                            target_value = pred_value
-                            new_action += target_action
-                            if target_action.strip() in ["SELECT", "TYPE"]:
-                                new_action += ": " + target_value
-                            got_one_answer = True
-                            break
-                        else:
-                            pass
+                                logger.info(multichoice_i)
+                            if screenshot is None:
+                                if dev_mode:
+                                    logger.info("No screenshot")
+                                continue
+                            screenshot_writer.submit(input_image_path, screenshot)
+                            prepared_images.append(prepared)
+                            image_base64 = prepared.images
+                            query_count += 1
+                            # Format prompts for LLM inference
+                            with trace.span("prompt_build"):
+                                candidate_ids = all_candidate_ids[multichoice_i:multichoice_i + step_length]
+                                choices = format_choices(elements, candidate_ids, confirmed_task, taken_actions)
+                                prompt = generate_prompt(task=confirmed_task, previous=taken_actions, choices=choices,
+                                                         experiment_split="SeeAct")
+                            screenshot_writer.submit(input_image_path.replace('_crop.jpg', '_prompt.json'),
+                                                     json.dumps(prompt, ensure_ascii=False).encode('utf-8'))
+                            # if dev_mode:
+                            #     for prompt_i in prompt:
+                            #         logger.info(prompt_i)
+                            # logger.info(f"prompt: {prompt}")
+                            # logger.info(f"input_image_path: {input_image_path}")
+                            logger.info("into generate")
+                            generate_start_time = time.time()
+                            with trace.span("llm_call", turn=0):
+                                output0 = await generation_model.agenerate(prompt=prompt, image_base64=image_base64,
+                                                                           turn_number=0)
+                            generate_end_time = time.time()
+                            logger.info(f"generate_start_time: {generate_start_time}")
+                            logger.info(f"generate_end_time: {generate_end_time}")
+                            logger.info(f"generate_time: {generate_end_time - generate_start_time}")
+                            # logger.info(f"out of generate, output0: {output0}")
+                            # print("output0: ", output0)
+                            terminal_width = 10
+                            logger.info("-" * terminal_width)
+                            logger.info("🤖Action Generation Output🤖")
+
+                            # logger.info(output0)
+
+                            for line in output0.split('\n'):
+                                logger.info(line)
+
+                            terminal_width = 10
+                            logger.info("-" * (terminal_width))
+
+                            choice_text = f"(Multichoice Question) - Batch {multichoice_i // step_length}" + "\n" + format_options(
+                                choices)
+                            choice_text = choice_text.replace("\n\n", "")
+
+                            for line in choice_text.split('\n'):
+                                logger.info(line)
+                            # logger.info(choice_text)
+
+                            with trace.span("llm_call", turn=1):
+                                output = await generation_model.agenerate(prompt=prompt, image_base64=image_base64,
+                                                                          turn_number=1, ouput__0=output0)
+
+                            terminal_width = 10
+                            logger.info("-" * terminal_width)
+                            logger.info("🤖Grounding Output🤖")
+
+                            for line in output.split('\n'):
+                                logger.info(line)
+                            # logger.info(output)
+                            answer = ground_answer(output, elements, choices, candidate_ids)
+                            if answer:
+                                target_element, target_element_text, target_action, target_value, new_action = answer
+                                got_one_answer = True
+                                break
 
                     if got_one_answer:
                         # 发送操作指令
@@ -572,10 +739,14 @@ async def main(config, base_dir, query_: str, url_: str) -> None:
                         
                         # 发送操作数据到WebSocket
                         try:
-                            await websocket_manager.send_message(json.dumps(action_data))
-                            
-                            # 等待用户通过扩展界面的响应
-                            response = await websocket_manager.wait_for_response()
+                            with trace.span("ws_confirmation"):
+                                # 只发送给当前会话对应的扩展客户端，并通过 messageId 匹配响应
+                                message_id = await websocket_manager.send_message(
+                                    action_data, client_id=client_ip,
+                                    session_id=session.session_id if session is not None else None)
+
+                                # 等待用户通过扩展界面的响应
+                                response = await websocket_manager.wait_for_response(message_id)
                             
                             if response.get("type") == "EXIT_ACTION":
                                 # 用户选择退出
@@ -631,6 +802,7 @@ async def main(config, base_dir, query_: str, url_: str) -> None:
                         # Perform browser action with PlayWright
                         # The code is complex to handle all kinds of cases in execution
                         # It's ugly, but it works, so far
+                        trace.start("action_execution", action=target_action)
                         selector = None
                         fail_to_execute = False
                         try:
@@ -645,7 +817,10 @@ async def main(config, base_dir, query_: str, url_: str) -> None:
                                         await selector.scroll_into_view_if_needed(timeout=3000)
                                         if highlight:
                                             await selector.highlight()
-                                            await asyncio.sleep(2.5)
+                                            # 等待滚动触发的懒加载等变化稳定，而非固定等待
+                                            await wait_for_page_settle(session_control.active_page,
+                                                                       quiet_ms=page_settle_quiet_ms,
+                                                                       timeout_ms=2500)
                                     except Exception as e:
                                         pass
 
@@ -847,10 +1022,6 @@ async def main(config, base_dir, query_: str, url_: str) -> None:
                                 logger.info("Try performing a PRESS ENTER")
                                 await session_control.active_page.keyboard.press('Enter')
                             no_op_count = 0
-                            try:
-                                await session_control.active_page.wait_for_load_state('load')
-                            except Exception as e:
-                                pass
                         except Exception as e:
                             if target_action not in ["TYPE", "SELECT"]:
                                 new_action = f"Failed to {target_action} {target_element_text} because {e}"
@@ -858,6 +1029,7 @@ async def main(config, base_dir, query_: str, url_: str) -> None:
                             else:
                                 new_action = f"Failed to {target_action} {target_value} for {target_element_text} because {e}"
                             fail_to_execute = True
+                        trace.end("action_execution")
 
                         if new_action == "" or fail_to_execute:
                             if new_action == "":
@@ -872,17 +1044,16 @@ async def main(config, base_dir, query_: str, url_: str) -> None:
                             except Exception as e:
                                 pass
 
+                        trace.start("page_settle")
                         if monitor_signal == 'pause':
                             pass
                         else:
-                            try:
-                                # 等待页面加载完成
-                                await session_control.active_page.wait_for_load_state('load', timeout=5000)
-                                # 如果需要，还可以等待网络请求完成
-                                await session_control.active_page.wait_for_load_state('networkidle', timeout=2000)
-                            except Exception as e:
-                                # 如果等待超时，继续执行
-                                pass
+                            # 等待页面稳定（DOM 无变化且无进行中的请求），超时后继续执行
+                            settled = await wait_for_page_settle(session_control.active_page,
+                                                                 quiet_ms=page_settle_quiet_ms,
+                                                                 timeout_ms=page_settle_timeout_ms)
+                            if not settled:
+                                logger.info(f"Page did not settle within {page_settle_timeout_ms} ms")
                         if dev_mode:
                             logger.info(f"current active page: {session_control.active_page}")
 
@@ -894,11 +1065,7 @@ async def main(config, base_dir, query_: str, url_: str) -> None:
                             logger.info("All pages")
                             logger.info(session_control.context.pages)
                             logger.info("-" * 10)
-                        try:
-                            await session_control.active_page.wait_for_load_state('load')
-                        except Exception as e:
-                            if dev_mode:
-                                logger.info(e)
+                        trace.end("page_settle")
                         if tracing:
                             logger.info("Save playwright trace file")
                             await session_control.context.tracing.stop_chunk(
@@ -938,31 +1105,51 @@ async def main(config, base_dir, query_: str, url_: str) -> None:
                         logger.info("Close browser context")
                         logger.removeHandler(log_fh)
                         logger.removeHandler(console_handler)
-                        close_context = session_control.context
-                        session_control.context = None
-                        await close_context.close()
+                        await session_control.close_context()
 
                         complete_flag = True
 
                     step_end_time = time.time()
-                    logger_.info(f"Step {time_step} 总用时: {step_end_time - step_start_time:.2f} 秒")
+                    step_number += 1
+                    step_phases = trace.finish()
+                    logger_.info(f"Step {time_step} 总用时: {step_end_time - step_start_time:.2f} 秒, 各阶段: {step_phases}")
+                    if session is not None:
+                        session.record_step(step_end_time - step_start_time, step_phases)
+                        await task_state.record_step(session.session_id, step_number, new_action,
+                                                     step_end_time - step_start_time,
+                                                     session.metrics.total_step_time)
+                    if prepared_images:
+                        original_bytes = sum(prepared.original_bytes for prepared in prepared_images)
+                        prepared_bytes = sum(prepared.prepared_bytes for prepared in prepared_images)
+                        prepare_time = sum(prepared.elapsed for prepared in prepared_images)
+                        logger_.info(f"Step {time_step} 截图: {original_bytes / 1024:.1f} KB -> "
+                                     f"{prepared_bytes / 1024:.1f} KB, 约 "
+                                     f"{sum(prepared.tokens for prepared in prepared_images)} tokens, "
+                                     f"预处理用时 {prepare_time:.3f} 秒")
+                        if session is not None:
+                            session.record_images(original_bytes, prepared_bytes, prepare_time)
+
+                    # 保存到 MongoDB（只写入缓冲区，由 action_recorder 在后台批量写入）
+                    await action_recorder.save_action(
+                        userID=session.user_id if session is not None else None,
+                        selected_option=target_element_text,
+                        action=target_action,
+                        value=target_value,
+                        task_id=record_task_id,
+                        step_number=step_number,
+                        execution_time=step_end_time - step_start_time,
+                        description=new_action,
+                        url=session_control.active_page.url if session_control.active_page else None
+                    )
                     time_step += 1
-
-                    # TODO: 存储到MongoDB
-                    selected_option, action, value = postprocess_action_lmm(output)
-
-                    # 保存到 MongoDB
-                    execution_time = time.time() - step_start_time
-                    # TODO: 保存到MongoDB
-                    # await self.mongodb.save_action(
-                    #     selected_option=selected_option,
-                    #     action=action,
-                    #     value=value,
-                    #     task_id=task_id,  # 需要从某处获取
-                    #     step_number=time_step,
-                    #     execution_time=execution_time
-                    # )
         finally:
+            # 会话结束时写入本会话剩余的操作记录
+            await action_recorder.flush(record_task_id)
+            # 提前返回或出错时也要释放连接池与线程池；下一个任务使用时会重新创建
+            await screenshot_writer.close()
+            await generation_model.aclose()
+            if ranking_model is not None:
+                ranking_model.close()
             # TODO: 断开与WebSocket服务器的连接
 
             logger_.info("已断开与WebSocket服务器的连接")
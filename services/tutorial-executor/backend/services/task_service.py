@@ -1,6 +1,7 @@
 from fastapi import BackgroundTasks, HTTPException
 from .browser_service import browser_service
 from playwright.async_api import Page, ElementHandle, TimeoutError
+from demo_utils.browser_helper import wait_for_page_settle
 import asyncio
 from models.task import Task, create_task, get_task, update_task
 from loguru import logger
@@ -91,7 +92,7 @@ class TaskService:
                             await db.commit()
                         return {"status": "failed", "error": error_message}
                     
-                    await page.wait_for_timeout(500)  # Wait briefly between actions
+                    await wait_for_page_settle(page, quiet_ms=200, timeout_ms=2000)  # Wait until the page is stable between actions
 
             # 保存截图
             screenshot_path = f"screenshots/{task_details['task_id']}.png"
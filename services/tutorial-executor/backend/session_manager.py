@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from task_state import task_state
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# 同时运行的 SeeAct 会话上限，超过上限的会话排队等待
+MAX_CONCURRENT_SESSIONS = int(os.getenv("MAX_CONCURRENT_SESSIONS", "4"))
+# 保留的已结束会话数量，用于查询指标
+SESSION_HISTORY_LIMIT = int(os.getenv("SESSION_HISTORY_LIMIT", "100"))
+
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+
+@dataclass
+class SessionMetrics:
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    steps: int = 0
+    total_step_time: float = 0.0
+    last_step_time: Optional[float] = None
+    last_step_phases: Dict[str, float] = field(default_factory=dict)
+    image_bytes_original: int = 0
+    image_bytes_sent: int = 0
+    image_prepare_time: float = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        now = time.time()
+        queue_wait = (self.started_at or now) - self.created_at
+        run_time = (self.finished_at or now) - self.started_at if self.started_at else 0.0
+        return {
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "queue_wait": round(queue_wait, 3),
+            "run_time": round(run_time, 3),
+            "steps": self.steps,
+            "last_step_time": self.last_step_time,
+            "last_step_phases": self.last_step_phases,
+            "avg_step_time": round(self.total_step_time / self.steps, 3) if self.steps else None,
+            "image_bytes_sent": self.image_bytes_sent,
+            "image_bytes_saved": self.image_bytes_original - self.image_bytes_sent,
+            "image_prepare_time": round(self.image_prepare_time, 3),
+        }
+
+
+@dataclass
+class SeeActSession:
+    """Per-session state of one SeeAct run: browser handles, action history and execution flags."""
+    session_id: str
+    query: str
+    url: str
+    client_ip: Optional[str] = None
+    user_id: Optional[int] = None  # user-manager 的 userID，未提供时操作记录不关联用户
+    status: str = "queued"  # queued / running / completed / failed / cancelled
+    error: Optional[str] = None
+    auto_execute: bool = False
+    taken_actions: List[str] = field(default_factory=list)
+    task_queue: List[Any] = field(default_factory=list)
+    control: Any = None  # seeact.SessionControl, attached when the run starts
+    metrics: SessionMetrics = field(default_factory=SessionMetrics)
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def record_step(self, duration: float, phases: Optional[Dict[str, float]] = None):
+        self.metrics.steps += 1
+        self.metrics.total_step_time += duration
+        self.metrics.last_step_time = round(duration, 3)
+        self.metrics.last_step_phases = phases or {}
+
+    def record_images(self, original_bytes: int, sent_bytes: int, prepare_time: float):
+        self.metrics.image_bytes_original += original_bytes
+        self.metrics.image_bytes_sent += sent_bytes
+        self.metrics.image_prepare_time += prepare_time
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "client_ip": self.client_ip,
+            "user_id": self.user_id,
+            "query": self.query,
+            "url": self.url,
+            "status": self.status,
+            "error": self.error,
+            "auto_execute": self.auto_execute,
+            "num_actions": len(self.taken_actions),
+            "metrics": self.metrics.as_dict(),
+        }
+
+
+class SessionRegistry:
+    """
+    Registry of SeeAct sessions keyed by session ID.
+
+    At most `max_sessions` sessions run at the same time; sessions submitted beyond the cap stay
+    "queued" until a running session finishes.
+    """
+
+    def __init__(self, max_sessions: int = MAX_CONCURRENT_SESSIONS, history_limit: int = SESSION_HISTORY_LIMIT):
+        self.max_sessions = max_sessions
+        self.history_limit = history_limit
+        self.sessions: Dict[str, SeeActSession] = {}
+        self._slots = asyncio.Semaphore(max_sessions)
+
+    def create(self, query: str, url: str, client_ip: Optional[str] = None,
+               session_id: Optional[str] = None, user_id: Optional[int] = None) -> SeeActSession:
+        session_id = session_id or uuid.uuid4().hex
+        if session_id in self.sessions and not self.sessions[session_id].finished:
+            raise ValueError(f"会话 {session_id} 已存在且仍在运行")
+        session = SeeActSession(session_id=session_id, query=query, url=url, client_ip=client_ip,
+                                user_id=user_id)
+        self.sessions[session_id] = session
+        self._prune()
+        return session
+
+    def get(self, session_id: str) -> Optional[SeeActSession]:
+        return self.sessions.get(session_id)
+
+    def find_by_client(self, client_ip: str) -> Optional[SeeActSession]:
+        """Return the most recent unfinished session of a client."""
+        for session in reversed(list(self.sessions.values())):
+            if session.client_ip == client_ip and not session.finished:
+                return session
+        return None
+
+    def submit(self, session: SeeActSession, runner: Callable[[SeeActSession], Awaitable[Any]]) -> SeeActSession:
+        session.task = asyncio.create_task(self._run(session, runner))
+        return session
+
+    async def _run(self, session: SeeActSession, runner: Callable[[SeeActSession], Awaitable[Any]]):
+        if self.running_count >= self.max_sessions:
+            logger.info(f"会话 {session.session_id} 排队中，当前运行 {self.running_count}/{self.max_sessions}")
+        async with self._slots:
+            session.status = "running"
+            session.metrics.started_at = time.time()
+            logger.info(f"会话 {session.session_id} 开始运行")
+            await task_state.start(session)
+            try:
+                await runner(session)
+                session.status = "completed"
+            except asyncio.CancelledError:
+                session.status = "cancelled"
+                raise
+            except Exception as e:
+                session.status = "failed"
+                session.error = str(e)
+                logger.error(f"会话 {session.session_id} 执行失败: {e}")
+            finally:
+                session.metrics.finished_at = time.time()
+                logger.info(f"会话 {session.session_id} 结束，状态: {session.status}")
+                await task_state.finish(session)
+
+    def cancel(self, session_id: str) -> bool:
+        session = self.sessions.get(session_id)
+        if not session or session.finished or session.task is None:
+            return False
+        session.task.cancel()
+        if session.status == "queued":
+            session.status = "cancelled"
+        return True
+
+    async def shutdown(self):
+        tasks = [session.task for session in self.sessions.values() if session.task and not session.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    @property
+    def running_count(self) -> int:
+        return sum(1 for session in self.sessions.values() if session.status == "running")
+
+    @property
+    def queued_count(self) -> int:
+        return sum(1 for session in self.sessions.values() if session.status == "queued")
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "max_sessions": self.max_sessions,
+            "running": self.running_count,
+            "queued": self.queued_count,
+            "sessions": [session.summary() for session in self.sessions.values()],
+        }
+
+    def _prune(self):
+        finished = [session_id for session_id, session in self.sessions.items() if session.finished]
+        for session_id in finished[:max(0, len(finished) - self.history_limit)]:
+            del self.sessions[session_id]
+
+
+# 创建全局实例
+session_registry = SessionRegistry()
@@ -0,0 +1,131 @@
+import json
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+from utils.redis_client import REDIS_MAX_SUBSCRIBERS, REDIS_URL, get_async_pubsub_client, get_async_redis_client
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# 任务状态在最后一次更新后于 Redis 中保留的秒数
+TASK_STATE_TTL = int(os.getenv("TASK_STATE_TTL", "86400"))
+# Redis 出错后暂停写入的秒数，避免每一步都等待连接超时
+TASK_STATE_BACKOFF = float(os.getenv("TASK_STATE_BACKOFF", "30"))
+
+KEY_PREFIX = "task_state:"
+EVENTS_CHANNEL = "task_state:events"
+
+
+class TaskStateStore:
+    """
+    Live task state in Redis, one hash per session (`task_state:<session_id>`): status, step counter, current
+    action, latency so far and the terminal status.
+
+    Every update writes the hash and publishes the changed fields on `task_state:<session_id>` and on
+    `task_state:events` in one pipelined round trip, so the frontend or the WebSocket layer can subscribe to
+    progress instead of polling. Updates are best effort: when Redis is unreachable they are skipped for
+    `TASK_STATE_BACKOFF` seconds and never fail the session. Subscribers use a separate connection pool and are
+    capped at `max_subscribers`.
+    """
+
+    def __init__(self, url: Optional[str] = REDIS_URL, ttl: int = TASK_STATE_TTL,
+                 max_subscribers: int = REDIS_MAX_SUBSCRIBERS):
+        self.enabled = bool(url)
+        self.url = url
+        self.ttl = ttl
+        self.max_subscribers = max_subscribers
+        self.subscribers = 0
+        self._disabled_until = 0.0
+        self.stats = {"updates": 0, "errors": 0, "skipped": 0}
+
+    @property
+    def redis(self):
+        return get_async_redis_client(self.url)
+
+    @staticmethod
+    def key(session_id: str) -> str:
+        return f"{KEY_PREFIX}{session_id}"
+
+    async def _update(self, session_id: str, fields: Dict[str, Any]):
+        if not self.enabled:
+            return
+        if time.monotonic() < self._disabled_until:
+            self.stats["skipped"] += 1
+            return
+        fields = {name: value for name, value in fields.items() if value is not None}
+        fields["updated_at"] = time.time()
+        event = json.dumps({"session_id": session_id, **fields}, ensure_ascii=False, default=str)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hset(self.key(session_id), mapping={name: str(value) for name, value in fields.items()})
+                # 每次更新都续期，进程异常退出时未结束的状态也会过期
+                pipe.expire(self.key(session_id), self.ttl)
+                pipe.publish(self.key(session_id), event)
+                pipe.publish(EVENTS_CHANNEL, event)
+                await pipe.execute()
+            self.stats["updates"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            self._disabled_until = time.monotonic() + TASK_STATE_BACKOFF
+            logger.warning(f"写入 Redis 任务状态失败，{TASK_STATE_BACKOFF} 秒内跳过: {e}")
+
+    async def start(self, session):
+        await self._update(session.session_id, {
+            "status": session.status, "query": session.query, "url": session.url, "client_ip": session.client_ip,
+            "step": 0, "latency": 0.0, "started_at": session.metrics.started_at,
+        })
+
+    async def record_step(self, session_id: str, step: int, action: str, duration: float, latency: float):
+        await self._update(session_id, {
+            "step": step, "current_action": action, "last_step_latency": round(duration, 3),
+            "latency": round(latency, 3),
+        })
+
+    async def finish(self, session):
+        await self._update(session.session_id, {
+            "status": session.status, "error": session.error, "step": session.metrics.steps,
+            "latency": round(session.metrics.total_step_time, 3), "finished_at": session.metrics.finished_at,
+        })
+
+    async def get(self, session_id: str) -> Optional[Dict[str, str]]:
+        """Current state of a session, or None if unknown or Redis is unavailable (callers fall back to MongoDB)."""
+        if not self.enabled:
+            return None
+        if time.monotonic() < self._disabled_until:
+            self.stats["skipped"] += 1
+            return None
+        try:
+            state = await self.redis.hgetall(self.key(session_id))
+        except Exception as e:
+            self.stats["errors"] += 1
+            self._disabled_until = time.monotonic() + TASK_STATE_BACKOFF
+            logger.warning(f"读取 Redis 任务状态失败，{TASK_STATE_BACKOFF} 秒内跳过: {e}")
+            return None
+        return state or None
+
+    async def subscribe(self, session_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield state updates of one session (or of all sessions) as they are published. Check `subscribers_full`
+        before starting a subscription; the pub/sub pool refuses connections beyond `max_subscribers`.
+        """
+        pubsub = get_async_pubsub_client(self.url).pubsub()
+        channel = self.key(session_id) if session_id else EVENTS_CHANNEL
+        self.subscribers += 1
+        try:
+            await pubsub.subscribe(channel)
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    yield json.loads(message["data"])
+        finally:
+            self.subscribers -= 1
+            await pubsub.aclose()
+
+    @property
+    def subscribers_full(self) -> bool:
+        return self.subscribers >= self.max_subscribers
+
+
+# 创建全局实例
+task_state = TaskStateStore()
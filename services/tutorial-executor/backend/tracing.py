@@ -0,0 +1,118 @@
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from prometheus_client import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# 单步耗时预算（秒），超出时计数并打印各阶段耗时
+STEP_BUDGET_SECONDS = float(os.getenv("STEP_BUDGET_SECONDS", "10"))
+
+STEP_PHASES = ("element_extraction", "ranking", "screenshot", "prompt_build", "llm_call", "ws_confirmation",
+               "action_execution", "page_settle")
+
+STEP_PHASE_SECONDS = Histogram(
+    "seeact_step_phase_seconds", "Duration of one phase of a SeeAct step", ["phase"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 7.5, 10, 15, 30, 60),
+)
+STEP_SECONDS = Histogram(
+    "seeact_step_seconds", "Duration of one SeeAct step",
+    buckets=(1, 2, 3, 5, 7.5, 10, 12.5, 15, 20, 30, 60, 120),
+)
+STEP_BUDGET_EXCEEDED = Counter(
+    "seeact_step_budget_exceeded_total", "SeeAct steps slower than STEP_BUDGET_SECONDS",
+)
+
+
+@dataclass
+class Span:
+    phase: str
+    start: float
+    end: Optional[float] = None
+    span_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+
+class StepTrace:
+    """
+    Spans of one SeeAct step. Each finished span is observed in the phase histogram right away; `finish`
+    observes the step histogram and returns the time spent per phase.
+
+    Use `span` around short blocks, or `start` / `end` when a phase covers a long stretch of code.
+    """
+
+    def __init__(self, session_id: Optional[str] = None, step: int = 0):
+        self.trace_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.step = step
+        self.start_time = time.perf_counter()
+        self.spans: List[Span] = []
+        self._open: Dict[str, Span] = {}
+
+    @contextmanager
+    def span(self, phase: str, **attributes):
+        span = self.start(phase, **attributes)
+        try:
+            yield span
+        finally:
+            self._close(span)
+
+    def start(self, phase: str, **attributes) -> Span:
+        span = Span(phase=phase, start=time.perf_counter(), attributes=attributes)
+        self.spans.append(span)
+        self._open[phase] = span
+        return span
+
+    def end(self, phase: str):
+        span = self._open.get(phase)
+        if span is not None:
+            self._close(span)
+
+    def _close(self, span: Span):
+        if span.end is not None:
+            return
+        span.end = time.perf_counter()
+        if self._open.get(span.phase) is span:
+            del self._open[span.phase]
+        STEP_PHASE_SECONDS.labels(phase=span.phase).observe(span.duration)
+
+    def phase_totals(self) -> Dict[str, float]:
+        """
+        Wall-clock time per phase: the union of its spans, so spans running in parallel (e.g. concurrent
+        llm_call batches) are counted once and no phase exceeds the step duration.
+        """
+        now = time.perf_counter()
+        intervals: Dict[str, List[tuple]] = {}
+        for span in self.spans:
+            intervals.setdefault(span.phase, []).append((span.start, span.end or now))
+        totals: Dict[str, float] = {}
+        for phase, spans in intervals.items():
+            total, covered_until = 0.0, float("-inf")
+            for start, end in sorted(spans):
+                if end > covered_until:
+                    total += end - max(start, covered_until)
+                    covered_until = end
+            totals[phase] = round(total, 3)
+        return totals
+
+    def finish(self) -> Dict[str, float]:
+        for span in list(self._open.values()):
+            self._close(span)
+        duration = time.perf_counter() - self.start_time
+        STEP_SECONDS.observe(duration)
+        totals = self.phase_totals()
+        if duration > STEP_BUDGET_SECONDS:
+            STEP_BUDGET_EXCEEDED.inc()
+            logger.warning(f"会话 {self.session_id} 第 {self.step} 步用时 {duration:.2f} 秒，超出预算 "
+                           f"{STEP_BUDGET_SECONDS} 秒，各阶段: {totals}")
+        return totals
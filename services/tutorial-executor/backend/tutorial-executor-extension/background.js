@@ -24,9 +24,25 @@ async function checkDebuggerStatus() {
     }
 }
 
+// 获取客户端 ID：与前端提交任务时的 clientIP 一致（公网IP），获取失败时使用本地保存的随机 ID
+async function getClientId() {
+    const publicIP = await getPublicIP();
+    if (publicIP) {
+        return publicIP;
+    }
+    const { clientId } = await chrome.storage.local.get("clientId");
+    if (clientId) {
+        return clientId;
+    }
+    const newClientId = crypto.randomUUID();
+    await chrome.storage.local.set({ clientId: newClientId });
+    return newClientId;
+}
+
 // 函数：初始化 WebSocket 连接
-function initWebSocket() {
-    socket = new WebSocket(SOCKET_SERVER_URL);
+async function initWebSocket() {
+    const clientId = await getClientId();
+    socket = new WebSocket(`${SOCKET_SERVER_URL}?clientId=${encodeURIComponent(clientId)}`);
 
     // 监听 WebSocket 打开事件
     socket.addEventListener('open', async () => {
@@ -82,6 +98,23 @@ function initWebSocket() {
     });
 }
 
+// 将内容脚本中用户的选择回传给后端，replyTo 对应后端下发消息的 messageId
+chrome.runtime.onMessage.addListener((message) => {
+    if (!["AUTO_EXECUTE", "CONTINUOUS_AUTO_EXECUTE", "EXIT_ACTION"].includes(message.type)) {
+        return;
+    }
+    if (!socket || socket.readyState !== WebSocket.OPEN) {
+        console.warn("[WebSocket] 连接未就绪，无法回传操作:", message.type);
+        return;
+    }
+    socket.send(JSON.stringify({
+        type: message.type,
+        replyTo: message.replyTo,
+        sessionId: message.data && message.data.sessionId,
+        data: message.data
+    }));
+});
+
 // 启动 WebSocket 心跳机制
 function startHeartbeat() {
     heartbeatInterval = setInterval(async () => {
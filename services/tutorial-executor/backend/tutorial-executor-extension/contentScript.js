@@ -73,17 +73,17 @@ chrome.runtime.onMessage.addListener((data, sender, sendResponse) => {
 
       // 按钮事件监听
       exitButton.addEventListener("click", () => {
-        chrome.runtime.sendMessage({ type: "EXIT_ACTION", data });
+        chrome.runtime.sendMessage({ type: "EXIT_ACTION", replyTo: data.messageId, data });
         dialog.remove();
       });
 
       autoButton.addEventListener("click", () => {
-        chrome.runtime.sendMessage({ type: "AUTO_EXECUTE", data });
+        chrome.runtime.sendMessage({ type: "AUTO_EXECUTE", replyTo: data.messageId, data });
         dialog.remove();
       });
 
       continuousButton.addEventListener("click", () => {
-        chrome.runtime.sendMessage({ type: "CONTINUOUS_AUTO_EXECUTE", data });
+        chrome.runtime.sendMessage({ type: "CONTINUOUS_AUTO_EXECUTE", replyTo: data.messageId, data });
         dialog.remove();
       });
     }
@@ -1,7 +1,7 @@
 # utils/__init__.py
-from .dom_utils import parse_dom
-from .image_utils import process_image
-from .format_prompt_utils import format_prompt
-from .evaluation_utils import evaluate_model
+from .dom_utils import DOMUtils
+from .image_utils import ImageUtils, ImagePreparer, PreparedImage
+from .format_prompt_utils import PromptFormatter
+from .evaluation_utils import EvaluationUtils
 
-__all__ = ['parse_dom', 'process_image', 'format_prompt', 'evaluate_model']
\ No newline at end of file
+__all__ = ['DOMUtils', 'ImageUtils', 'ImagePreparer', 'PreparedImage', 'PromptFormatter', 'EvaluationUtils']
\ No newline at end of file
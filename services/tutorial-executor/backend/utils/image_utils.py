@@ -7,10 +7,13 @@ It provides functionalities such as resizing, cropping, converting formats, extr
 """
 
 import os
+import math
+import time
+from dataclasses import dataclass
 from PIL import Image, ImageOps
 import io
 import base64
-from typing import Tuple, Optional, Dict
+from typing import Tuple, Optional, Dict, List
 
 
 class ImageUtils:
@@ -57,7 +60,7 @@ class ImageUtils:
         Returns:
             Image.Image: A resized PIL Image object.
         """
-        return image.resize(size, Image.ANTIALIAS)
+        return image.resize(size, Image.LANCZOS)
 
     @staticmethod
     def crop_image(image: Image.Image, box: Tuple[int, int, int, int]) -> Image.Image:
@@ -198,6 +201,47 @@ class ImageUtils:
         output_io.seek(0)
         return Image.open(output_io)
 
+    @staticmethod
+    def encode_jpeg(image: Image.Image, quality: int = 85) -> bytes:
+        """
+        Encodes an image as JPEG bytes.
+
+        Args:
+            image (Image.Image): The PIL Image object to encode.
+            quality (int): The quality level for compression (0-100).
+
+        Returns:
+            bytes: The JPEG encoded image.
+        """
+        output_io = io.BytesIO()
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(output_io, format='JPEG', quality=quality, optimize=True)
+        return output_io.getvalue()
+
+    @staticmethod
+    def estimate_vision_tokens(width: int, height: int) -> int:
+        """
+        Estimates the prompt tokens of an image sent to the OpenAI vision models with "detail": "high".
+
+        The image is scaled to fit in 2048x2048, then its shortest side is scaled down to 768px, and every
+        512px tile costs 170 tokens on top of a base of 85 tokens.
+
+        Args:
+            width (int): Image width in pixels.
+            height (int): Image height in pixels.
+
+        Returns:
+            int: The estimated number of tokens.
+        """
+        if max(width, height) > 2048:
+            ratio = 2048 / max(width, height)
+            width, height = width * ratio, height * ratio
+        if min(width, height) > 768:
+            ratio = 768 / min(width, height)
+            width, height = width * ratio, height * ratio
+        return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
     @staticmethod
     def overlay_images(background: Image.Image, foreground: Image.Image, position: Tuple[int, int]) -> Image.Image:
         """
@@ -212,4 +256,116 @@ class ImageUtils:
             Image.Image: The resulting combined image.
         """
         background.paste(foreground, position, foreground)
-        return background
\ No newline at end of file
+        return background
+
+
+@dataclass
+class PreparedImage:
+    """A screenshot prepared for a vision prompt, with the size and latency figures of the preparation."""
+    images: List[str]  # base64 JPEG, one entry per tile
+    width: int
+    height: int
+    quality: int
+    tokens: int
+    original_bytes: int
+    prepared_bytes: int
+    elapsed: float = 0.0
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - self.prepared_bytes
+
+
+@dataclass
+class ImagePreparer:
+    """
+    Picks the resolution and JPEG quality of a screenshot from a token and byte budget.
+
+    The image is first downscaled until its estimated vision tokens fit `max_tokens`, then re-encoded with
+    decreasing quality until it fits `max_bytes`; if even `min_quality` is too large it is downscaled further,
+    never below `min_width`. Optionally the image is converted to grayscale and/or split into tiles of at most
+    `tile_height` pixels; the token budget then applies to all tiles together, and trailing tiles are dropped if
+    the image cannot be shrunk enough. A budget of 0 disables that limit; with both limits at 0 the screenshot is
+    passed through unchanged.
+    """
+    max_tokens: int = 0
+    max_bytes: int = 0
+    max_quality: int = 85
+    min_quality: int = 40
+    quality_step: int = 10
+    min_width: int = 512
+    grayscale: bool = False
+    tile_height: int = 0
+    max_rounds: int = 4
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "ImagePreparer":
+        return cls(**{key: value for key, value in config.items() if key in cls.__dataclass_fields__})
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_tokens > 0 or self.max_bytes > 0 or self.grayscale or self.tile_height > 0
+
+    def _estimate_tokens(self, width: int, height: int) -> int:
+        """Vision tokens of the image as it will be sent, i.e. summed over its tiles when tiling is on."""
+        if self.tile_height <= 0 or height <= self.tile_height:
+            return ImageUtils.estimate_vision_tokens(width, height)
+        full_tiles, rest = divmod(height, self.tile_height)
+        tokens = full_tiles * ImageUtils.estimate_vision_tokens(width, self.tile_height)
+        return tokens + (ImageUtils.estimate_vision_tokens(width, rest) if rest else 0)
+
+    def _scale_for_tokens(self, width: int, height: int) -> float:
+        scale = 1.0
+        if self.max_tokens <= 0:
+            return scale
+        while (self._estimate_tokens(round(width * scale), round(height * scale)) > self.max_tokens
+               and width * scale * 0.9 >= self.min_width):
+            scale *= 0.9
+        return scale
+
+    def _tiles(self, image: Image.Image) -> List[Image.Image]:
+        if self.tile_height <= 0 or image.height <= self.tile_height:
+            return [image]
+        tiles = [ImageUtils.crop_image(image, (0, top, image.width, min(top + self.tile_height, image.height)))
+                 for top in range(0, image.height, self.tile_height)]
+        if self.max_tokens <= 0:
+            return tiles
+        # min_width stopped the downscaling: keep the top of the page within the budget (always at least one tile)
+        kept, tokens = [], 0
+        for tile in tiles:
+            tokens += ImageUtils.estimate_vision_tokens(tile.width, tile.height)
+            if kept and tokens > self.max_tokens:
+                break
+            kept.append(tile)
+        return kept
+
+    def prepare(self, data: bytes) -> PreparedImage:
+        start_time = time.perf_counter()
+        image = Image.open(io.BytesIO(data))
+        if not self.enabled:
+            return PreparedImage(images=[base64.b64encode(data).decode('utf-8')], width=image.width,
+                                 height=image.height, quality=100,
+                                 tokens=ImageUtils.estimate_vision_tokens(image.width, image.height),
+                                 original_bytes=len(data), prepared_bytes=len(data),
+                                 elapsed=time.perf_counter() - start_time)
+
+        image = image.convert("L") if self.grayscale else image.convert("RGB")
+        scale = self._scale_for_tokens(image.width, image.height)
+        for _ in range(self.max_rounds):
+            size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            resized = image if scale >= 1.0 else ImageUtils.resize_image(image, size)
+            tiles = self._tiles(resized)
+            for quality in range(self.max_quality, self.min_quality - 1, -self.quality_step):
+                encoded = [ImageUtils.encode_jpeg(tile, quality) for tile in tiles]
+                if self.max_bytes <= 0 or sum(len(e) for e in encoded) <= self.max_bytes:
+                    break
+            if (self.max_bytes <= 0 or sum(len(e) for e in encoded) <= self.max_bytes
+                    or resized.width * 0.8 < self.min_width):
+                break
+            scale *= 0.8
+
+        return PreparedImage(images=[base64.b64encode(e).decode('utf-8') for e in encoded],
+                             width=resized.width, height=sum(tile.height for tile in tiles), quality=quality,
+                             tokens=sum(ImageUtils.estimate_vision_tokens(tile.width, tile.height) for tile in tiles),
+                             original_bytes=len(data), prepared_bytes=sum(len(e) for e in encoded),
+                             elapsed=time.perf_counter() - start_time)
@@ -1,21 +1,106 @@
 from pymongo import MongoClient
+from collections import deque
+from datetime import datetime, timezone
+import atexit
 import logging
+import os
+import threading
+
+# 缓冲区最多保留的日志条数，超出时丢弃新日志并计数
+MONGO_LOG_MAX_BUFFER = int(os.getenv("MONGO_LOG_MAX_BUFFER", "10000"))
+# 缓冲达到该条数时立即写入
+MONGO_LOG_BATCH_SIZE = int(os.getenv("MONGO_LOG_BATCH_SIZE", "200"))
+# 距上次写入超过该秒数时写入
+MONGO_LOG_FLUSH_INTERVAL = float(os.getenv("MONGO_LOG_FLUSH_INTERVAL", "1.0"))
+
 
 class MongoDBLogHandler(logging.Handler):
-    """Custom log handler to store logs in MongoDB."""
-    def __init__(self, db_name, collection_name, mongo_uri="mongodb://localhost:27017/"):
+    """
+    Log handler that stores records in MongoDB without blocking the caller.
+
+    `emit` only formats the record and appends it to a bounded deque; a daemon thread writes the buffer with
+    `insert_many` once `batch_size` records are pending or every `flush_interval` seconds. When the buffer is
+    full new records are dropped and counted in `dropped`. `close` (also run at interpreter exit) writes
+    whatever is still buffered.
+    """
+    def __init__(self, db_name, collection_name, mongo_uri="mongodb://localhost:27017/",
+                 max_buffer=MONGO_LOG_MAX_BUFFER, batch_size=MONGO_LOG_BATCH_SIZE,
+                 flush_interval=MONGO_LOG_FLUSH_INTERVAL):
         super().__init__()
         self.client = MongoClient(mongo_uri)
         self.collection = self.client[db_name][collection_name]
+        self.max_buffer = max_buffer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # deque 的 append / popleft 是线程安全的，emit 不需要获取锁
+        self._buffer = deque()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._flusher = threading.Thread(target=self._run, name="mongo-log-flusher", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
 
     def emit(self, record):
-        log_entry = self.format(record)
-        self.collection.insert_one({"log": log_entry})
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped += 1
+            return
+        try:
+            log_entry = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        self._buffer.append({
+            "log": log_entry,
+            "level": record.levelname,
+            "logger": record.name,
+            "timestamp": datetime.fromtimestamp(record.created, tz=timezone.utc),
+        })
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._write_pending()
+
+    def _write_pending(self):
+        while self._buffer:
+            batch = []
+            while self._buffer and len(batch) < self.batch_size:
+                batch.append(self._buffer.popleft())
+            try:
+                self.collection.insert_many(batch, ordered=False)
+                self.written += len(batch)
+            except Exception:
+                # 日志写入失败不能影响业务，只计数
+                self.failed += len(batch)
+
+    def flush(self):
+        """Wake the flusher; records reach MongoDB shortly after."""
+        self._wakeup.set()
+
+    def close(self):
+        if not self._stopped.is_set():
+            self._stopped.set()
+            self._wakeup.set()
+            self._flusher.join(timeout=10)
+            self._write_pending()
+            self.client.close()
+        super().close()
+
+    def stats(self):
+        return {"pending": len(self._buffer), "written": self.written, "dropped": self.dropped,
+                "failed": self.failed}
+
 
-def setup_mongo_logger(db_name, collection_name):
+def setup_mongo_logger(db_name, collection_name, mongo_uri="mongodb://localhost:27017/"):
     """Setup MongoDB logging."""
     logger = logging.getLogger("fastapi")
-    mongo_handler = MongoDBLogHandler(db_name=db_name, collection_name=collection_name)
+    mongo_handler = MongoDBLogHandler(db_name=db_name, collection_name=collection_name, mongo_uri=mongo_uri)
     logger.addHandler(mongo_handler)
     logger.setLevel(logging.INFO)
-    return logger
\ No newline at end of file
+    return logger
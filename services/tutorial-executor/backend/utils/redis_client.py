@@ -1,5 +1,56 @@
+import os
+from typing import Optional
+
 import redis
+import redis.asyncio as aioredis
+
+# 未设置时不启用 Redis 任务状态
+REDIS_URL = os.getenv("REDIS_URL")
+# 连接池最大连接数
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "32"))
+# 订阅（pub/sub）连接池最大连接数，即同时订阅的客户端数上限；每个订阅独占一条连接
+REDIS_MAX_SUBSCRIBERS = int(os.getenv("REDIS_MAX_SUBSCRIBERS", "64"))
+
+_pool: Optional[aioredis.ConnectionPool] = None
+_pubsub_pool: Optional[aioredis.ConnectionPool] = None
+
 
 def get_redis_client():
     """Initialize and return a Redis client."""
-    return redis.Redis(host='localhost', port=6379, db=0)
\ No newline at end of file
+    return redis.Redis.from_url(REDIS_URL or "redis://localhost:6379/0")
+
+
+def get_async_redis_client(url: Optional[str] = None) -> aioredis.Redis:
+    """
+    Return an asyncio Redis client on the shared connection pool. Clients are cheap; the pool holds at most
+    REDIS_MAX_CONNECTIONS connections for the whole process.
+    """
+    global _pool
+    if _pool is None:
+        _pool = aioredis.ConnectionPool.from_url(url or REDIS_URL or "redis://localhost:6379/0",
+                                                 max_connections=REDIS_MAX_CONNECTIONS, decode_responses=True,
+                                                 socket_connect_timeout=1, health_check_interval=30)
+    return aioredis.Redis(connection_pool=_pool)
+
+
+def get_async_pubsub_client(url: Optional[str] = None) -> aioredis.Redis:
+    """
+    Return an asyncio Redis client for pub/sub. A subscriber holds its connection for as long as it listens, so
+    subscribers get their own pool of REDIS_MAX_SUBSCRIBERS connections and never starve the shared pool.
+    """
+    global _pubsub_pool
+    if _pubsub_pool is None:
+        _pubsub_pool = aioredis.ConnectionPool.from_url(url or REDIS_URL or "redis://localhost:6379/0",
+                                                        max_connections=REDIS_MAX_SUBSCRIBERS, decode_responses=True,
+                                                        socket_connect_timeout=1, health_check_interval=30)
+    return aioredis.Redis(connection_pool=_pubsub_pool)
+
+
+async def close_async_redis_pool():
+    global _pool, _pubsub_pool
+    if _pool is not None:
+        await _pool.disconnect()
+        _pool = None
+    if _pubsub_pool is not None:
+        await _pubsub_pool.disconnect()
+        _pubsub_pool = None
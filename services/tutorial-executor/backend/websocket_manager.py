@@ -2,57 +2,207 @@ from fastapi import WebSocket
 import logging
 import asyncio
 import json
+import os
+import uuid
+from typing import Any, Dict, Optional, Set
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# 每个连接的发送队列长度，队列满时发送方等待（背压）
+WS_OUTBOUND_QUEUE_SIZE = int(os.getenv("WS_OUTBOUND_QUEUE_SIZE", "32"))
+# 发送方等待队列空位的最长时间，超时视为慢客户端并断开
+WS_ENQUEUE_TIMEOUT = float(os.getenv("WS_ENQUEUE_TIMEOUT", "2"))
+# 单条消息写入 WebSocket 的超时时间
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5"))
+
+
+class ClientConnection:
+    """One extension client: its WebSocket, bound sessions and a bounded outbound queue drained by a sender task."""
+
+    def __init__(self, websocket: WebSocket, client_id: str, queue_size: int):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.session_ids: Set[str] = set()
+        self.pending: Set[str] = set()  # 等待该客户端响应的消息 ID
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.sender: Optional[asyncio.Task] = None
+        self.sent = 0
+
+
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
+    """
+    Registry of extension WebSocket connections keyed by client ID (the `clientId` query parameter, or a random
+    ID per socket when it is missing), with sessions bound to their client.
+
+    Every message sent through `send_message` gets a `messageId`; the extension echoes it in its reply and
+    `resolve` completes the future returned to `wait_for_response`. Each connection has its own bounded outbound
+    queue and sender task, so a slow or dead client only stalls itself: senders wait for queue space at most
+    `enqueue_timeout` seconds, after which the client is disconnected.
+    """
+
+    def __init__(self, queue_size: int = WS_OUTBOUND_QUEUE_SIZE, enqueue_timeout: float = WS_ENQUEUE_TIMEOUT,
+                 send_timeout: float = WS_SEND_TIMEOUT):
+        self.queue_size = queue_size
+        self.enqueue_timeout = enqueue_timeout
+        self.send_timeout = send_timeout
+        self.connections: Dict[str, ClientConnection] = {}
+        self.sessions: Dict[str, str] = {}  # session ID -> client ID
+        self._pending: Dict[str, asyncio.Future] = {}
 
-    async def connect(self, websocket: WebSocket):
+    @property
+    def active_connections(self):
+        return [connection.websocket for connection in self.connections.values()]
+
+    async def connect(self, websocket: WebSocket, client_id: Optional[str] = None) -> ClientConnection:
         await websocket.accept()
-        self.active_connections.append(websocket)
-        logger.info(f"客户端已连接: {websocket.client}")
+        # 未带 clientId 的连接各自独立，不能按对端 IP 归并（经过代理时所有客户端 IP 相同）
+        client_id = client_id or uuid.uuid4().hex
+        old_connection = self.connections.get(client_id)
+        if old_connection:
+            # 同一客户端重连时替换旧连接，保留会话绑定
+            self._drop(old_connection, close=True)
+        connection = ClientConnection(websocket, client_id, self.queue_size)
+        if old_connection:
+            connection.session_ids = old_connection.session_ids
+        connection.sender = asyncio.create_task(self._sender(connection))
+        self.connections[client_id] = connection
+        logger.info(f"客户端已连接: {client_id} ({websocket.client})")
+        return connection
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-        logger.info(f"客户端已断开: {websocket.client}")
+        for connection in list(self.connections.values()):
+            if connection.websocket is websocket:
+                self._drop(connection)
+                logger.info(f"客户端已断开: {connection.client_id}")
+
+    def bind_session(self, session_id: str, client_id: str):
+        self.sessions[session_id] = client_id
+        connection = self.connections.get(client_id)
+        if connection:
+            connection.session_ids.add(session_id)
+
+    def unbind_session(self, session_id: str):
+        client_id = self.sessions.pop(session_id, None)
+        connection = self.connections.get(client_id) if client_id else None
+        if connection:
+            connection.session_ids.discard(session_id)
+
+    def get_connection(self, client_id: Optional[str] = None,
+                       session_id: Optional[str] = None) -> Optional[ClientConnection]:
+        if session_id and session_id in self.sessions:
+            client_id = self.sessions[session_id]
+        return self.connections.get(client_id) if client_id else None
+
+    async def send_message(self, message, client_id: Optional[str] = None, session_id: Optional[str] = None) -> str:
+        """
+        Queue a message for the client of `session_id` (or `client_id`) and return its message ID. Call
+        `wait_for_response` with that ID to receive the reply.
+        """
+        if isinstance(message, str):
+            message = json.loads(message)
+        connection = self.get_connection(client_id, session_id)
+        if connection is None:
+            raise ConnectionError(f"客户端 {client_id or session_id} 未连接")
+        message_id = message.setdefault("messageId", uuid.uuid4().hex)
+        if session_id:
+            message.setdefault("sessionId", session_id)
+        # 发送前注册 future，避免响应先于等待到达
+        self._pending[message_id] = asyncio.get_running_loop().create_future()
+        connection.pending.add(message_id)
+        try:
+            await self._enqueue(connection, message)
+        except Exception:
+            self._pending.pop(message_id, None)
+            connection.pending.discard(message_id)
+            raise
+        return message_id
+
+    async def wait_for_response(self, message_id: str, timeout: float = 30) -> Dict[str, Any]:
+        """等待扩展对指定消息的响应"""
+        future = self._pending.get(message_id)
+        if future is None:
+            raise KeyError(f"未知的消息 ID: {message_id}")
+        try:
+            return await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError("Timeout waiting for extension response")
+        finally:
+            self._pending.pop(message_id, None)
+            for connection in self.connections.values():
+                connection.pending.discard(message_id)
+
+    async def request(self, message, client_id: Optional[str] = None, session_id: Optional[str] = None,
+                      timeout: float = 30) -> Dict[str, Any]:
+        message_id = await self.send_message(message, client_id, session_id)
+        return await self.wait_for_response(message_id, timeout)
+
+    def resolve(self, data: Dict[str, Any]) -> bool:
+        """Complete the pending request this message replies to; returns False if it is not a reply."""
+        message_id = data.get("replyTo") or data.get("messageId")
+        future = self._pending.get(message_id) if message_id else None
+        if future is None or future.done():
+            return False
+        future.set_result(data)
+        return True
 
     async def broadcast(self, action_data):
-        dead_connections = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(action_data)
-            except:
-                dead_connections.append(connection)
-        
-        # 清理失效连接        
-        for conn in dead_connections:
-            self.active_connections.remove(conn)
-
-class WebSocketManager:
-    def __init__(self):
-        self.websocket = None
-        self.response_future = None
-        
-    async def send_message(self, message):
-        if self.websocket:
-            await self.websocket.send(message)
-            
-    async def wait_for_response(self, timeout=30):
-        """等待来自扩展的响应"""
-        if not self.websocket:
-            raise Exception("WebSocket connection not available")
-            
+        connections = list(self.connections.values())
+        results = await asyncio.gather(*(self._enqueue(connection, action_data) for connection in connections),
+                                       return_exceptions=True)
+        for connection, result in zip(connections, results):
+            if isinstance(result, Exception):
+                logger.warning(f"向客户端 {connection.client_id} 广播失败: {result}")
+
+    async def _enqueue(self, connection: ClientConnection, message):
         try:
-            response = await asyncio.wait_for(
-                self.websocket.recv(),
-                timeout=timeout
-            )
-            return json.loads(response)
+            await asyncio.wait_for(connection.queue.put(message), timeout=self.enqueue_timeout)
         except asyncio.TimeoutError:
-            raise Exception("Timeout waiting for extension response")
+            logger.warning(f"客户端 {connection.client_id} 发送队列已满，断开慢客户端")
+            self._drop(connection, close=True)
+            raise ConnectionError(f"客户端 {connection.client_id} 响应过慢，已断开")
+
+    async def _sender(self, connection: ClientConnection):
+        while True:
+            message = await connection.queue.get()
+            try:
+                await asyncio.wait_for(connection.websocket.send_json(message), timeout=self.send_timeout)
+                connection.sent += 1
+            except Exception as e:
+                logger.warning(f"向客户端 {connection.client_id} 发送失败: {e}")
+                self._drop(connection, close=True)
+                return
+
+    def _drop(self, connection: ClientConnection, close: bool = False):
+        if self.connections.get(connection.client_id) is connection:
+            del self.connections[connection.client_id]
+        for message_id in connection.pending:
+            future = self._pending.get(message_id)
+            if future and not future.done():
+                future.set_exception(ConnectionError(f"客户端 {connection.client_id} 已断开"))
+        connection.pending.clear()
+        if connection.sender and connection.sender is not asyncio.current_task():
+            connection.sender.cancel()
+        if close:
+            asyncio.create_task(self._close(connection.websocket))
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending_responses": len(self._pending),
+            "connections": {
+                client_id: {"sessions": sorted(connection.session_ids), "queued": connection.queue.qsize(),
+                            "sent": connection.sent, "pending": len(connection.pending)}
+                for client_id, connection in self.connections.items()
+            },
+        }
+
 
 # 创建全局实例
-websocket_manager = ConnectionManager()
\ No newline at end of file
+websocket_manager = ConnectionManager()
@@ -0,0 +1,255 @@
+import asyncio
+import glob
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import toml
+from bson.objectid import ObjectId
+from pymongo.errors import OperationFailure
+
+from config.settings import settings
+from models.database import client
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# 数据库记录和截图文件的保留天数
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "30"))
+# /tmp/screenshot_*.png 临时截图的保留小时数
+RETENTION_TMP_SCREENSHOT_HOURS = float(os.getenv("RETENTION_TMP_SCREENSHOT_HOURS", "24"))
+# save_file_dir 下截图及其提示词文件总大小上限（字节），超出时先删除最旧的文件；0 表示不限制
+RETENTION_MAX_SCREENSHOT_BYTES = int(os.getenv("RETENTION_MAX_SCREENSHOT_BYTES", "0"))
+# 每批删除的文档 / 文件数
+RETENTION_DELETE_BATCH = int(os.getenv("RETENTION_DELETE_BATCH", "500"))
+# 每秒最多删除的文档 / 文件数，避免清理占满磁盘和数据库 I/O
+RETENTION_DELETES_PER_SECOND = float(os.getenv("RETENTION_DELETES_PER_SECOND", "2000"))
+# 定时清理间隔（秒）
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", "3600"))
+
+# (数据库, 集合, 日期字段)：由 MongoDB TTL 索引自动过期
+TTL_COLLECTIONS: List[Tuple[str, str, str]] = [
+    (settings.MONGODB_DB_NAME, "logs", "timestamp"),
+    (settings.MONGODB_DB_NAME, "screenshots", "captured_at"),
+    (settings.MONGODB_DB_NAME, "screenshot_logs", "timestamp"),
+    (settings.MONGODB_DB_NAME, "large_model_responses", "generated_at"),
+    ("tutorial_executor", "action_records", "timestamp"),
+]
+# 没有日期字段的集合按 _id 中的创建时间分批删除；file_field 指向的截图文件一并删除
+BATCHED_COLLECTIONS: List[Dict[str, Any]] = [
+    {"db": settings.MONGODB_DB_NAME, "collection": "tasks", "file_field": "screenshot_path",
+     "filter": {"status": {"$ne": "pending"}}},
+]
+
+
+class RetentionService:
+    """
+    Keeps MongoDB collections and screenshot files within the retention window.
+
+    Collections with a date field get a TTL index, so MongoDB expires documents continuously in the background.
+    The remaining collections and the screenshot files are reclaimed by `sweep` in batches of `batch_size`,
+    paced to at most `deletes_per_second`, so a sweep never turns into one large I/O burst.
+    """
+
+    def __init__(self, client, save_file_dir: Optional[str] = None, retention_days: int = RETENTION_DAYS,
+                 tmp_screenshot_hours: float = RETENTION_TMP_SCREENSHOT_HOURS,
+                 max_screenshot_bytes: int = RETENTION_MAX_SCREENSHOT_BYTES, batch_size: int = RETENTION_DELETE_BATCH,
+                 deletes_per_second: float = RETENTION_DELETES_PER_SECOND):
+        self.client = client
+        self.save_file_dir = save_file_dir
+        self.retention_days = retention_days
+        self.tmp_screenshot_hours = tmp_screenshot_hours
+        self.max_screenshot_bytes = max_screenshot_bytes
+        self.batch_size = batch_size
+        self.deletes_per_second = deletes_per_second
+        self._lock = asyncio.Lock()
+        self._loop_task: Optional[asyncio.Task] = None
+        self.last_sweep: Dict[str, Any] = {}
+
+    @property
+    def retention_seconds(self) -> int:
+        return int(self.retention_days * 86400)
+
+    async def ensure_ttl_indexes(self):
+        for db_name, collection, field in TTL_COLLECTIONS:
+            db = self.client[db_name]
+            try:
+                await db[collection].create_index(field, expireAfterSeconds=self.retention_seconds)
+            except OperationFailure as e:
+                if e.code not in (85, 86):  # IndexOptionsConflict / IndexKeySpecsConflict
+                    logger.error(f"创建 TTL 索引失败 {db_name}.{collection}.{field}: {e}")
+                    continue
+                # 已存在同键索引（或保留时间变了）时直接修改过期时间
+                try:
+                    await db.command("collMod", collection,
+                                     index={"keyPattern": {field: 1}, "expireAfterSeconds": self.retention_seconds})
+                except Exception as e:
+                    # 例如旧版本 mongod 不能把普通索引改成 TTL 索引，此时只依赖批量删除
+                    logger.error(f"修改 TTL 索引失败 {db_name}.{collection}.{field}: {e}")
+            except Exception as e:
+                logger.error(f"创建 TTL 索引失败 {db_name}.{collection}.{field}: {e}")
+
+    async def _pace(self, started: float, deleted: int):
+        """Sleep so that `deleted` deletions since `started` stay under deletes_per_second."""
+        if self.deletes_per_second > 0:
+            delay = deleted / self.deletes_per_second - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def _delete_collection_batches(self, spec: Dict[str, Any], cutoff: datetime) -> Dict[str, int]:
+        collection = self.client[spec["db"]][spec["collection"]]
+        query = {**spec.get("filter", {}), "_id": {"$lt": ObjectId.from_datetime(cutoff)}}
+        file_field = spec.get("file_field")
+        projection = {"_id": 1, file_field: 1} if file_field else {"_id": 1}
+        documents = files = 0
+        started = time.monotonic()
+        while True:
+            batch = await collection.find(query, projection).sort("_id", 1).limit(self.batch_size) \
+                .to_list(length=self.batch_size)
+            if not batch:
+                break
+            result = await collection.delete_many({"_id": {"$in": [document["_id"] for document in batch]}})
+            documents += result.deleted_count
+            if file_field:
+                paths = [document[file_field] for document in batch if document.get(file_field)]
+                files += await asyncio.to_thread(self._remove_files, paths)
+            await self._pace(started, documents)
+        return {"documents": documents, "files": files}
+
+    @staticmethod
+    def _remove_files(paths: List[str]) -> int:
+        removed = 0
+        for path in paths:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"删除截图失败 {path}: {e}")
+        return removed
+
+    def _screenshot_files(self) -> List[Tuple[float, int, str]]:
+        """Step screenshots and their saved prompts (image_inputs/*.jpg, image_inputs/*_prompt.json)."""
+        files = []
+        if self.save_file_dir and os.path.isdir(self.save_file_dir):
+            for pattern in ("*.jpg", "*_prompt.json"):
+                for path in glob.iglob(os.path.join(self.save_file_dir, "**", "image_inputs", pattern), recursive=True):
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _remove_empty_dirs(self, paths: List[str]) -> int:
+        """Remove the image_inputs and task directories of deleted files once they are empty."""
+        if not self.save_file_dir:
+            return 0
+        root = os.path.abspath(self.save_file_dir)
+        removed = 0
+        for directory in sorted({os.path.dirname(os.path.abspath(path)) for path in paths}):
+            # image_inputs，然后是任务目录；不删除 save_file_dir 本身
+            while directory.startswith(root + os.sep):
+                try:
+                    os.rmdir(directory)
+                except FileNotFoundError:
+                    pass
+                except OSError:  # 目录非空
+                    break
+                else:
+                    removed += 1
+                directory = os.path.dirname(directory)
+        return removed
+
+    def _expired_files(self) -> List[str]:
+        """Screenshots and prompts past retention, plus the oldest ones beyond max_screenshot_bytes."""
+        now = time.time()
+        expired = []
+        for path in glob.glob("/tmp/screenshot_*.png"):
+            try:
+                if now - os.path.getmtime(path) > self.tmp_screenshot_hours * 3600:
+                    expired.append(path)
+            except OSError:
+                continue
+        files = sorted(self._screenshot_files())
+        cutoff = now - self.retention_seconds
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in files:
+            if mtime < cutoff or (self.max_screenshot_bytes and total > self.max_screenshot_bytes):
+                expired.append(path)
+                total -= size
+            else:
+                break
+        return expired
+
+    async def _delete_files(self) -> Dict[str, int]:
+        paths = await asyncio.to_thread(self._expired_files)
+        removed = 0
+        started = time.monotonic()
+        for start in range(0, len(paths), self.batch_size):
+            removed += await asyncio.to_thread(self._remove_files, paths[start:start + self.batch_size])
+            await self._pace(started, removed)
+        directories = await asyncio.to_thread(self._remove_empty_dirs, paths)
+        return {"files": removed, "directories": directories}
+
+    async def sweep(self) -> Dict[str, Any]:
+        """Delete expired documents without a TTL index and expired screenshot files."""
+        if self._lock.locked():
+            return {"skipped": True, "reason": "sweep already running"}
+        async with self._lock:
+            started = time.monotonic()
+            cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+            result: Dict[str, Any] = {"cutoff": cutoff.isoformat(), "collections": {}}
+            for spec in BATCHED_COLLECTIONS:
+                try:
+                    result["collections"][spec["collection"]] = await self._delete_collection_batches(spec, cutoff)
+                except Exception as e:
+                    logger.error(f"清理集合 {spec['collection']} 失败: {e}")
+            files = await self._delete_files()
+            result["screenshot_files"] = files["files"]
+            result["screenshot_dirs"] = files["directories"]
+            result["elapsed"] = round(time.monotonic() - started, 3)
+            self.last_sweep = result
+            logger.info(f"保留策略清理完成: {result}")
+            return result
+
+    def start(self, interval: float = RETENTION_INTERVAL):
+        if self._loop_task is None:
+            self._loop_task = asyncio.create_task(self._run(interval))
+
+    async def _run(self, interval: float):
+        indexes_ready = False
+        while True:
+            try:
+                if not indexes_ready:
+                    await self.ensure_ttl_indexes()
+                    indexes_ready = True
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"保留策略清理失败: {e}")
+            await asyncio.sleep(interval)
+
+    async def stop(self):
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+            self._loop_task = None
+
+
+def configured_save_file_dir() -> Optional[str]:
+    """save_file_dir of the SeeAct config, where step screenshots are written."""
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        with open(os.path.join(base_dir, settings.CONFIG_PATH), 'r') as toml_config_file:
+            config = toml.load(toml_config_file)
+    except (OSError, toml.TomlDecodeError) as e:
+        logger.error(f"读取配置失败，不清理截图目录: {e}")
+        return None
+    return os.path.abspath(os.path.join(base_dir, config["basic"]["save_file_dir"]))
+
+
+# 创建全局实例
+retention_service = RetentionService(client, configured_save_file_dir())
@@ -105,23 +105,30 @@ def periodic_update_configurations(self, interval: int = 3600):
         # Wait for the specified interval before checking again
         time.sleep(interval)
 
-# Example of a Celery Task to clean up old entries
+# Celery Task to clean up old entries
 @celery_app.task
 def cleanup_old_entries(retention_days: int = 30):
     """
     Cleans up old log entries and screenshots based on retention policy.
     """
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from config.settings import settings
+    from workers.retention import RetentionService, configured_save_file_dir
+
+    async def _cleanup():
+        # Celery 每次调用都在新的事件循环中运行，使用独立的 Motor 客户端
+        client = AsyncIOMotorClient(str(settings.MONGODB_URL))
+        try:
+            service = RetentionService(client, configured_save_file_dir(), retention_days=retention_days)
+            await service.ensure_ttl_indexes()
+            return await service.sweep()
+        finally:
+            client.close()
+
     print("Starting cleanup of old entries...")
-    from datetime import datetime, timedelta
-    cutoff_date = datetime.utcnow() - timedelta(days=retention_days)
-    
-    # Cleanup logs older than retention_days
-    asyncio.run(db.logs.delete_many({"timestamp": {"$lt": cutoff_date}}))
-    
-    # Cleanup screenshots older than retention_days
-    asyncio.run(db.screenshots.delete_many({"captured_at": {"$lt": cutoff_date}}))
-    
+    result = asyncio.run(_cleanup())
     print("Cleanup completed.")
+    return result
 
 # Example of a FastAPI BackgroundTask to send notifications
 async def send_notification(notification_data: Dict[str, Any], background_tasks: BackgroundTasks):
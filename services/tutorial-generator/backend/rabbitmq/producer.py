@@ -1,79 +1,227 @@
 import aio_pika
+import asyncio
 import json
 import logging
-from typing import Dict, Any
+import os
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# 发送缓冲区上限，缓冲区满时调用方等待（背压）
+PRODUCER_BUFFER_SIZE = int(os.getenv("RABBITMQ_PRODUCER_BUFFER_SIZE", "10000"))
+# 每批并发发布的最大消息数，同一批消息的确认在 channel 上流水线进行
+PRODUCER_BATCH_SIZE = int(os.getenv("RABBITMQ_PRODUCER_BATCH_SIZE", "100"))
+# 调用方等待 broker 确认的超时时间（秒）
+PRODUCER_CONFIRM_TIMEOUT = float(os.getenv("RABBITMQ_PRODUCER_CONFIRM_TIMEOUT", "30"))
+# broker 不可用时重试发布的最长间隔（秒）
+PRODUCER_MAX_BACKOFF = float(os.getenv("RABBITMQ_PRODUCER_MAX_BACKOFF", "5"))
+
+
 class RabbitMQProducer:
-    def __init__(self, rabbitmq_url: str):
+    """
+    Long-lived producer with one robust connection and one confirming channel.
+
+    Messages go through a bounded buffer drained by a publisher task. The task publishes up to `batch_size`
+    messages at a time with publisher confirms, so a burst of requests costs one confirm round trip per batch
+    instead of one per message. Messages that fail to publish (e.g. while the broker reconnects) stay in the
+    buffer and are retried with backoff; callers wait until the broker confirmed their message. A message whose
+    caller timed out or was cancelled before it was published is dropped, never delivered late.
+    """
+
+    def __init__(self, rabbitmq_url: str, buffer_size: int = PRODUCER_BUFFER_SIZE,
+                 batch_size: int = PRODUCER_BATCH_SIZE, confirm_timeout: float = PRODUCER_CONFIRM_TIMEOUT):
         self.rabbitmq_url = rabbitmq_url
         self._connection = None
         self._channel = None
+        self._exchange = None
         self.exchange_name = "tutorial_exchange"  # 添加交换机
         self.queue_name = "tutorial_executor_queue"
         self.routing_key = "tutorial.seeact"  # 使用点号分隔的路由键
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+        self.confirm_timeout = confirm_timeout
+        self._buffer: Optional[asyncio.Queue] = None
+        self._retry: deque = deque()  # 发布失败、等待重试的消息，优先于缓冲区
+        self._publisher: Optional[asyncio.Task] = None
+        self._connect_lock = asyncio.Lock()
+        self._started_at = time.time()
+        self._stats = {"sent": 0, "confirmed": 0, "retried": 0, "failed": 0, "expired": 0, "batches": 0,
+                       "confirm_seconds": 0.0}
 
     async def connect(self):
-        if not self._connection:
-            self._connection = await aio_pika.connect_robust(self.rabbitmq_url)
-            self._channel = await self._connection.channel()
-            
-            # 声明交换机
-            self._exchange = await self._channel.declare_exchange(
-                self.exchange_name,
-                aio_pika.ExchangeType.TOPIC,  # 使用 TOPIC 类型交换机
-                durable=True
-            )
-
-            # 声明队列
-            queue = await self._channel.declare_queue(
-                self.queue_name,
-                durable=True,
-                arguments={
-                    'x-message-ttl': 86400000,  # 消息 TTL：24小时
-                    'x-dead-letter-exchange': f"{self.exchange_name}.dlx",  # 死信交换机
-                    'x-dead-letter-routing-key': f"{self.routing_key}.dead"  # 死信路由键
-                }
-            )
-
-            # 绑定队列到交换机
-            await queue.bind(
-                self._exchange,
-                routing_key=self.routing_key
-            )
-
-            logger.info("Connected to RabbitMQ and setup completed")
-
-    async def send_message(self, action: str, data: Dict[str, Any] = None):
-        try:
-            await self.connect()
-            
-            message = {
-                'action': action,
-                'data': data or {}
+        async with self._connect_lock:
+            if not self._connection:
+                connection = await aio_pika.connect_robust(self.rabbitmq_url)
+                try:
+                    await self._setup(connection)
+                except Exception:
+                    await connection.close()
+                    raise
+                self._connection = connection
+                logger.info("Connected to RabbitMQ and setup completed")
+
+    async def _setup(self, connection):
+        self._channel = await connection.channel(publisher_confirms=True)
+
+        # 声明交换机
+        self._exchange = await self._channel.declare_exchange(
+            self.exchange_name,
+            aio_pika.ExchangeType.TOPIC,  # 使用 TOPIC 类型交换机
+            durable=True
+        )
+
+        # 声明队列
+        queue = await self._channel.declare_queue(
+            self.queue_name,
+            durable=True,
+            arguments={
+                'x-message-ttl': 86400000,  # 消息 TTL：24小时
+                'x-dead-letter-exchange': f"{self.exchange_name}.dlx",  # 死信交换机
+                'x-dead-letter-routing-key': f"{self.routing_key}.dead"  # 死信路由键
             }
+        )
+
+        # 绑定队列到交换机
+        await queue.bind(
+            self._exchange,
+            routing_key=self.routing_key
+        )
+
+    def start(self):
+        """Start the publisher task; the broker connection is opened (and retried) by the task itself."""
+        if self._publisher is None:
+            self._buffer = asyncio.Queue(maxsize=self.buffer_size)
+            self._publisher = asyncio.create_task(self._publish_loop())
+
+    def _build_message(self, action: str, data: Optional[Dict[str, Any]]) -> aio_pika.Message:
+        message = {
+            'action': action,
+            'data': data or {}
+        }
+        return aio_pika.Message(
+            body=json.dumps(message).encode(),
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            content_type='application/json',
+            headers={'message_type': action}  # 添加消息类型头
+        )
+
+    async def _submit(self, action: str, data: Optional[Dict[str, Any]]) -> asyncio.Future:
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._buffer.put((self._build_message(action, data), future, time.perf_counter()))
+        self._stats["sent"] += 1
+        return future
+
+    async def send_message(self, action: str, data: Dict[str, Any] = None, wait: bool = True):
+        """Queue one message; with `wait` return only after the broker confirmed it."""
+        future = await self._submit(action, data)
+        if wait:
+            # 超时会取消 future，发布任务随后跳过这条消息，避免调用方已报告失败后再投递
+            await asyncio.wait_for(future, timeout=self.confirm_timeout)
+        logger.info(f"Sent message: {action}")
+
+    async def send_batch(self, messages: List[Tuple[str, Optional[Dict[str, Any]]]], wait: bool = True):
+        """Queue several (action, data) messages; with `wait` return once all of them are confirmed."""
+        futures = [await self._submit(action, data) for action, data in messages]
+        if wait:
+            await asyncio.wait_for(asyncio.gather(*futures), timeout=self.confirm_timeout)
+        logger.info(f"Sent {len(messages)} messages")
+
+    async def _next_batch(self) -> list:
+        batch = []
+        while self._retry and len(batch) < self.batch_size:
+            batch.append(self._retry.popleft())
+        if not batch:
+            batch.append(await self._buffer.get())
+        while len(batch) < self.batch_size and not self._buffer.empty():
+            batch.append(self._buffer.get_nowait())
+        return batch
+
+    async def _publish_loop(self):
+        backoff = 0.1
+        while True:
+            batch = await self._next_batch()
+            # 调用方已超时或取消的消息不再发布
+            live = [item for item in batch if not item[1].done()]
+            self._stats["expired"] += len(batch) - len(live)
+            batch = live
+            if not batch:
+                continue
+            try:
+                await self.connect()
+                results = await asyncio.gather(
+                    *(self._exchange.publish(message, routing_key=self.routing_key) for message, _, _ in batch),
+                    return_exceptions=True)
+            except asyncio.CancelledError:
+                self._retry.extendleft(reversed(batch))
+                raise
+            except Exception as e:
+                results = [e] * len(batch)
+
+            failed = []
+            for item, result in zip(batch, results):
+                _, future, queued_at = item
+                if isinstance(result, Exception):
+                    failed.append(item)
+                    continue
+                self._stats["confirmed"] += 1
+                self._stats["confirm_seconds"] += time.perf_counter() - queued_at
+                if not future.done():
+                    future.set_result(True)
+            self._stats["batches"] += 1
+
+            if failed:
+                # 连接恢复前保留未确认的消息，退避后重试
+                self._stats["retried"] += len(failed)
+                self._retry.extendleft(reversed(failed))
+                logger.warning(f"{len(failed)} 条消息发布失败，{backoff:.1f} 秒后重试: "
+                               f"{next(r for r in results if isinstance(r, Exception))}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, PRODUCER_MAX_BACKOFF)
+            else:
+                backoff = 0.1
+
+    def stats(self) -> Dict[str, Any]:
+        confirmed = self._stats["confirmed"]
+        elapsed = max(time.time() - self._started_at, 1e-6)
+        return {
+            "sent": self._stats["sent"],
+            "confirmed": confirmed,
+            "retried": self._stats["retried"],
+            "failed": self._stats["failed"],
+            "expired": self._stats["expired"],
+            "batches": self._stats["batches"],
+            "buffered": (self._buffer.qsize() if self._buffer else 0) + len(self._retry),
+            "connected": bool(self._connection and not self._connection.is_closed),
+            "messages_per_second": round(confirmed / elapsed, 3),
+            "avg_batch_size": round(confirmed / self._stats["batches"], 2) if self._stats["batches"] else 0,
+            "avg_confirm_ms": round(self._stats["confirm_seconds"] / confirmed * 1000, 2) if confirmed else 0,
+        }
 
-            # 发送消息
-            await self._exchange.publish(
-                aio_pika.Message(
-                    body=json.dumps(message).encode(),
-                    delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
-                    content_type='application/json',
-                    headers={'message_type': action}  # 添加消息类型头
-                ),
-                routing_key=self.routing_key
-            )
-            
-            logger.info(f"Sent message: {message}")
-            
-        except Exception as e:
-            logger.error(f"Error sending message: {e}")
-            raise
-
-    async def close(self):
+    async def close(self, timeout: float = 10):
+        """Flush buffered messages (for at most `timeout` seconds), then close the connection."""
+        if self._publisher is not None:
+            deadline = time.monotonic() + timeout
+            while (not self._buffer.empty() or self._retry) and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+            self._publisher.cancel()
+            await asyncio.gather(self._publisher, return_exceptions=True)
+            self._publisher = None
+            pending = list(self._retry)
+            while not self._buffer.empty():
+                pending.append(self._buffer.get_nowait())
+            self._retry.clear()
+            for _, future, _ in pending:
+                if not future.done():
+                    future.set_exception(ConnectionError("RabbitMQ producer closed"))
+            if pending:
+                self._stats["failed"] += len(pending)
+                logger.error(f"关闭时仍有 {len(pending)} 条消息未发布")
         if self._connection:
             await self._connection.close()
             self._connection = None
             self._channel = None
-            logger.info("Closed RabbitMQ connection")
\ No newline at end of file
+            self._exchange = None
+            logger.info("Closed RabbitMQ connection")
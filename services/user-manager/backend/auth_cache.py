@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Description: In-process cache of verified token principals and the token revocation list (Redis, with an
+# in-memory fallback), so authenticating a request needs neither MySQL nor, most of the time, Redis.
+
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL")  # Revocations stay process-local when unset
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "30"))  # Seconds a verified token is trusted without re-checking revocation
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))  # Max cached tokens (LRU)
+REVOCATION_BACKOFF = float(os.getenv("REVOCATION_BACKOFF", "30"))  # Seconds to use only the in-memory list after a Redis error
+
+JTI_PREFIX = "user_manager:revoked:jti:"  # Single revoked token, expires with the token
+USER_PREFIX = "user_manager:revoked:user:"  # "<timestamp>:<jti>": tokens of a user issued before the timestamp are revoked, except jti
+
+
+class PrincipalCache:
+    """LRU of token -> principal for tokens that were decoded and checked against the revocation list."""
+
+    def __init__(self, ttl: float = PRINCIPAL_CACHE_TTL, max_size: int = PRINCIPAL_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[Any]:
+        entry = self._entries.get(token)
+        if entry is None or entry[0] < time.time():
+            if entry is not None:
+                del self._entries[token]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, token: str, principal: Any, expires_at: float):
+        # Never trust a cached token past its own expiry
+        self._entries[token] = (min(time.time() + self.ttl, expires_at), principal)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, token: str):
+        self._entries.pop(token, None)
+
+    def invalidate_user(self, user_id: int):
+        for token in [token for token, (_, principal) in self._entries.items() if principal.userID == user_id]:
+            del self._entries[token]
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class RevocationList:
+    """
+    Revoked tokens (by jti) and per-user revocation timestamps. Entries are always kept in memory and, when
+    REDIS_URL is set, in Redis so that every replica sees them; Redis errors fall back to the in-memory list.
+    """
+
+    def __init__(self, url: Optional[str] = REDIS_URL):
+        self._redis = aioredis.from_url(url, decode_responses=True, socket_connect_timeout=0.5,
+                                        socket_timeout=0.5) if url else None
+        self._jtis: Dict[str, float] = {}  # jti -> token expiry
+        self._users: Dict[int, Tuple[float, float, str]] = {}  # userID -> (revoked_before, entry expiry, kept jti)
+        self._disabled_until = 0.0
+
+    def _redis_available(self) -> bool:
+        return self._redis is not None and time.time() >= self._disabled_until
+
+    def _redis_failed(self, e: Exception):
+        self._disabled_until = time.time() + REVOCATION_BACKOFF
+        logger.warning(f"Redis revocation list unavailable, using in-memory list for {REVOCATION_BACKOFF}s: {e}")
+
+    def _prune(self):
+        now = time.time()
+        self._jtis = {jti: expiry for jti, expiry in self._jtis.items() if expiry > now}
+        self._users = {uid: entry for uid, entry in self._users.items() if entry[1] > now}
+
+    async def revoke_token(self, jti: str, expires_at: float):
+        ttl = int(expires_at - time.time()) + 1
+        if ttl <= 0:
+            return
+        self._prune()
+        self._jtis[jti] = expires_at
+        if self._redis_available():
+            try:
+                await self._redis.set(JTI_PREFIX + jti, 1, ex=ttl)
+            except Exception as e:
+                self._redis_failed(e)
+
+    async def revoke_user(self, user_id: int, max_token_age: float, keep_jti: Optional[str] = None):
+        """
+        Revoke every token of a user issued up to now, except `keep_jti` (the token that made the change); the
+        entry is kept as long as such tokens can live.
+        """
+        now = time.time()
+        self._prune()
+        self._users[user_id] = (now, now + max_token_age, keep_jti or "")
+        if self._redis_available():
+            try:
+                await self._redis.set(USER_PREFIX + str(user_id), f"{now}:{keep_jti or ''}", ex=int(max_token_age) + 1)
+            except Exception as e:
+                self._redis_failed(e)
+
+    async def is_revoked(self, jti: str, user_id: int, issued_at: float) -> bool:
+        revoked_before, _, kept_jti = self._users.get(user_id, (0.0, 0.0, ""))
+        if jti in self._jtis or (issued_at < revoked_before and jti != kept_jti):
+            return True
+        if not self._redis_available():
+            return False
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.exists(JTI_PREFIX + jti)
+                pipe.get(USER_PREFIX + str(user_id))
+                jti_revoked, user_entry = await pipe.execute()
+        except Exception as e:
+            self._redis_failed(e)
+            return False
+        if jti_revoked:
+            return True
+        if user_entry is None:
+            return False
+        revoked_before, _, kept_jti = user_entry.partition(":")
+        return issued_at < float(revoked_before) and jti != kept_jti
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.close()
+
+
+principal_cache = PrincipalCache()
+revocation_list = RevocationList()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Load benchmark for the user-manager API (pip install locust).
+# Usage:
+#   locust -f benchmarks/locustfile.py --host http://localhost:8005 --headless -u 200 -r 20 -t 2m
+# Each simulated user registers its own account once, then mixes logins, account lookups and (as admin)
+# user listings. Set BENCH_ADMIN_USERNAME / BENCH_ADMIN_PASSWORD to an existing admin, otherwise one is
+# registered on first use.
+
+import os
+import uuid
+
+from locust import HttpUser, between, task
+
+USER_BASE_URL = "/api/user"
+ADMIN_BASE_URL = "/api/admin"
+ADMIN_USERNAME = os.getenv("BENCH_ADMIN_USERNAME", "benchadmin")
+ADMIN_PASSWORD = os.getenv("BENCH_ADMIN_PASSWORD", "benchadmin")
+PASSWORD = "bench-password"
+
+
+class UserManagerUser(HttpUser):
+    wait_time = between(0.1, 0.5)
+
+    def on_start(self):
+        self.username = uuid.uuid4().hex[:10]  # username column is String(10)
+        self.client.post(f"{USER_BASE_URL}/regist", json={
+            "username": self.username, "password": PASSWORD, "phone_number": "13800000000", "authority": 1,
+        }, name="/regist (setup)")
+        self.token = self.login(self.username, PASSWORD)
+        self.client.post(f"{USER_BASE_URL}/regist", json={
+            "username": ADMIN_USERNAME, "password": ADMIN_PASSWORD, "phone_number": "13800000000", "authority": 0,
+        }, name="/regist (setup)")
+        self.admin_token = self.login(ADMIN_USERNAME, ADMIN_PASSWORD, name="/log (setup)")
+
+    def login(self, username, password, name=f"{USER_BASE_URL}/log"):
+        response = self.client.post(f"{USER_BASE_URL}/log", json={"username": username, "password": password},
+                                    name=name)
+        return response.json().get("access_token") if response.ok else None
+
+    @task(3)
+    def log(self):
+        self.login(self.username, PASSWORD)
+
+    @task(5)
+    def account(self):
+        self.client.post(f"{USER_BASE_URL}/account", json={"username": self.username},
+                         headers={"Authorization": f"Bearer {self.token}"})
+
+    @task(1)
+    def admin_users(self):
+        self.client.get(f"{ADMIN_BASE_URL}/users", headers={"Authorization": f"Bearer {self.admin_token}"})
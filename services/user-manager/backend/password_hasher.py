@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Description: bcrypt hashing on a dedicated process pool, so hashing never blocks the event loop or
+# competes with request handling for the GIL.
+
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))  # bcrypt cost factor for new hashes
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "0")) or (os.cpu_count() or 1)  # Hashing processes
+HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", "256"))  # Hash jobs allowed to wait for a worker
+HASH_QUEUE_TIMEOUT = float(os.getenv("HASH_QUEUE_TIMEOUT", "2"))  # Seconds to wait for a queue slot before rejecting
+HASH_BATCH_SIZE = int(os.getenv("HASH_BATCH_SIZE", "4"))  # Passwords per job in batch hashing; small so logins are not stuck behind a batch
+
+_contexts: Dict[int, CryptContext] = {}
+
+
+def _context(rounds: int) -> CryptContext:
+    # One CryptContext per cost factor, cached inside each worker process
+    if rounds not in _contexts:
+        _contexts[rounds] = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+    return _contexts[rounds]
+
+
+def _bcrypt_cost(hashed_password: str) -> Optional[int]:
+    # bcrypt hashes look like $2b$12$<salt+hash>
+    try:
+        return int(hashed_password.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def _hash(password: str, rounds: int) -> str:
+    return _context(rounds).hash(password)
+
+
+def _hash_many(passwords: List[str], rounds: int) -> List[str]:
+    return [_hash(password, rounds) for password in passwords]
+
+
+def _verify(password: str, hashed_password: str, rounds: int) -> Tuple[bool, Optional[str]]:
+    # Returns (matches, new_hash); new_hash is set when the stored hash uses another cost factor
+    context = _context(rounds)
+    try:
+        if not context.verify(password, hashed_password):
+            return False, None
+    except ValueError:  # Not a recognizable hash
+        return False, None
+    if _bcrypt_cost(hashed_password) != rounds:
+        return True, context.hash(password)
+    return True, None
+
+
+class HashingOverloaded(Exception):
+    """Raised when the hashing queue stays full for longer than the queue timeout."""
+
+
+class PasswordHasher:
+    def __init__(self, workers: int = HASH_WORKERS, queue_size: int = HASH_QUEUE_SIZE,
+                 queue_timeout: float = HASH_QUEUE_TIMEOUT, rounds: int = BCRYPT_ROUNDS):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.rounds = rounds
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._pending = 0  # Jobs waiting for or running on a worker
+        self._latencies = deque(maxlen=1000)  # Recent end-to-end latencies (queue wait + hashing) in seconds
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+
+    def start(self):
+        if self._executor is None:
+            # spawn: workers must not inherit the event loop or open DB connections
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            self._slots = asyncio.Semaphore(self.workers + self.queue_size)
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    async def _submit(self, func, *args):
+        self.start()
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise HashingOverloaded("Password hashing queue is full")
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+            self._slots.release()
+            self.completed += 1
+            self._latencies.append(time.perf_counter() - started)
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(_hash, password, self.rounds)
+
+    async def hash_many(self, passwords: List[str], batch_size: int = HASH_BATCH_SIZE) -> List[str]:
+        """Hash many passwords in parallel; at most one job per worker is queued at a time, so logins interleave."""
+        running = asyncio.Semaphore(self.workers)
+
+        async def run(batch: List[str]) -> List[str]:
+            async with running:
+                return await self._submit(_hash_many, batch, self.rounds)
+
+        batches = [passwords[i:i + batch_size] for i in range(0, len(passwords), batch_size)]
+        return [hashed for batch in await asyncio.gather(*(run(batch) for batch in batches)) for hashed in batch]
+
+    async def verify(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Check a password; also returns a new hash when the stored one should be upgraded to the current cost."""
+        matches, new_hash = await self._submit(_verify, password, hashed_password, self.rounds)
+        if new_hash:
+            self.rehashed += 1
+        return matches, new_hash
+
+    def stats(self) -> Dict[str, float]:
+        latencies = sorted(self._latencies)
+
+        def percentile(p: float) -> float:
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2) if latencies else 0.0
+
+        return {
+            "workers": self.workers,
+            "rounds": self.rounds,
+            "queue_depth": max(0, self._pending - self.workers),
+            "in_flight": min(self._pending, self.workers),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+            "latency_p50_ms": percentile(0.5),
+            "latency_p99_ms": percentile(0.99),
+        }
+
+
+password_hasher = PasswordHasher()